@@ -1,5 +1,4 @@
-from robothor_challenge.agent import Agent
-from robothor_challenge.challenge import ALLOWED_ACTIONS
+from robothor_challenge.agent import Agent, ALLOWED_ACTIONS
 import random
 
 
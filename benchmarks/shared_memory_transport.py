@@ -0,0 +1,93 @@
+import argparse
+import multiprocessing as mp
+import time
+
+import numpy as np
+
+from robothor_challenge.shared_memory import FrameRing
+
+
+RESOLUTIONS = [(224, 224), (480, 640), (960, 1280)]
+
+
+def queue_consumer(frame_queue, ack_queue):
+    while True:
+        message = frame_queue.get()
+        if message is None:
+            break
+        rgb, depth = message
+        ack_queue.put(int(rgb[0, 0, 0]))
+
+
+def ring_consumer(frame_ring, frame_queue, ack_queue):
+    while True:
+        descriptor = frame_queue.get()
+        if descriptor is None:
+            break
+        rgb, depth = frame_ring.read(descriptor)
+        value = int(rgb[0, 0, 0])
+        frame_ring.release(descriptor)
+        ack_queue.put(value)
+
+
+def run_queue(rgb, depth, steps):
+    frame_queue = mp.Queue()
+    ack_queue = mp.Queue()
+    p = mp.Process(target=queue_consumer, args=(frame_queue, ack_queue))
+    p.start()
+
+    start = time.perf_counter()
+    for _ in range(steps):
+        frame_queue.put((rgb, depth))
+        ack_queue.get()
+    elapsed = time.perf_counter() - start
+
+    frame_queue.put(None)
+    p.join()
+    return elapsed / steps
+
+
+def run_ring(rgb, depth, steps):
+    height, width = rgb.shape[:2]
+    frame_ring = FrameRing(width, height, depth=depth is not None)
+    frame_queue = mp.Queue()
+    ack_queue = mp.Queue()
+    p = mp.Process(target=ring_consumer, args=(frame_ring, frame_queue, ack_queue))
+    p.start()
+
+    start = time.perf_counter()
+    for _ in range(steps):
+        frame_queue.put(frame_ring.write(rgb, depth))
+        ack_queue.get()
+    elapsed = time.perf_counter() - start
+
+    frame_queue.put(None)
+    p.join()
+    frame_ring.unlink()
+    return elapsed / steps
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare frame transport through mp.Queue pickling and shared memory.")
+    parser.add_argument("--steps", default=500, type=int, help="Frames sent per configuration.")
+    args = parser.parse_args()
+
+    print("{:>11} {:>6} {:>12} {:>12} {:>8}".format("resolution", "depth", "queue (ms)", "shm (ms)", "speedup"))
+    for height, width in RESOLUTIONS:
+        for with_depth in [False, True]:
+            rgb = np.random.randint(0, 255, (height, width, 3), dtype=np.uint8)
+            depth = np.random.rand(height, width).astype(np.float32) if with_depth else None
+
+            queue_time = run_queue(rgb, depth, args.steps)
+            ring_time = run_ring(rgb, depth, args.steps)
+            print("{:>11} {:>6} {:>12.3f} {:>12.3f} {:>7.1f}x".format(
+                "{}x{}".format(height, width),
+                str(with_depth),
+                queue_time * 1000,
+                ring_time * 1000,
+                queue_time / ring_time
+            ))
+
+
+if __name__ == "__main__":
+    main()
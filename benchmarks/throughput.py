@@ -0,0 +1,269 @@
+import os
+import io
+import gzip
+import json
+import time
+import argparse
+import platform
+import importlib
+import itertools
+import subprocess
+import logging
+
+import numpy as np
+
+from robothor_challenge.challenge import RobothorChallenge
+from robothor_challenge.dataset import EpisodeDataset, index_episode_file
+from robothor_challenge.logging_utils import PACKAGE_LOGGER
+from robothor_challenge.metrics import compute_metrics
+from robothor_challenge.observations import ObservationPipeline, ObservationSpec
+from robothor_challenge.trajectory import metrics_to_json, write_npz
+
+
+def int_list(value):
+    return [int(v) for v in value.split(",")]
+
+
+def resolution_list(value):
+    # "HEIGHTxWIDTH,..."
+    return [tuple(int(v) for v in resolution.split("x")) for resolution in value.split(",")]
+
+
+def observation_list(value):
+    # "full" for the rendered frames, or HEIGHTxWIDTH with an optional ":float32" suffix
+    specs = []
+    for observation in value.split(","):
+        if observation == "full":
+            specs.append(None)
+            continue
+        resolution, _, dtype = observation.partition(":")
+        specs.append(ObservationSpec(
+            resolution=tuple(int(v) for v in resolution.split("x")),
+            rgb_dtype=dtype or "uint8"
+        ))
+    return specs
+
+
+def observation_name(spec):
+    if spec is None:
+        return "full"
+    return "{}x{}{}".format(*spec.resolution, "" if spec.rgb_dtype == "uint8" else ":" + spec.rgb_dtype)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def spread(episodes, count):
+    # Evenly spaced episodes, so that every run covers all scenes of the split
+    count = min(count, len(episodes))
+    return [episodes[i * len(episodes) // count] for i in range(count)]
+
+
+def bench_load_split(dataset_dir, split):
+    dataset = EpisodeDataset(dataset_dir, split)
+    _, index_time = timed(lambda: [index_episode_file(path) for path in dataset.paths])
+    dataset, open_time = timed(EpisodeDataset, dataset_dir, split)
+    episodes, decode_time = timed(list, dataset)
+    return episodes, {
+        "episodes": len(episodes),
+        "index_build_s": index_time,
+        "open_indexed_s": open_time,
+        "decode_all_s": decode_time
+    }
+
+
+def bench_inference(challenge, episodes, nprocesses, height, width, split, observation_spec=None):
+    challenge.config["width"] = challenge.controller_kwargs["width"] = width
+    challenge.config["height"] = challenge.controller_kwargs["height"] = height
+    challenge.observation_spec = observation_spec
+
+    metrics, elapsed = timed(challenge.inference, episodes, nprocesses=nprocesses, test=False, split=split)
+    steps = sum(len(em["actions"]) for em in metrics["episodes"].values())
+    return metrics, {
+        "seconds": elapsed,
+        "episodes_per_s": len(episodes) / elapsed,
+        "steps_per_s": steps / elapsed,
+        "steps": steps
+    }
+
+
+def bench_observations(height, width, spec, repeats=200):
+    """
+    Time per step to get the frames of spec from a rendered frame: with ObservationPipeline,
+    and the way an agent would do it itself on the full frame (fancy indexing, then astype).
+    """
+    frame = np.random.randint(0, 256, (height, width, 3), dtype=np.uint8)
+    pipeline = ObservationPipeline(spec, height, width)
+    out_height, out_width = spec.output_shape(height, width)
+    rows = ((np.arange(out_height) + 0.5) * height / out_height).astype(np.int64)
+    cols = ((np.arange(out_width) + 0.5) * width / out_width).astype(np.int64)
+
+    def naive():
+        rgb = frame[rows][:, cols]
+        return rgb.astype(np.float32) / 255 if spec.rgb_dtype == "float32" else rgb
+
+    _, pipeline_time = timed(lambda: [pipeline.observe(frame, None, step) for step in range(repeats)])
+    _, naive_time = timed(lambda: [naive() for _ in range(repeats)])
+    return {
+        "observation": observation_name(spec),
+        "height": height,
+        "width": width,
+        "observation_bytes": spec.observation_nbytes(height, width),
+        "frame_bytes": height * width * 3,
+        "pipeline_us": pipeline_time / repeats * 1e6,
+        "agent_side_us": naive_time / repeats * 1e6
+    }
+
+
+def bench_outputs(episodes, split_metrics, split):
+    episode_metrics = [split_metrics["episodes"][e["id"]] for e in episodes]
+    _, metrics_time = timed(compute_metrics, episodes, episode_metrics)
+
+    challenge_metrics = {split: split_metrics}
+
+    def write_json():
+        buffer = io.BytesIO()
+        with gzip.open(buffer, "wt", encoding="utf-8") as f:
+            json.dump(metrics_to_json(challenge_metrics), f)
+        return buffer.getbuffer().nbytes
+
+    def write_columnar():
+        buffer = io.BytesIO()
+        write_npz(buffer, challenge_metrics)
+        return buffer.getbuffer().nbytes
+
+    json_size, json_time = timed(write_json)
+    npz_size, npz_time = timed(write_columnar)
+    return {
+        "episodes": len(episodes),
+        "compute_metrics_s": metrics_time,
+        "json_gz_bytes": json_size,
+        "json_gz_s": json_time,
+        "npz_bytes": npz_size,
+        "npz_s": npz_time
+    }
+
+
+def compare(results, baseline_path):
+    with open(baseline_path, "r") as f:
+        baseline = json.load(f)
+
+    def key(run):
+        return (run["nprocesses"], run["height"], run["width"], run["depth"], run["episodes"], run.get("observation", "full"))
+
+    baseline_runs = {key(run): run for run in baseline.get("inference", [])}
+    print("\nCompared to {path} (commit {commit}):".format(path=baseline_path, commit=baseline.get("commit")))
+    for run in results["inference"]:
+        if key(run) in baseline_runs:
+            print("  n={} {}x{} depth={} episodes={} observation={}: {:+.1f}% steps/s".format(
+                *key(run),
+                (run["steps_per_s"] / baseline_runs[key(run)]["steps_per_s"] - 1) * 100
+            ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the throughput of the evaluation harness on the mock simulator backend.")
+    parser.add_argument("--cfg", "-c", default="challenge_config.yaml", help="Filepath to challenge config.")
+    parser.add_argument("--dataset-dir", "-d", default="dataset", help="Filepath to challenge dataset.")
+    parser.add_argument("--split", default="val", help="Split to take episodes from.")
+    parser.add_argument("--agent", "-a", default="agents.random_agent", help="Relative module for agent definition.")
+    parser.add_argument("--nprocesses", default=[1, 2, 4], type=int_list, help="Comma separated worker counts.")
+    parser.add_argument("--resolutions", default=[(224, 224), (480, 640)], type=resolution_list,
+                        help="Comma separated HEIGHTxWIDTH frame sizes.")
+    parser.add_argument("--depth", default=[False, True], type=lambda v: [d == "on" for d in v.split(",")],
+                        help="Comma separated depth settings (on,off).")
+    parser.add_argument("--episodes", default=[100, 400], type=int_list, help="Comma separated split sizes.")
+    parser.add_argument("--observations", default=[None], type=observation_list,
+                        help="Comma separated agent observation specs: full, or HEIGHTxWIDTH[:float32].")
+    parser.add_argument("--step-latency", default=0.0, type=float, help="Simulated seconds per controller step.")
+    parser.add_argument("--reset-latency", default=0.0, type=float, help="Simulated seconds per scene load.")
+    parser.add_argument("--output", "-o", default="benchmark_results.json", help="Filepath to write the results to.")
+    parser.add_argument("--compare", default=None, help="Results file of an earlier run to compare steps/s against.")
+    args = parser.parse_args()
+
+    logging.getLogger(PACKAGE_LOGGER).setLevel(logging.WARNING)
+
+    agent = importlib.import_module(args.agent)
+    agent_class, agent_kwargs, _ = agent.build()
+
+    results = {
+        "commit": git_commit(),
+        "time": time.time(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "args": {
+            **{key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+            "observations": [observation_name(spec) for spec in args.observations]
+        },
+        "inference": []
+    }
+
+    all_episodes, results["load_split"] = bench_load_split(args.dataset_dir, args.split)
+    print("load_split({split}): {episodes} episodes, index build {index_build_s:.2f}s, "
+          "open indexed {open_indexed_s:.2f}s, decode all {decode_all_s:.2f}s".format(split=args.split, **results["load_split"]))
+
+    print("{:>4} {:>10} {:>6} {:>8} {:>16} {:>9} {:>11} {:>11}".format(
+        "n", "resolution", "depth", "episodes", "observation", "seconds", "episodes/s", "steps/s"
+    ))
+    last_metrics = None
+    for depth, (height, width), count, observation_spec, nprocesses in itertools.product(
+        args.depth, args.resolutions, args.episodes, args.observations, args.nprocesses
+    ):
+        challenge = RobothorChallenge(args.cfg, agent_class, agent_kwargs, render_depth=depth, backend="mock")
+        challenge.config["mock"]["step_latency"] = args.step_latency
+        challenge.config["mock"]["reset_latency"] = args.reset_latency
+
+        episodes = spread(all_episodes, count)
+        metrics, run = bench_inference(challenge, episodes, nprocesses, height, width, args.split, observation_spec)
+        run = {
+            "nprocesses": nprocesses,
+            "height": height,
+            "width": width,
+            "depth": depth,
+            "episodes": len(episodes),
+            "observation": observation_name(observation_spec),
+            **run
+        }
+        results["inference"].append(run)
+        print("{:>4} {:>10} {:>6} {:>8} {:>16} {:>9.2f} {:>11.1f} {:>11.1f}".format(
+            nprocesses, "{}x{}".format(height, width), str(depth), len(episodes), run["observation"],
+            run["seconds"], run["episodes_per_s"], run["steps_per_s"]
+        ))
+        last_metrics = (episodes, metrics)
+
+    results["observations"] = [
+        bench_observations(height, width, spec)
+        for (height, width), spec in itertools.product(args.resolutions, args.observations)
+        if spec is not None
+    ]
+    for run in results["observations"]:
+        print("observation {observation} from {height}x{width}: {observation_bytes} instead of {frame_bytes} bytes per step, "
+              "{pipeline_us:.0f}us (agent side: {agent_side_us:.0f}us)".format(**run))
+
+    if last_metrics is not None:
+        results["outputs"] = bench_outputs(*last_metrics, args.split)
+        print("outputs ({episodes} episodes): compute_metrics {compute_metrics_s:.3f}s, "
+              "json.gz {json_gz_bytes} bytes in {json_gz_s:.3f}s, npz {npz_bytes} bytes in {npz_s:.3f}s".format(
+                  **results["outputs"]))
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print("Wrote {path}".format(path=args.output))
+
+    if args.compare is not None:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
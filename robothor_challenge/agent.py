@@ -1,8 +1,15 @@
 from abc import ABC, abstractmethod
 
 
+ALLOWED_ACTIONS = ["MoveAhead", "RotateRight", "RotateLeft", "LookUp", "LookDown", "Stop"]
+
+
 class Agent(ABC):
 
+    # Set to an ObservationSpec (robothor_challenge/observations.py) to get downscaled, converted
+    # or fewer frames; None gives the rendered frames as they are
+    observation_spec = None
+
     @abstractmethod
     def reset(self):
         pass
@@ -10,3 +17,16 @@ class Agent(ABC):
     @abstractmethod
     def act(self, observations):
         pass
+
+    def reset_slot(self, slot, episode_id):
+        # With --agent-server and an act_batch override: a new episode starts on slot (an int
+        # identifying one of the episodes in flight), so per-episode state such as recurrent
+        # hidden states should be reset for it
+        pass
+
+    def act_batch(self, observations_list, slots, episode_ids):
+        # Override to run a single forward pass over the observations of many episodes
+        # (used when evaluating with --agent-server); observations_list[i] belongs to the
+        # episode episode_ids[i] running on slots[i]. Without an override, the agent server
+        # keeps an agent per slot and calls reset and act on it instead.
+        return [self.act(observations) for observations in observations_list]
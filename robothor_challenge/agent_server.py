@@ -0,0 +1,296 @@
+import os
+import time
+import queue
+import logging
+import threading
+import multiprocessing as mp
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener, wait
+
+from robothor_challenge.agent import Agent
+from robothor_challenge.logging_utils import configure_worker_logging
+
+logger = logging.getLogger(__name__)
+
+
+class AgentClient:
+    """
+    Stands in for the agent inside an inference worker and forwards every observation to the
+    central agent server process, so the worker only has to step the simulator. When a
+    FrameRing is given, frames go through shared memory and only their slot is sent.
+
+    Every client is one slot of the server: the episodes it runs one after the other are told
+    apart by the episode id given to reset. The client connects on first use, with the
+    generation of its worker, so that the clients of a respawned worker replace those of the
+    killed one.
+    """
+
+    def __init__(self, slot, address, authkey, generation=0, frame_ring=None):
+        self.slot = slot
+        self.address = address
+        self.authkey = authkey
+        self.generation = generation
+        self.frame_ring = frame_ring
+        self.connection = None
+        self.episode_id = None
+        # seconds the last act() spent handing the observation over, before waiting for the action
+        self.transfer_time = 0.0
+
+    def _send(self, request):
+        try:
+            if self.connection is None:
+                self.connection = Client(self.address, authkey=self.authkey)
+                self.connection.send(("hello", self.slot, self.generation))
+            self.connection.send(request)
+        except (EOFError, OSError) as e:
+            raise RuntimeError("Agent server failed") from e
+
+    def reset(self, episode_id=None):
+        self.episode_id = episode_id
+        self._send(("reset", episode_id))
+
+    def act(self, observations):
+        start = time.perf_counter()
+        descriptor = None
+        if self.frame_ring is not None:
+            observations = dict(observations)
+            descriptor = self.frame_ring.write(observations.pop("rgb"), observations.pop("depth"))
+
+        self._send(("act", observations, descriptor, self.episode_id))
+        self.transfer_time = time.perf_counter() - start
+        try:
+            action = self.connection.recv()
+        except (EOFError, OSError) as e:
+            raise RuntimeError("Agent server failed") from e
+        if isinstance(action, Exception):
+            raise RuntimeError("Agent server failed") from action
+        return action
+
+
+class AgentServer:
+    """
+    Runs agent_server in its own process for the agent clients of the inference workers. Every
+    client has a connection of its own, so a worker that is killed only takes its connections
+    down, together with any request it left half sent and any action it did not receive.
+    """
+
+    def __init__(self, agent_class, agent_kwargs, max_batch_size, frame_rings=None, log_queue=None):
+        self.authkey = os.urandom(16)
+        self.listener = Listener(family="AF_UNIX", authkey=self.authkey)
+        self.frame_rings = frame_rings
+        self.control, server_control = mp.Pipe()
+        # time at which the agent started on the batch it is acting on, 0 between batches
+        self.busy_since = mp.Value("d", 0.0, lock=False)
+        self.process = mp.Process(
+            target=agent_server,
+            kwargs=dict(
+                agent_class=agent_class,
+                agent_kwargs=agent_kwargs,
+                listener=self.listener,
+                control=server_control,
+                max_batch_size=max_batch_size,
+                busy_since=self.busy_since,
+                frame_rings=frame_rings,
+                log_queue=log_queue
+            ),
+        )
+        self.process.start()
+
+    def client(self, slot, generation):
+        # The previous client of the slot is gone, so the frames it left in its ring are free
+        frame_ring = None
+        if self.frame_rings:
+            frame_ring = self.frame_rings[slot]
+            frame_ring.reset()
+        return AgentClient(slot, self.listener.address, self.authkey, generation, frame_ring=frame_ring)
+
+    def check(self, step_timeout):
+        """
+        Raises a RuntimeError when the server died or has been acting on one batch for longer
+        than step_timeout, which no worker restart can help.
+        """
+        if not self.process.is_alive():
+            raise RuntimeError("Agent server exited with code {code}".format(code=self.process.exitcode))
+        busy_since = self.busy_since.value
+        if busy_since and time.time() - busy_since > step_timeout:
+            raise RuntimeError("Agent server stuck: act_batch has run for more than {timeout}s".format(
+                timeout=step_timeout
+            ))
+
+    def stop(self, timeout=10):
+        if self.process.is_alive():
+            self.control.send(None)
+            self.process.join(timeout=timeout)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.listener.close()
+
+
+class SlotAgents:
+    """
+    The agent of the server as seen per slot. Agents that override act_batch are built once and
+    get the slots and episode ids of every batch, and reset_slot when an episode starts on a
+    slot. Other agents act on one observation at a time, so the server keeps an agent per slot
+    and resets it whenever an episode starts on its slot.
+    """
+
+    def __init__(self, agent_class, agent_kwargs):
+        self.agent_class = agent_class
+        self.agent_kwargs = agent_kwargs
+        self.batched = getattr(agent_class, "act_batch", None) is not Agent.act_batch
+        self.agents = {}
+        self.agent = None
+        if self.batched:
+            self.agent = agent_class(**agent_kwargs)
+            self.agent.reset()
+
+    def reset(self, slot, episode_id):
+        if self.batched:
+            if hasattr(self.agent, "reset_slot"):
+                self.agent.reset_slot(slot, episode_id)
+            return
+        if slot not in self.agents:
+            self.agents[slot] = self.agent_class(**self.agent_kwargs)
+        self.agents[slot].reset()
+
+    def act_batch(self, observations_list, slots, episode_ids):
+        if not self.batched:
+            return [self.agents[slot].act(observations) for slot, observations in zip(slots, observations_list)]
+        return self.agent.act_batch(observations_list, slots, episode_ids)
+
+
+def agent_server(
+    agent_class,
+    agent_kwargs,
+    listener,
+    control,
+    max_batch_size,
+    busy_since=None,
+    batch_timeout=0.005,
+    frame_rings=None,
+    log_queue=None
+):
+    if log_queue is not None:
+        configure_worker_logging(log_queue)
+    agents = SlotAgents(agent_class, agent_kwargs)
+
+    accepted = queue.Queue()
+
+    def accept():
+        while True:
+            try:
+                connection = listener.accept()
+            except (AuthenticationError, EOFError):
+                continue
+            except OSError:
+                return
+            try:
+                _, slot, generation = connection.recv()
+            except (EOFError, OSError):
+                connection.close()
+                continue
+            accepted.put((slot, generation, connection))
+
+    threading.Thread(target=accept, daemon=True).start()
+
+    # slot -> (generation, connection) of the client that runs it
+    connections = {}
+
+    def add_connections():
+        while True:
+            try:
+                slot, generation, connection = accepted.get_nowait()
+            except queue.Empty:
+                return
+            if slot in connections:
+                current_generation, current = connections[slot]
+                if current_generation > generation:
+                    connection.close()
+                    continue
+                # The worker of the earlier generation was killed
+                current.close()
+            connections[slot] = (generation, connection)
+
+    def drop(slot, connection):
+        connection.close()
+        if slot in connections and connections[slot][1] is connection:
+            del connections[slot]
+
+    def respond(slot, connection, response):
+        try:
+            connection.send(response)
+        except OSError:
+            drop(slot, connection)
+
+    running = True
+    batch_sizes = []
+    while running:
+        # Every agent client has at most one observation in flight, so stop collecting as soon
+        # as all of them have reported or the batching window has passed. Resets are applied as
+        # they come in: a client only resets between the actions of its episodes.
+        batch = []
+        deadline = None
+        while running:
+            add_connections()
+            slots = {connection: slot for slot, (_, connection) in connections.items()}
+            timeout = 0.1 if deadline is None else max(deadline - time.time(), 0)
+            for connection in wait([control, *slots], timeout):
+                if connection is control:
+                    running = False
+                    break
+                slot = slots[connection]
+                try:
+                    request = connection.recv()
+                except (EOFError, OSError):
+                    # The worker is gone, and so is whatever it was sending
+                    drop(slot, connection)
+                    continue
+                if request[0] == "reset":
+                    agents.reset(slot, request[1])
+                else:
+                    batch.append((slot, connection, *request[1:]))
+                    if deadline is None:
+                        deadline = time.time() + batch_timeout
+            if len(batch) >= max_batch_size or (deadline is not None and time.time() >= deadline):
+                break
+        if not batch:
+            continue
+
+        # Frames read from the rings are views on shared memory and are only valid
+        # until the slot is released after act_batch returns.
+        observations_list = []
+        for slot, _, observations, descriptor, _ in batch:
+            if descriptor is not None:
+                observations["rgb"], observations["depth"] = frame_rings[slot].read(descriptor)
+            observations_list.append(observations)
+
+        if busy_since is not None:
+            busy_since.value = time.time()
+        try:
+            actions = agents.act_batch(
+                observations_list,
+                [slot for slot, _, _, _, _ in batch],
+                [episode_id for _, _, _, _, episode_id in batch]
+            )
+        except Exception as e:
+            for slot, connection, _, _, _ in batch:
+                respond(slot, connection, e)
+            raise
+        finally:
+            if busy_since is not None:
+                busy_since.value = 0.0
+            for slot, _, _, descriptor, _ in batch:
+                if descriptor is not None:
+                    frame_rings[slot].release(descriptor)
+
+        for (slot, connection, _, _, _), action in zip(batch, actions):
+            respond(slot, connection, action)
+        batch_sizes.append(len(batch))
+
+    if batch_sizes:
+        logger.info("Agent server finished: {steps} steps in {batches} batches (mean batch size: {mean:.2f})".format(
+            steps=sum(batch_sizes),
+            batches=len(batch_sizes),
+            mean=sum(batch_sizes) / len(batch_sizes)
+        ))
@@ -0,0 +1,128 @@
+import os
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+def available_memory_mb():
+    # MemAvailable from /proc/meminfo, or None where it cannot be read
+    try:
+        with open("/proc/meminfo", "r") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def process_memory_mb(pids):
+    # Resident memory (VmRSS) of the processes that are still running, in MB
+    total = 0.0
+    for pid in pids:
+        if not pid:
+            continue
+        try:
+            with open("/proc/{pid}/status".format(pid=pid), "r") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) / 1024
+                        break
+        except (OSError, ValueError, IndexError):
+            continue
+    return total
+
+
+class Autoscaler:
+    """
+    Picks the number of inference workers while a split runs (runner.py --nprocesses auto)
+    by measuring their throughput. Starting from `initial` workers, the steps/s of all workers
+    together are measured over `interval` seconds once the running workers are all ready, and
+    another worker is added as long as:
+
+    - the last worker added raised the throughput by at least min_gain (as a fraction),
+    - there are fewer than max_workers workers and episodes left for another one,
+    - starting one more worker (taking as much memory as a running one, with its Unity
+      processes) leaves at least min_free_mb available.
+
+    A worker that did not raise the throughput enough is retired again. Once it stops adding
+    workers, the count is settled for the rest of the split.
+    """
+
+    def __init__(self, initial=1, max_workers=1, interval=15.0, min_gain=0.05, min_free_mb=2048):
+        self.max_workers = max(max_workers, 1)
+        self.workers = min(max(initial, 1), self.max_workers)
+        self.interval = interval
+        self.min_gain = min_gain
+        self.min_free_mb = min_free_mb
+
+        # steps/s measured with every worker count
+        self.throughput = {}
+        self.settled = False
+        self.reason = None
+        # (time, steps) at the start of the current measurement
+        self.window_start = None
+
+    @classmethod
+    def from_config(cls, config, episodes, initial=1):
+        return cls(
+            initial=initial,
+            max_workers=min(config["max_workers"] or os.cpu_count() or 1, max(episodes, 1)),
+            interval=config["interval"],
+            min_gain=config["min_gain"],
+            min_free_mb=config["min_free_mb"]
+        )
+
+    def _settle(self, workers, reason):
+        self.workers = workers
+        self.settled = True
+        self.reason = reason
+        return workers
+
+    def update(self, now, steps, ready, remaining, worker_mb=None, available_mb=None):
+        """
+        Takes the steps taken by all workers so far, whether the running workers are all
+        ready, the number of episodes left to hand out, and the memory taken per worker and
+        still available (in MB, None when unknown). Returns the number of workers to run.
+        """
+        if self.settled:
+            return self.workers
+        if not ready:
+            # Measurements start once new workers have their controllers up
+            self.window_start = None
+            return self.workers
+        if self.window_start is None:
+            self.window_start = (now, steps)
+            return self.workers
+        start, start_steps = self.window_start
+        if now - start < self.interval:
+            return self.workers
+
+        rate = (steps - start_steps) / (now - start)
+        self.throughput[self.workers] = rate
+        self.window_start = None
+        logger.info("Autoscaling: {rate:.1f} steps/s with {workers} workers".format(rate=rate, workers=self.workers))
+
+        previous = self.throughput.get(self.workers - 1)
+        if previous is not None and rate < previous * (1 + self.min_gain):
+            return self._settle(self.workers - 1, "throughput stopped improving")
+        if self.workers >= self.max_workers:
+            return self._settle(self.workers, "reached {count} workers".format(count=self.max_workers))
+        if remaining <= 2 * self.workers:
+            return self._settle(self.workers, "too few episodes left to measure")
+        if worker_mb and available_mb is not None and available_mb - worker_mb < self.min_free_mb:
+            return self._settle(self.workers, "memory ({available:.0f}MB available, {worker:.0f}MB per worker)".format(
+                available=available_mb,
+                worker=worker_mb
+            ))
+        self.workers += 1
+        return self.workers
+
+    def summary(self):
+        return {
+            "workers": self.workers,
+            "settled": self.settled,
+            "reason": self.reason,
+            "throughput": {str(workers): rate for workers, rate in sorted(self.throughput.items())}
+        }
@@ -0,0 +1,202 @@
+import math
+import time
+
+import numpy as np
+
+
+BACKENDS = ["ai2thor", "mock"]
+
+
+def make_controller(backend, controller_kwargs):
+    if backend == "ai2thor":
+        import ai2thor.controller
+        return ai2thor.controller.Controller(**controller_kwargs)
+    elif backend == "mock":
+        return MockController(**controller_kwargs)
+    raise ValueError("Unknown controller backend: {backend}".format(backend=backend))
+
+
+def _grid_cell(x, z, grid_size):
+    return (int(round(x / grid_size)), int(round(z / grid_size)))
+
+
+def mock_scenes(episodes, grid_size):
+    """
+    Builds what MockController needs to know about the scenes of the episodes: the grid cells
+    covered by their shortest paths (sampled every grid_size along each segment) and start
+    positions, the floor height, and where the paths to each object type end.
+    """
+    scenes = {}
+    for e in episodes:
+        scene = scenes.setdefault(e["scene"], {"reachable": set(), "targets": {}, "y": e["initial_position"]["y"]})
+        reachable = scene["reachable"]
+        start = e["initial_position"]
+        reachable.add(_grid_cell(start["x"], start["z"], grid_size))
+
+        path = e.get("shortest_path") or []
+        for p, q in zip(path[:-1], path[1:]):
+            steps = max(int(math.ceil(math.hypot(q["x"] - p["x"], q["z"] - p["z"]) / grid_size)), 1)
+            for t in np.linspace(0.0, 1.0, steps + 1):
+                reachable.add(_grid_cell(p["x"] + t * (q["x"] - p["x"]), p["z"] + t * (q["z"] - p["z"]), grid_size))
+        if path:
+            reachable.add(_grid_cell(path[0]["x"], path[0]["z"], grid_size))
+            scene["targets"].setdefault(e["object_type"], set()).add((path[-1]["x"], path[-1]["z"]))
+
+    return {
+        scene: {
+            "reachable": frozenset(data["reachable"]),
+            "targets": {object_type: sorted(ends) for object_type, ends in data["targets"].items()},
+            "y": data["y"]
+        }
+        for scene, data in scenes.items()
+    }
+
+
+class MockEvent:
+
+    def __init__(self, metadata, frame, depth_frame):
+        self.metadata = metadata
+        self.frame = frame
+        self.depth_frame = depth_frame
+
+
+class MockController:
+    """
+    Deterministic stand-in for ai2thor.controller.Controller that needs neither a GPU nor
+    an X server. The agent moves on the grid cells covered by the dataset's shortest paths
+    (see mock_scenes), an object counts as visible within visibilityDistance of the end
+    of a shortest path to its type, frames are synthetic images of the configured size and
+    every reset/step sleeps for the configured latency.
+    """
+
+    def __init__(
+        self,
+        scenes,
+        width=640,
+        height=480,
+        gridSize=0.25,
+        rotateStepDegrees=30,
+        visibilityDistance=1.0,
+        renderDepthImage=False,
+        step_latency=0.0,
+        reset_latency=0.0,
+        **kwargs
+    ):
+        self.scenes = scenes
+        self.width = width
+        self.height = height
+        self.grid_size = gridSize
+        self.rotate_step = rotateStepDegrees
+        self.visibility_distance = visibilityDistance
+        self.render_depth = renderDepthImage
+        self.step_latency = step_latency
+        self.reset_latency = reset_latency
+        self.initialization_parameters = dict(kwargs)
+        self.unity_pid = None
+
+        self.scene = None
+        self.position = {"x": 0.0, "y": 0.0, "z": 0.0}
+        self.rotation = 0.0
+        self.horizon = 0.0
+        self.last_event = self._event(True)
+
+    def reset(self, scene):
+        if scene not in self.scenes:
+            raise ValueError("No mock data for scene: {scene}".format(scene=scene))
+        time.sleep(self.reset_latency)
+        self.scene = scene
+        self.position = {"x": 0.0, "y": self.scenes[scene]["y"], "z": 0.0}
+        self.rotation = 0.0
+        self.horizon = 0.0
+        self.last_event = self._event(True)
+        return self.last_event
+
+    def step(self, action=None, **action_args):
+        if isinstance(action, dict):
+            action_args = dict(action, **action_args)
+            action = action_args.pop("action")
+
+        time.sleep(self.step_latency)
+        render = action_args.pop("renderImage", True)
+        render_depth = self.render_depth and action_args.pop("renderDepthImage", True)
+        action_return = None
+        success = True
+        if action == "MoveAhead":
+            success = self._move(self.grid_size)
+        elif action == "RotateRight":
+            self.rotation = (self.rotation + self.rotate_step) % 360
+        elif action == "RotateLeft":
+            self.rotation = (self.rotation - self.rotate_step) % 360
+        elif action == "LookUp":
+            success = self.horizon > -30
+            self.horizon = max(self.horizon - 30, -30)
+        elif action == "LookDown":
+            success = self.horizon < 60
+            self.horizon = min(self.horizon + 30, 60)
+        elif action == "TeleportFull":
+            self.position = {"x": action_args["x"], "y": action_args["y"], "z": action_args["z"]}
+            rotation = action_args.get("rotation", self.rotation)
+            self.rotation = rotation["y"] if isinstance(rotation, dict) else rotation
+            self.horizon = action_args.get("horizon", self.horizon)
+        elif action == "GetReachablePositions":
+            action_return = [
+                {"x": x * self.grid_size, "y": self.scenes[self.scene]["y"], "z": z * self.grid_size}
+                for x, z in sorted(self.scenes[self.scene]["reachable"])
+            ]
+        elif action != "Stop":
+            success = False
+
+        self.last_event = self._event(success, action_return, render, render_depth)
+        return self.last_event
+
+    def _move(self, distance):
+        angle = math.radians(self.rotation)
+        x = self.position["x"] + distance * math.sin(angle)
+        z = self.position["z"] + distance * math.cos(angle)
+        if _grid_cell(x, z, self.grid_size) not in self.scenes[self.scene]["reachable"]:
+            return False
+        self.position = {"x": x, "y": self.position["y"], "z": z}
+        return True
+
+    def _objects(self):
+        if self.scene is None:
+            return []
+        objects = []
+        for object_type, ends in self.scenes[self.scene]["targets"].items():
+            distance = min(math.hypot(x - self.position["x"], z - self.position["z"]) for x, z in ends)
+            objects.append({
+                "objectId": "{object_type}|{x:+.2f}|{y:+.2f}|{z:+.2f}".format(
+                    object_type=object_type,
+                    x=ends[0][0],
+                    y=self.position["y"],
+                    z=ends[0][1]
+                ),
+                "objectType": object_type,
+                "position": {"x": ends[0][0], "y": self.position["y"], "z": ends[0][1]},
+                "visible": distance <= self.visibility_distance
+            })
+        return objects
+
+    def _event(self, success, action_return=None, render=True, render_depth=None):
+        # Frames only depend on the agent's pose, so episodes replay identically
+        value = int(self.position["x"] * 8 + self.position["z"] * 8 + self.rotation / 30 + self.horizon / 30) % 256
+        frame = None
+        depth_frame = None
+        if render:
+            frame = np.full((self.height, self.width, 3), value, dtype=np.uint8)
+        if render and (self.render_depth if render_depth is None else render_depth):
+            depth_frame = np.full((self.height, self.width), value / 64.0, dtype=np.float32)
+        metadata = {
+            "lastActionSuccess": success,
+            "actionReturn": action_return,
+            "agent": {
+                "position": dict(self.position),
+                "rotation": {"x": 0.0, "y": self.rotation, "z": 0.0},
+                "cameraHorizon": self.horizon
+            },
+            "objects": self._objects()
+        }
+        return MockEvent(metadata, frame, depth_frame)
+
+    def stop(self):
+        pass
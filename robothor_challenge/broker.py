@@ -0,0 +1,330 @@
+import time
+import queue
+import socket
+import logging
+import secrets
+import ipaddress
+import threading
+from collections import OrderedDict, deque
+from multiprocessing.connection import Listener, Client
+
+from robothor_challenge.dataset import EpisodeDataset, episode_column
+
+
+logger = logging.getLogger(__name__)
+
+def parse_address(address):
+    # HOST:PORT, or the path of a unix socket
+    if ":" not in address:
+        return address
+    host, port = address.rsplit(":", 1)
+    return (host, int(port))
+
+
+def generate_authkey():
+    return secrets.token_hex(16).encode()
+
+
+def is_loopback(address):
+    # Unix sockets and loopback hosts can only be connected to from this machine
+    if isinstance(address, str):
+        return True
+    try:
+        return ipaddress.ip_address(socket.gethostbyname(address[0])).is_loopback
+    except (OSError, ValueError):
+        return False
+
+
+def open_listener(address, authkey):
+    """
+    Listener for pickled messages on address. Whoever knows the authkey can run code on this
+    machine, so an empty key is refused for addresses that other machines can reach.
+    """
+    if not authkey and not is_loopback(address):
+        raise ValueError("Refusing to listen on {address} without a secret authkey".format(address=address))
+    return Listener(address, authkey=authkey)
+
+
+class BrokerJob:
+    """
+    The episodes of one split while the broker hands them out. Episodes are grouped into
+    per-scene shards; a worker is given episodes of the scene it has loaded while there are
+    any and otherwise of the shard with the most episodes left. Every episode handed out is
+    leased to the connection that asked for it until its result comes back.
+
+    agent is the module of the agent to evaluate, for workers that load the agent of each job
+    (those of the evaluation daemon); remote workers run the agent they were started with.
+    """
+
+    def __init__(self, job_id, split, test, episodes, termination=None, agent=None):
+        self.job_id = job_id
+        self.split = split
+        self.test = test
+        self.termination = termination
+        self.agent = agent
+        # Workers decode the episodes from their own copy of the dataset, so only ids and scenes are kept
+        self.ids = episode_column(episodes, "id")
+        self.scenes = episode_column(episodes, "scene")
+        self.index_by_id = {ep_id: episode_ind for episode_ind, ep_id in enumerate(self.ids)}
+
+        self.shards = OrderedDict()
+        for episode_ind, scene in enumerate(self.scenes):
+            self.shards.setdefault(scene, deque()).append(episode_ind)
+
+        # Episodes that are neither finished nor given up on; workers are told to wait
+        # rather than to stop while any of them could still be handed out again
+        self.open = set(range(len(self.ids)))
+        self.leases = {}
+        # (kind, ...) events for the coordinator: ("result", ep_id, episode_metrics, worker_info),
+        # ("failure", episode_ind, reason, worker) or ("error", reason, worker) when a worker
+        # cannot run the job at all
+        self.events = queue.Queue()
+
+    def __len__(self):
+        return sum(len(shard) for shard in self.shards.values())
+
+    def take(self, current_scene):
+        shard = self.shards.get(current_scene)
+        if not shard:
+            shard = max(self.shards.values(), key=len, default=None)
+            if not shard:
+                return None
+        return shard.popleft()
+
+    def requeue(self, episode_ind, episode):
+        self.shards[self.scenes[episode_ind]].append(episode_ind)
+
+    def finish(self, ep_id):
+        self.open.discard(self.index_by_id[ep_id])
+
+
+class EpisodeBroker:
+    """
+    Coordinator side of distributed evaluation. Listens on address for inference workers on
+    other machines (see BrokerClient), leases them episodes of the current job and passes
+    their results on to the coordinator. Leases of workers that disconnect, or that hold an
+    episode for longer than lease_timeout, are reported as failures so the episode can be
+    handed out again.
+
+    Messages are pickled, so the authkey must be kept secret and the port must not be
+    reachable from untrusted networks (see open_listener).
+    """
+
+    def __init__(self, address, authkey, lease_timeout=3600):
+        self.listener = open_listener(address, authkey)
+        self.address = self.listener.address
+        self.lease_timeout = lease_timeout
+        self.lock = threading.Lock()
+        self.job = None
+        self.job_count = 0
+        self.closed = False
+        self.connections = 0
+
+        thread = threading.Thread(target=self._accept)
+        thread.daemon = True
+        thread.start()
+
+    def _accept(self):
+        while not self.closed:
+            try:
+                conn = self.listener.accept()
+            except Exception as e:
+                if self.closed:
+                    return
+                logger.warning("Rejected broker connection: {error}".format(error=e))
+                continue
+            thread = threading.Thread(target=self._serve, args=(conn,))
+            thread.daemon = True
+            thread.start()
+
+    def _serve(self, conn):
+        with self.lock:
+            self.connections += 1
+        leases = set()
+        try:
+            while True:
+                request = conn.recv()
+                with self.lock:
+                    reply = self._handle(request, leases)
+                conn.send(reply)
+        except (EOFError, OSError):
+            pass
+        finally:
+            conn.close()
+            with self.lock:
+                self.connections -= 1
+                for job, episode_ind in leases:
+                    # The lease may have expired and been given to another worker in the meantime
+                    lease = job.leases.get(episode_ind)
+                    if lease is not None and lease[2] is leases:
+                        del job.leases[episode_ind]
+                        if job is self.job:
+                            job.events.put(("failure", episode_ind, "worker disconnected", lease[1]))
+
+    def _handle(self, request, leases):
+        kind = request[0]
+        job = self.job
+        if kind == "job":
+            if self.closed:
+                return ("done",)
+            if job is None or not job.open:
+                return ("wait",)
+            return ("job", job.job_id, job.split, job.test, job.termination, job.agent)
+
+        if job is None or request[1] != job.job_id:
+            return ("end",)
+
+        if kind == "lease":
+            _, _, current_scene, worker = request
+            episode_ind = job.take(current_scene)
+            if episode_ind is None:
+                return ("wait",) if job.open else ("end",)
+            job.leases[episode_ind] = (time.time(), worker, leases)
+            leases.add((job, episode_ind))
+            return ("episode", episode_ind, job.ids[episode_ind])
+
+        if kind == "result":
+            _, _, ep_id, episode_metrics, worker_info = request
+            episode_ind = job.index_by_id[ep_id]
+            job.leases.pop(episode_ind, None)
+            leases.discard((job, episode_ind))
+            job.events.put(("result", ep_id, episode_metrics, worker_info))
+            return ("ok",)
+
+        if kind == "error":
+            _, _, reason, worker = request
+            job.events.put(("error", reason, worker))
+            return ("ok",)
+
+        raise ValueError("Unknown broker request: {kind}".format(kind=kind))
+
+    def start_job(self, split, test, episodes, termination=None, agent=None):
+        with self.lock:
+            self.job_count += 1
+            self.job = BrokerJob(self.job_count, split, test, episodes, termination, agent)
+            return self.job
+
+    def requeue(self, episode_ind, episode):
+        with self.lock:
+            self.job.requeue(episode_ind, episode)
+
+    def finish(self, ep_id):
+        with self.lock:
+            self.job.finish(ep_id)
+
+    def expire_leases(self):
+        now = time.time()
+        with self.lock:
+            job = self.job
+            if job is None:
+                return
+            for episode_ind, (start, worker, _) in list(job.leases.items()):
+                if now - start > self.lease_timeout:
+                    del job.leases[episode_ind]
+                    job.events.put((
+                        "failure", episode_ind, "lease timeout ({timeout}s)".format(timeout=self.lease_timeout), worker
+                    ))
+
+    def end_job(self):
+        with self.lock:
+            self.job = None
+
+    def close(self):
+        # Workers asking for a job from now on are told that there is nothing left to do
+        self.closed = True
+
+    def shutdown(self, timeout=10):
+        self.close()
+        deadline = time.time() + timeout
+        while self.connections > 0 and time.time() < deadline:
+            time.sleep(0.1)
+        self.listener.close()
+
+
+class BrokerClient:
+    """
+    Worker side of distributed evaluation. Takes the place of both the SceneScheduler and
+    the result queue of inference_worker: episodes are leased from the broker (by id, and
+    looked up in the worker's own copy of the dataset) and results are sent back to it.
+    Every process opens its own connection when it first talks to the broker, which the
+    threads of the process take turns on.
+    """
+
+    def __init__(self, address, authkey, dataset_dir, node, job_id=None, split=None, poll_interval=1.0):
+        self.address = address
+        self.authkey = authkey
+        self.dataset_dir = dataset_dir
+        self.node = node
+        self.job_id = job_id
+        self.split = split
+        self.poll_interval = poll_interval
+        self._conn = None
+        self._dataset = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["_conn"] = None
+        state["_dataset"] = None
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def request(self, *message):
+        with self._lock:
+            if self._conn is None:
+                self._conn = Client(self.address, authkey=self.authkey)
+            self._conn.send(message)
+            return self._conn.recv()
+
+    def for_job(self, job_id, split):
+        return BrokerClient(self.address, self.authkey, self.dataset_dir, self.node, job_id, split, self.poll_interval)
+
+    def next_job(self):
+        # Returns (job_id, split, test, termination, agent), or None when the coordinator has nothing left
+        while True:
+            try:
+                reply = self.request("job")
+            except (EOFError, OSError):
+                return None
+            if reply[0] == "job":
+                return reply[1:]
+            if reply[0] == "done":
+                return None
+            time.sleep(self.poll_interval)
+
+    def next_episode(self, worker_ind, current_scene=None, hold=None):
+        # The broker keeps a lease on the episode, so hold is only called once it was handed out
+        while True:
+            try:
+                reply = self.request("lease", self.job_id, current_scene, "{node}/{worker_ind}".format(
+                    node=self.node,
+                    worker_ind=worker_ind
+                ))
+            except (EOFError, OSError):
+                return None
+            if reply[0] == "episode":
+                _, episode_ind, ep_id = reply
+                if self._dataset is None:
+                    self._dataset = EpisodeDataset(self.dataset_dir, self.split)
+                if hold is not None:
+                    hold(episode_ind)
+                return episode_ind, self._dataset.episode(self._dataset.positions_by_id[ep_id])
+            if reply[0] == "end":
+                return None
+            time.sleep(self.poll_interval)
+
+    def fail_job(self, worker_ind, reason):
+        # Tells the coordinator that the worker cannot run the job (e.g. its agent does not load)
+        try:
+            self.request("error", self.job_id, reason, "{node}/{worker_ind}".format(node=self.node, worker_ind=worker_ind))
+        except (EOFError, OSError):
+            pass
+
+    def put(self, result):
+        ep_id, episode_metrics, worker_info = result
+        worker_info = dict(worker_info, worker="{node}/{worker}".format(node=self.node, worker=worker_info["worker"]))
+        self.request("result", self.job_id, ep_id, episode_metrics, worker_info)
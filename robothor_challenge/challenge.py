@@ -1,50 +1,180 @@
-from typing import Dict, Any
+from typing import Dict, Any, List
 import os
-import sys
 import glob
-import json
+import pstats
+import cProfile
+import functools
 import yaml
 import time
-import gzip
 import random
 import logging
 
 import multiprocessing as mp
 import queue
 import threading
-import ai2thor.controller
-import ai2thor.util.metrics
+from concurrent.futures import FIRST_COMPLETED, wait
+import numpy as np
 
-from robothor_challenge.startx import startx
+from robothor_challenge.agent import ALLOWED_ACTIONS
+from robothor_challenge.agent_server import AgentClient, AgentServer
+from robothor_challenge.autoscale import Autoscaler, available_memory_mb, process_memory_mb
+from robothor_challenge.backends import make_controller, mock_scenes
+from robothor_challenge.dataset import EpisodeDataset, episode_column, episode_subset
+from robothor_challenge.logging_utils import configure_worker_logging, start_log_listener
+from robothor_challenge.metrics import compute_metrics
+from robothor_challenge.objects import ObjectIndex, select_metadata
+from robothor_challenge.observations import ObservationPipeline, ObservationSpec
+from robothor_challenge.pool import ControllerPool
+from robothor_challenge.result_cache import ResultCache, agent_fingerprint
+from robothor_challenge.scene_cache import SceneCache
+from robothor_challenge.scheduler import SceneScheduler
+from robothor_challenge.shared_memory import FrameRing
+from robothor_challenge.startx import nvidia_devices, startx, wait_for_display
+from robothor_challenge.supervisor import WorkerStatus, WorkerSupervisor, exit_on_sigterm
+from robothor_challenge.termination import TerminationPolicy
+from robothor_challenge.timing import LatencyHistogram, PhaseTimer, format_latency_summary, latency_report
+from robothor_challenge.trajectory import TrajectoryRecorder
 
 
 logger = logging.getLogger(__name__)
-ch = logging.StreamHandler(sys.stdout)
-ch.flush = sys.stdout.flush
-ch.setLevel(logging.INFO)
-formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(name)s - %(message)s")
-ch.setFormatter(formatter)
-logger.addHandler(ch)
 
-ALLOWED_ACTIONS =  ["MoveAhead", "RotateRight", "RotateLeft", "LookUp", "LookDown", "Stop"]
+def get_object_by_type(event_objects, object_type):
+    return ObjectIndex(event_objects, fields=None, object_types=(object_type,)).get(object_type)
 
 
-def get_object_by_type(event_objects, object_type):
-    for obj in event_objects:
-        if obj['objectId'].split("|")[0] == object_type:
-            return obj
-    return None
+def failed_episode_metrics(e, reason, test):
+    recorder = TrajectoryRecorder(0)
+    recorder.reset(e["initial_position"], e["initial_orientation"], e["initial_horizon"])
+    episode_metrics = recorder.episode_metrics()
+    episode_metrics["failed"] = reason
+    if not test:
+        episode_metrics["success"] = False
+    return episode_metrics
+
+
+class SplitResults:
+    """
+    Results of the pending episodes of a split as they come in: journals them (and stores them
+    in the result cache), keeps track of scene loads and latencies per worker, and retries
+    failed episodes up to max_retries times before recording them as failed.
+    """
+
+    def __init__(self, pending, completed, test, max_retries, journal=None, split=None, result_cache=None, termination=None):
+        self.pending = pending
+        self.completed = completed
+        self.test = test
+        self.max_retries = max_retries
+        self.journal = journal
+        self.split = split
+        self.result_cache = result_cache
+        self.termination = termination
+        self.cache_stored = 0
+
+        # Episodes are only decoded when they are run (or given up on), so ids and scenes come from the index
+        self.ids = episode_column(pending, "id")
+        self.remaining_ids = set(self.ids)
+        self.scenes = dict(zip(self.ids, episode_column(pending, "scene")))
+        # When evaluation started and when the first episode came in
+        self.start_time = time.time()
+        self.first_result_time = None
+        self.scene_loads = {}
+        self.retries = {}
+        self.latency_by_worker = {}
+        self.latency_by_scene = {}
+
+    def add(self, ep_id, episode_metrics, worker_info):
+        if ep_id not in self.remaining_ids:
+            return
+        self.remaining_ids.remove(ep_id)
+        if self.first_result_time is None:
+            self.first_result_time = time.time()
+        self.completed[ep_id] = episode_metrics
+        worker = worker_info["worker"]
+        if worker_info["scene_load"]:
+            self.scene_loads[worker] = self.scene_loads.get(worker, 0) + 1
+        if "latency" in worker_info:
+            self.latency_by_worker.setdefault(worker, LatencyHistogram()).merge(worker_info["latency"])
+            self.latency_by_scene.setdefault(self.scenes[ep_id], LatencyHistogram()).merge(worker_info["latency"])
+        if self.journal is not None:
+            self.journal.append(self.split, ep_id, episode_metrics)
+        if self.result_cache is not None and "failed" not in episode_metrics:
+            if self.result_cache.put(self.split, ep_id, episode_metrics, self.termination):
+                self.cache_stored += 1
+
+    def failure(self, episode_ind, reason, requeue):
+        e = self.pending[episode_ind]
+        if e["id"] not in self.remaining_ids:
+            return
+        self.retries[e["id"]] = self.retries.get(e["id"], 0) + 1
+        if self.retries[e["id"]] <= self.max_retries:
+            logger.warning("Retrying episode {id} (attempt {attempt})".format(id=e["id"], attempt=self.retries[e["id"]] + 1))
+            requeue(episode_ind, e)
+        else:
+            logger.error("Giving up on episode {id}: {reason}".format(id=e["id"], reason=reason))
+            self.add(e["id"], failed_episode_metrics(e, reason, self.test), {"worker": None, "scene_load": False})
+
+
+class EpisodeSlot:
+    """
+    One of the episodes in flight in an inference worker: the controller of the pool it runs
+    on (index), its agent, and the state of its current episode as the worker advances it.
+    """
+
+    def __init__(self, index, agent, max_steps, pipeline=None):
+        self.index = index
+        self.agent = agent
+        self.pipeline = pipeline
+        self.recorder = TrajectoryRecorder(max_steps)
+        self.timer = PhaseTimer(max_steps)
+        self.current_scene = None
+
+        self.episode_ind = None
+        self.e = None
+        self.scene_load = False
+        self.object_types = ()
+        self.actions = None
+        self.episode_steps = max_steps
+        self.total_steps = 0
+        self.action = None
+        self.frames_time = 0.0
+        self.metadata = None
+        self.stopped = False
+        self.truncated = None
+
+
+def episode_slots(agents, max_steps, observation_spec, height, width):
+    # A slot per agent, each with its own observation pipeline (their buffers are reused from step to step)
+    slots = []
+    for slot_ind, agent in enumerate(agents):
+        pipeline = None
+        if observation_spec is not None:
+            pipeline = ObservationPipeline(observation_spec, height, width)
+        slots.append(EpisodeSlot(slot_ind, agent, max_steps, pipeline))
+    return slots
 
 
 class RobothorChallenge:
 
-    def __init__(self, cfg_file, agent_class, agent_kwargs, render_depth=False):
+    def __init__(self, cfg_file, agent_class, agent_kwargs, render_depth=False, agent_server=False, log_steps=0, profile_dir=None, backend="ai2thor", start_x=True, cache_dir=None, termination=False, replay_render=False, episodes_in_flight=1, result_cache=False, reuse_scenes=False):
         self.agent_class = agent_class
         self.agent_kwargs = agent_kwargs
+        self.agent_server = agent_server
+        self.log_steps = log_steps
+        self.profile_dir = profile_dir
+        self.backend = backend
+        self.termination = termination
+        self.replay_render = replay_render
+        self.episodes_in_flight = episodes_in_flight
+        self.reuse_scenes = reuse_scenes
+        self.observation_spec = getattr(agent_class, "observation_spec", None)
+        if self.observation_spec is not None and self.observation_spec.depth:
+            render_depth = True
 
         self.config = self.load_config(cfg_file, render_depth)
 
-        self.setup_env()
+        self.x_displays = None
+        if backend == "ai2thor" and start_x:
+            self.x_displays = self.setup_env()
         self.controller_kwargs = {
             "commit_id": self.config["thor_build_id"],
             "width": self.config["width"],
@@ -52,8 +182,33 @@ class RobothorChallenge:
             **self.config["initialize"]
         }
 
+        self.controller = None
         self.current_scene = None
-        self.reachable_positions_per_scene = {}
+        # Worker count chosen by the last split run with nprocesses="auto", where the next one starts
+        self.autoscale_workers = None
+        self.scene_cache = SceneCache(
+            backend, self.config["thor_build_id"], self.config["initialize"]["gridSize"], cache_dir=cache_dir
+        )
+        # Episodes the mock scenes of the move_to_* and scene queries are built from, with the mock backend
+        self.mock_episodes = []
+
+        self.result_cache = None
+        if result_cache:
+            # Everything the outcome of an episode depends on, besides the episode
+            namespace = {
+                "agent": agent_fingerprint(agent_class, agent_kwargs),
+                "backend": backend,
+                "controller": self.controller_kwargs,
+                "max_steps": self.config["max_steps"]
+            }
+            if backend == "mock":
+                namespace["mock"] = self.config["mock"]
+            self.result_cache = ResultCache(
+                namespace,
+                cache_dir=cache_dir,
+                max_bytes=int(self.config["result_cache"]["max_size_mb"] * (1 << 20)),
+                max_entries=self.config["result_cache"]["max_entries"]
+            )
 
     @staticmethod
     def load_config(cfg_file, render_depth):
@@ -62,77 +217,182 @@ class RobothorChallenge:
             config = yaml.safe_load(f.read())
         if render_depth:
             config["initialize"]["renderDepthImage"] = True
+        config.setdefault("supervisor", {})
+        config["supervisor"].setdefault("step_timeout", 120)
+        config["supervisor"].setdefault("episode_timeout", 3600)
+        config["supervisor"].setdefault("max_retries", 2)
+        config["supervisor"].setdefault("max_restarts", 10)
+        config["supervisor"].setdefault("startup_timeout", 600)
+        config["supervisor"].setdefault("terminate_timeout", 10)
+        config["supervisor"].setdefault("lease_timeout", 4200)
+        config.setdefault("mock", {})
+        config["mock"].setdefault("step_latency", 0.0)
+        config["mock"].setdefault("reset_latency", 0.0)
+        config.setdefault("termination", {})
+        config["termination"].setdefault("stuck_steps", 0)
+        config["termination"].setdefault("no_progress_steps", 0)
+        config["termination"].setdefault("no_progress_distance", 0.5)
+        config["termination"].setdefault("step_budgets", {})
+        config.setdefault("result_cache", {})
+        config["result_cache"].setdefault("max_size_mb", 1024)
+        config["result_cache"].setdefault("max_entries", 100000)
+        config.setdefault("autoscale", {})
+        config["autoscale"].setdefault("max_workers", 0)
+        config["autoscale"].setdefault("interval", 15)
+        config["autoscale"].setdefault("min_gain", 0.05)
+        config["autoscale"].setdefault("min_free_mb", 2048)
         return config
 
+    def termination_policy(self, split):
+        # Official runs never end episodes early
+        if not self.termination:
+            return None
+        return TerminationPolicy.from_config(self.config["termination"], split)
+
     @staticmethod
     def setup_env():
+        # Starts an X server with one screen per GPU if there is no display, and returns the
+        # screens for workers to be spread over (None when using an existing display)
         if "DISPLAY" not in os.environ:
-            xthread = threading.Thread(target=startx)
+            devices = nvidia_devices()
+            if not devices:
+                raise Exception("no nvidia cards found")
+            xthread = threading.Thread(target=startx, kwargs=dict(display=0, devices=devices))
             xthread.daemon = True
             xthread.start()
-            import time
-            # XXX change this to use xdpyinfo
-            time.sleep(4)
+            elapsed = wait_for_display(0, xthread=xthread)
+            logger.info("X server ready after {elapsed:.1f}s with {screens} screens".format(
+                elapsed=elapsed,
+                screens=len(devices)
+            ))
+            return ["0.{screen}".format(screen=screen) for screen in range(len(devices))]
+        return None
 
     @staticmethod
     def load_split(dataset_dir, split):
-        split_paths = os.path.join(dataset_dir, split, "episodes", "*.json.gz")
-        split_paths = sorted(glob.glob(split_paths))
-
-        episode_list = []
-        dataset = {}
-
-        for split_path in split_paths:
-            logger.info("Loading: {path}".format(path=split_path))
-
-            with gzip.GzipFile(split_path, "r") as f:
-                episodes = json.loads(f.read().decode("utf-8"))
-
-                # Build a dictionary of the dataset indexed by scene, object_type
-                curr_scene = None
-                curr_object = None
-                points = []
-                scene_points = {}
-                for data_point in episodes:
-                    if curr_object != data_point["object_type"]:
-                        scene_points[curr_object] = points
-                        curr_object = data_point["object_type"]
-                        points = []
-                    if curr_scene != data_point["scene"]:
-                        dataset[curr_scene] = scene_points
-                        curr_scene = data_point["scene"]
-                        scene_points = {}
-
-                    points.append(data_point)
-
-                episode_list += episodes
-
-        return episode_list, dataset
+        dataset = EpisodeDataset(dataset_dir, split)
+        logger.info("Loaded {split} split: {count} episodes in {scenes} scenes".format(
+            split=split,
+            count=len(dataset),
+            scenes=len(dataset.keys())
+        ))
+        return dataset.episodes(), dataset
 
     @staticmethod
     def inference_worker(
         worker_ind: int,
-        in_queue: mp.Queue,
+        scheduler: SceneScheduler,
         out_queue: mp.Queue,
         agent_class: Any,
         agent_kwargs: Dict[str, Any],
+        backend: str,
         controller_kwargs: Dict[str, Any],
         max_steps: int,
-        test: bool
+        test: bool,
+        status: WorkerStatus,
+        log_queue: mp.Queue,
+        log_steps: int = 0,
+        agent_clients: List[AgentClient] = None,
+        profile_path: str = None,
+        termination: TerminationPolicy = None,
+        replay: Dict[str, np.ndarray] = None,
+        render: bool = True,
+        observation_spec: ObservationSpec = None,
+        episodes_in_flight: int = 1,
+        reuse_scenes: bool = False
     ):
-        agent = agent_class(**agent_kwargs)
-        controller = ai2thor.controller.Controller(**controller_kwargs)
+        configure_worker_logging(log_queue)
+        exit_on_sigterm()
+        profiler = None
+        if profile_path is not None:
+            profiler = cProfile.Profile()
+            profiler.enable()
 
-        while True:
-            try:
-                e = in_queue.get(timeout=1)
-            except queue.Empty:
-                break
+        # Every episode in flight has a controller and an agent (or agent client) of its own.
+        # Replayed episodes take their actions (codes into ALLOWED_ACTIONS) from replay[episode id]
+        if agent_clients:
+            agents = agent_clients
+        elif replay is None:
+            agents = [agent_class(**agent_kwargs) for _ in range(episodes_in_flight)]
+        else:
+            agents = [None] * episodes_in_flight
+        # Without an agent to look at them, frames are only rendered when asked for
+        step_args = {} if render else {"renderImage": False}
+        pool = ControllerPool(backend, controller_kwargs, episodes_in_flight)
+        for i, controller in zip(status.slot_range(worker_ind), pool.controllers):
+            status.unity_pid[i] = getattr(controller, "unity_pid", None) or 0
+        status.ready[worker_ind] = 1
+        slots = episode_slots(
+            agents, max_steps, observation_spec if replay is None else None, controller_kwargs["height"], controller_kwargs["width"]
+        )
+        RobothorChallenge.run_episodes(
+            worker_ind, scheduler, out_queue, pool, slots, status, max_steps, test,
+            log_steps=log_steps,
+            agent_server=bool(agent_clients),
+            termination=termination,
+            replay=replay,
+            step_args=step_args,
+            reuse_scenes=reuse_scenes
+        )
 
-            logger.info("Task Start id:{id} scene:{scene} target_object:{object_type} initial_position:{initial_position} rotation:{initial_orientation}".format(**e))
-            controller.initialization_parameters["robothorChallengeEpisodeId"] = e["id"]
-            print(e["scene"])
-            controller.reset(e["scene"])
+        pool.stop()
+        for i in status.slot_range(worker_ind):
+            status.unity_pid[i] = 0
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(profile_path)
+        logger.info("Worker %d Finished.", worker_ind)
+
+    @staticmethod
+    def run_episodes(
+        worker_ind: int,
+        scheduler: SceneScheduler,
+        out_queue: mp.Queue,
+        pool: ControllerPool,
+        slots: List[EpisodeSlot],
+        status: WorkerStatus,
+        max_steps: int,
+        test: bool,
+        log_steps: int = 0,
+        agent_server: bool = False,
+        termination: TerminationPolicy = None,
+        replay: Dict[str, np.ndarray] = None,
+        step_args: Dict[str, Any] = None,
+        reuse_scenes: bool = False
+    ):
+        """
+        Evaluates episodes from the scheduler until it has no more, one in flight on each slot
+        (with the controller of the same index of the pool), and puts their results on out_queue.
+        With reuse_scenes, episodes in the scene a controller has loaded start with a teleport
+        instead of a reset (which sends the episode id to Unity and restores the scene).
+        """
+        step_args = step_args or {}
+        # Future -> (slot, "next", "reset", "act" or "step")
+        in_flight = {}
+
+        def next_episode(slot):
+            # A retiring worker finishes the episodes it holds and then stops
+            if status.retire[worker_ind]:
+                return
+            # The episode is recorded as held as it is taken, so that it is not lost if the worker is killed
+            hold = functools.partial(status.start_episode, worker_ind, slot=slot.index)
+            in_flight[pool.run(scheduler.next_episode, worker_ind, slot.current_scene, hold)] = (slot, "next")
+
+        def start_episode(slot, task):
+            slot.episode_ind, e = task
+            slot.e = e
+            status.start_episode(worker_ind, slot.episode_ind, slot.index)
+            slot.timer.reset()
+
+            logger.info(
+                "Task Start id:%s scene:%s target_object:%s initial_position:%s rotation:%s",
+                e["id"], e["scene"], e["object_type"], e["initial_position"], e["initial_orientation"],
+                extra={"episode": e["id"]}
+            )
+            slot.scene_load = e["scene"] != slot.current_scene
+            if slot.scene_load:
+                logger.info("Worker %d loading scene: %s", worker_ind, e["scene"])
+                slot.current_scene = e["scene"]
             teleport_action = {
                 "action": "TeleportFull",
                 **e["initial_position"],
@@ -140,123 +400,626 @@ class RobothorChallenge:
                 "horizon": e["initial_horizon"],
                 "standing": True
             }
-            controller.step(action=teleport_action)
-
-            total_steps = 0
-            agent.reset()
-
-            episode_metrics = {
-                "trajectory" : [{
-                    **e["initial_position"],
-                    "rotation" : float(e["initial_orientation"]),
-                    "horizon" : e["initial_horizon"]
-                }],
-                "actions_taken" : []
+
+            # Only the target's visibility is needed from the objects, and not even that on test
+            slot.object_types = () if test else (e["object_type"],)
+            slot.total_steps = 0
+            slot.episode_steps = max_steps
+            if replay is not None:
+                slot.actions = replay[e["id"]]
+                slot.episode_steps = min(max_steps, len(slot.actions))
+            elif agent_server:
+                # The agent server keeps per-episode state by slot and episode id
+                slot.agent.reset(e["id"])
+            else:
+                slot.agent.reset()
+            slot.recorder.reset(e["initial_position"], e["initial_orientation"], e["initial_horizon"])
+            slot.stopped = False
+            slot.truncated = None
+
+            future = pool.reset_async(
+                slot.index, e["id"], e["scene"] if slot.scene_load or not reuse_scenes else None, teleport_action,
+                **step_args, **render_args(slot, 0)
+            )
+            in_flight[future] = (slot, "reset")
+
+        def render_args(slot, step):
+            # Depth is only rendered for the observations the slot's observation spec gives it on
+            return slot.pipeline.render_args(step) if slot.pipeline is not None else {}
+
+        def act(agent, observations):
+            start = time.perf_counter()
+            action = agent.act(observations)
+            return action, time.perf_counter() - start
+
+        def take_action(slot, action):
+            if action not in ALLOWED_ACTIONS:
+                raise ValueError("Invalid action: {action}".format(action=action))
+            if log_steps and slot.total_steps % log_steps == 0:
+                logger.info("Agent action: %s", action, extra={"episode": slot.e["id"], "step": slot.total_steps})
+            slot.action = action
+            in_flight[pool.step_async(slot.index, action, **step_args, **render_args(slot, slot.total_steps))] = (slot, "step")
+
+        def advance(slot, event):
+            # Takes the next step of the episode on the slot, or ends it and asks for the next one
+            if slot.total_steps >= slot.episode_steps or slot.stopped or slot.truncated is not None:
+                finish_episode(slot)
+                next_episode(slot)
+                return
+            slot.total_steps += 1
+
+            if replay is not None:
+                take_action(slot, ALLOWED_ACTIONS[slot.actions[slot.total_steps - 1]])
+                return
+
+            start = time.perf_counter()
+            rgb, depth = event.frame, event.depth_frame
+            if slot.pipeline is not None:
+                rgb, depth = slot.pipeline.observe(rgb, depth, slot.total_steps - 1)
+            slot.frames_time = time.perf_counter() - start
+            observations = {
+                "object_goal" : slot.e["object_type"],
+                "depth" : depth,
+                "rgb" : rgb
             }
+            if agent_server:
+                # Waiting for the agent server does not hold up the other episodes
+                status.start_acting(worker_ind, slot.index)
+                in_flight[pool.run(act, slot.agent, observations)] = (slot, "act")
+            else:
+                acted(slot, *act(slot.agent, observations))
 
-            stopped = False
-            while total_steps < max_steps and stopped is False:
-                total_steps += 1
-                event = controller.last_event
-                event.metadata.clear()
-
-                action = agent.act({
-                    "object_goal" : e["object_type"],
-                    "depth" : event.depth_frame,
-                    "rgb" : event.frame
-                })
-
-                if action not in ALLOWED_ACTIONS:
-                    raise ValueError("Invalid action: {action}".format(action=action))
-
-                logger.info("Agent action: {action}".format(action=action))
-                event = controller.step(action=action)
-                episode_metrics["trajectory"].append({
-                    **event.metadata["agent"]["position"],
-                    "rotation": event.metadata["agent"]["rotation"]["y"],
-                    "horizon": event.metadata["agent"]["cameraHorizon"]
-                })
-                episode_metrics["actions_taken"].append({
-                    "action": action,
-                    "success": event.metadata["lastActionSuccess"]
-                })
-                stopped = action == "Stop"
+        def acted(slot, action, act_time):
+            if agent_server:
+                status.acted(worker_ind, slot.index)
+            if agent_server:
+                slot.frames_time += slot.agent.transfer_time
+                act_time -= slot.agent.transfer_time
+            if slot.pipeline is not None or agent_server:
+                slot.timer.add("frames", slot.frames_time)
+            slot.timer.add("act", act_time)
+            take_action(slot, action)
 
-            if not test:
-                target_obj = get_object_by_type(event.metadata["objects"], e["object_type"])
-                assert target_obj is not None
-                target_visible = target_obj["visible"]
-                episode_metrics["success"] = stopped and target_visible
+        def stepped(slot, event):
+            status.step(worker_ind, slot.index)
+            slot.metadata = select_metadata(event.metadata, object_types=slot.object_types)
+            event.metadata.clear()
+            slot.recorder.record(
+                slot.action,
+                slot.metadata["lastActionSuccess"],
+                slot.metadata["agent"]["position"],
+                slot.metadata["agent"]["rotation"]["y"],
+                slot.metadata["agent"]["cameraHorizon"]
+            )
+            slot.stopped = slot.action == "Stop"
+            if termination is not None and not slot.stopped and slot.total_steps < max_steps:
+                slot.truncated = termination.check(slot.recorder)
 
+        def finish_episode(slot):
+            e = slot.e
+            episode_metrics = slot.recorder.episode_metrics()
+            if slot.truncated is not None:
+                episode_metrics["truncated"] = slot.truncated
             if not test:
-                episode_result = {
-                    "path": episode_metrics["trajectory"],
-                    "shortest_path": e["shortest_path"],
-                    "success": episode_metrics["success"]
-                }
-            else:
-                episode_result = None
+                assert e["object_type"] in slot.metadata["objects"]
+                episode_metrics["success"] = slot.stopped and slot.metadata["objects"].visible(e["object_type"])
 
-            out_queue.put((e["id"], episode_metrics, episode_result))
+            # Per-step activity is summarized once per episode instead of logged step by step
+            action_counts = dict(zip(
+                ALLOWED_ACTIONS,
+                np.bincount(episode_metrics["actions"], minlength=len(ALLOWED_ACTIONS)).tolist()
+            ))
+            logger.info(
+                "Task End id:%s steps:%d success:%s actions:%s%s",
+                e["id"], slot.total_steps, episode_metrics.get("success"), action_counts,
+                "" if slot.truncated is None else " truncated:" + slot.truncated,
+                extra={"episode": e["id"], "steps": slot.total_steps, "action_counts": action_counts, "truncated": slot.truncated}
+            )
 
-        controller.stop()
-        print(f"Worker {worker_ind} Finished.")
+            worker_info = {"worker": worker_ind, "scene_load": slot.scene_load, "latency": slot.timer.histogram()}
+            out_queue.put((e["id"], episode_metrics, worker_info))
+            status.finish_episode(worker_ind, slot.index)
 
-    def inference(self, episodes, nprocesses=1, test=False):
-        send_queue = mp.Queue()
-        receive_queue = mp.Queue()
+        for slot in slots:
+            next_episode(slot)
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                slot, kind = in_flight.pop(future)
+                if kind == "next":
+                    task = future.result()
+                    if task is not None:
+                        start_episode(slot, task)
+                elif kind == "reset":
+                    event, timings = future.result()
+                    for phase, duration in timings.items():
+                        slot.timer.add(phase, duration)
+                    slot.metadata = select_metadata(event.metadata, object_types=slot.object_types)
+                    event.metadata.clear()
+                    advance(slot, event)
+                elif kind == "act":
+                    acted(slot, *future.result())
+                else:
+                    event, step_time = future.result()
+                    slot.timer.add("step", step_time)
+                    stepped(slot, event)
+                    advance(slot, event)
 
-        expected_count = len(episodes)
-        for e in episodes:
-            send_queue.put(e)
 
-        processes = []
-        for worker_ind in range(nprocesses):
+    def mock_controller_kwargs(self, episodes):
+        return {
+            **self.controller_kwargs,
+            **self.config["mock"],
+            "scenes": mock_scenes(episodes, self.config["initialize"]["gridSize"])
+        }
+
+    def start_workers(
+        self, nprocesses, scheduler, out_queue, test, split, controller_kwargs, log_queue, termination=None, replay=None,
+        max_workers=None
+    ):
+        """
+        Starts the agent server (with --agent-server) and nprocesses supervised inference workers
+        that take episodes from the scheduler, episodes_in_flight at a time, and put their results
+        on out_queue. Up to max_workers (default nprocesses) workers can be added to the
+        supervisor later. Returns the supervisor, the workers' status, the AgentServer (None
+        without one) and a function that shuts everything down, right away with abort=True.
+        """
+        slots = self.episodes_in_flight
+        max_workers = max(max_workers or nprocesses, nprocesses)
+        server = None
+        frame_rings = []
+        if self.agent_server and replay is None:
+            # One agent client (with its frame ring) per episode in flight
+            height, width = self.config["height"], self.config["width"]
+            depth = self.config["initialize"].get("renderDepthImage", False)
+            rgb_dtype = np.uint8
+            if self.observation_spec is not None:
+                height, width = self.observation_spec.output_shape(height, width)
+                depth = self.observation_spec.depth
+                rgb_dtype = self.observation_spec.rgb_dtype
+            frame_rings = [
+                FrameRing(width, height, depth=depth, rgb_dtype=rgb_dtype)
+                for _ in range(max_workers * slots)
+            ]
+            server = AgentServer(
+                self.agent_class,
+                self.agent_kwargs,
+                max_batch_size=max_workers * slots,
+                frame_rings=frame_rings,
+                log_queue=log_queue
+            )
+
+        status = WorkerStatus(max_workers, slots)
+        spawn_counts = [0] * max_workers
+        generations = [0] * max_workers
+        if self.profile_dir is not None:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            for path in glob.glob(os.path.join(self.profile_dir, "{split}.worker*.prof".format(split=split or "inference"))):
+                os.remove(path)
+
+        def spawn(worker_ind):
+            agent_clients = None
+            if server is not None:
+                generations[worker_ind] += 1
+                agent_clients = [
+                    server.client(client_ind, generations[worker_ind]) for client_ind in status.slot_range(worker_ind)
+                ]
+            worker_controller_kwargs = controller_kwargs
+            if self.x_displays:
+                worker_controller_kwargs = {
+                    **controller_kwargs,
+                    "x_display": self.x_displays[worker_ind % len(self.x_displays)]
+                }
+            profile_path = None
+            if self.profile_dir is not None:
+                profile_path = os.path.join(self.profile_dir, "{split}.worker{worker_ind}.{count}.prof".format(
+                    split=split or "inference",
+                    worker_ind=worker_ind,
+                    count=spawn_counts[worker_ind]
+                ))
+                spawn_counts[worker_ind] += 1
             p = mp.Process(
                 target=self.inference_worker,
                 kwargs=dict(
                     worker_ind=worker_ind,
-                    in_queue=send_queue,
-                    out_queue=receive_queue,
+                    scheduler=scheduler,
+                    out_queue=out_queue,
                     agent_class=self.agent_class,
                     agent_kwargs=self.agent_kwargs,
-                    controller_kwargs=self.controller_kwargs,
+                    backend=self.backend,
+                    controller_kwargs=worker_controller_kwargs,
                     max_steps=self.config["max_steps"],
-                    test=test
+                    test=test,
+                    status=status,
+                    log_queue=log_queue,
+                    log_steps=self.log_steps,
+                    agent_clients=agent_clients,
+                    profile_path=profile_path,
+                    termination=termination,
+                    replay=replay,
+                    render=replay is None or self.replay_render,
+                    observation_spec=self.observation_spec,
+                    episodes_in_flight=slots,
+                    # Official runs reset the scene for every episode
+                    reuse_scenes=self.reuse_scenes and not test
                 ),
             )
             p.start()
-            processes.append(p)
-            time.sleep(0.2)
+            return p
 
-        metrics = {"episodes" : {}}
-        episode_results = []
+        supervisor_config = self.config["supervisor"]
+        supervisor = WorkerSupervisor(
+            spawn,
+            nprocesses,
+            status,
+            step_timeout=supervisor_config["step_timeout"],
+            episode_timeout=supervisor_config["episode_timeout"],
+            max_restarts=supervisor_config["max_restarts"],
+            startup_timeout=supervisor_config["startup_timeout"],
+            terminate_timeout=supervisor_config["terminate_timeout"]
+        )
 
-        while len(metrics["episodes"]) < expected_count:
-            try:
-                ep_id, episode_metrics, episode_result = receive_queue.get(timeout=10)
-                metrics["episodes"][ep_id] = episode_metrics
-                if not test:
-                    episode_results.append(episode_result)
-            except TimeoutError:
-                print("Went 10 seconds without a new episode result.")
-                if all(not p.is_alive() for p in processes):
-                    try:
-                        ep_id, episode_metrics, episode_result = receive_queue.get(timeout=1)
-                        metrics["episodes"][ep_id] = episode_metrics
-                        if not test:
-                            episode_results.append(episode_result)
-                    except TimeoutError:
+        def stop(abort=False):
+            if abort:
+                supervisor.kill_all()
+            supervisor.join()
+            if server is not None:
+                server.stop(timeout=0 if abort else 10)
+            for frame_ring in frame_rings:
+                frame_ring.unlink()
+
+        return supervisor, status, server, stop
+
+    def inference(self, episodes, nprocesses=1, test=False, journal=None, split=None, replay=None):
+        # With replay (episode id -> recorded action codes), the recorded actions are taken instead of the agent's.
+        # With nprocesses="auto", the number of workers is chosen while running by an Autoscaler.
+        termination = self.termination_policy(split) if replay is None else None
+        result_cache = self.result_cache if replay is None else None
+        completed, pending, cache_stats = self.pending_episodes(episodes, journal, split, termination, result_cache)
+        if not pending:
+            # Every episode came from the journal or the result cache, so no workers are started
+            results = SplitResults(
+                pending, completed, test, self.config["supervisor"]["max_retries"], journal, split, result_cache, termination
+            )
+            return self.split_metrics(episodes, results, [], 0, test, journal, split, termination, cache_stats)
+
+        autoscaler = None
+        if nprocesses == "auto":
+            autoscaler = Autoscaler.from_config(self.config["autoscale"], len(pending), initial=self.autoscale_workers or 1)
+            nprocesses = min(autoscaler.workers, len(pending))
+            max_workers = min(autoscaler.max_workers, len(pending))
+        else:
+            nprocesses = min(nprocesses, len(pending))
+            max_workers = nprocesses
+
+        receive_queue = mp.Queue()
+        log_queue, log_listener = start_log_listener()
+
+        # Scenes are assigned to every worker that may be started; those of workers that are
+        # not running are taken by the others once they have drained their own
+        scheduler = SceneScheduler(pending, max_workers)
+
+        controller_kwargs = self.controller_kwargs
+        if self.backend == "mock":
+            controller_kwargs = self.mock_controller_kwargs(pending)
+
+        results = SplitResults(
+            pending, completed, test, self.config["supervisor"]["max_retries"], journal, split, result_cache, termination
+        )
+        results.scene_loads.update({worker_ind: 0 for worker_ind in range(nprocesses)})
+
+        start_time = results.start_time
+        supervisor, status, server, stop_workers = self.start_workers(
+            nprocesses, scheduler, receive_queue, test, split, controller_kwargs, log_queue, termination, replay,
+            max_workers
+        )
+        workers_ready = False
+        last_check = time.time()
+
+        def on_failure(episode_ind, reason):
+            results.failure(episode_ind, reason, scheduler.requeue)
+
+        def autoscale():
+            active = supervisor.active()
+            pids = [supervisor.processes[worker_ind].pid for worker_ind in active]
+            pids += [status.unity_pid[i] for worker_ind in active for i in status.slot_range(worker_ind)]
+            target = autoscaler.update(
+                time.time(),
+                sum(status.steps),
+                all(status.ready[worker_ind] for worker_ind in active),
+                len(scheduler),
+                worker_mb=process_memory_mb(pids) / max(len(active), 1),
+                available_mb=available_memory_mb()
+            )
+            if target > len(active) and len(supervisor.processes) < max_workers:
+                worker_ind = supervisor.add_worker()
+                results.scene_loads.setdefault(worker_ind, 0)
+                logger.info("Autoscaling: starting worker {worker_ind}".format(worker_ind=worker_ind))
+            elif target < len(active):
+                logger.info("Autoscaling: retiring worker {worker_ind} after its current episodes".format(
+                    worker_ind=active[-1]
+                ))
+                supervisor.retire_worker(active[-1])
+
+        try:
+            while results.remaining_ids:
+                if not workers_ready and status.all_ready(nprocesses):
+                    workers_ready = True
+                    logger.info("{count} workers ready after {elapsed:.1f}s".format(
+                        count=nprocesses,
+                        elapsed=time.time() - start_time
+                    ))
+
+                try:
+                    result = receive_queue.get(timeout=1)
+                except queue.Empty:
+                    result = None
+
+                if result is not None:
+                    results.add(*result)
+
+                # Check the workers about once a second, also while results keep coming in from
+                # the others, so that a hung worker is noticed in time
+                if result is None or time.time() - last_check >= 1:
+                    last_check = time.time()
+                    # A dead or stuck agent server ends the split, as restarting workers does not help
+                    if server is not None:
+                        server.check(self.config["supervisor"]["step_timeout"])
+                    supervisor.check(on_failure, work_remaining=len(scheduler) > 0)
+                    if results.remaining_ids and not supervisor.alive() and receive_queue.empty():
                         raise RuntimeError("All processes dead but nothing in queue!")
+                    if autoscaler is not None:
+                        autoscale()
+        except BaseException:
+            stop_workers(abort=True)
+            log_listener.stop()
+            raise
 
-        for p in processes:
-            p.join(timeout=2)
+        stop_workers()
+        log_listener.stop()
 
-        metrics["ep_len"] = sum([len(em["trajectory"]) for em in metrics["episodes"].values()]) / len(metrics["episodes"])
+        if self.profile_dir is not None:
+            self.merge_profiles(split or "inference")
+
+        crashes = [
+            {**crash, "episode": results.ids[crash["episode"]] if crash["episode"] is not None else None}
+            for crash in supervisor.crashes
+        ]
+        metrics = self.split_metrics(
+            episodes, results, crashes, len(scheduler.scenes), test, journal, split, termination, cache_stats
+        )
+        if autoscaler is not None:
+            metrics["autoscale"] = autoscaler.summary()
+            self.autoscale_workers = autoscaler.workers
+            logger.info("Autoscaling chose --nprocesses {workers} for {split} ({reason}; steps/s by workers: {throughput})".format(
+                workers=autoscaler.workers,
+                split=split,
+                reason=autoscaler.reason or "not settled before the split ended",
+                throughput=", ".join(
+                    "{}: {:.1f}".format(workers, rate) for workers, rate in metrics["autoscale"]["throughput"].items()
+                ) or "-"
+            ))
+        return metrics
+
+    def distributed_inference(self, episodes, broker, test=False, journal=None, split=None, agent=None, supervisor=None):
+        """
+        Evaluates the episodes on the remote workers connected to the broker
+        (runner.py --worker) and returns the same metrics as inference. agent is the module
+        of the agent for workers that load it per job, and supervisor the WorkerSupervisor of
+        workers started locally (see robothor_challenge.daemon). Raises a RuntimeError when a
+        worker reports that it cannot run the job or all the supervisor's workers are retired.
+        """
+        termination = self.termination_policy(split)
+        completed, pending, cache_stats = self.pending_episodes(episodes, journal, split, termination, self.result_cache)
+
+        job = broker.start_job(split, test, pending, termination, agent)
+        logger.info("Serving {count} {split} episodes to workers at {host}:{port}".format(
+            count=len(pending),
+            split=split,
+            host=broker.address[0],
+            port=broker.address[1]
+        ))
+
+        results = SplitResults(
+            pending, completed, test, self.config["supervisor"]["max_retries"], journal, split, self.result_cache, termination
+        )
+        crashes = []
+        last_check = time.time()
+        last_report = time.time()
+
+        while results.remaining_ids:
+            try:
+                event = job.events.get(timeout=1)
+            except queue.Empty:
+                event = None
+
+            if event is not None and event[0] == "error":
+                _, reason, worker = event
+                broker.end_job()
+                raise RuntimeError("Worker {worker} cannot run the {split} job: {reason}".format(
+                    worker=worker,
+                    split=split,
+                    reason=reason
+                ))
+            if supervisor is not None and supervisor.exhausted():
+                broker.end_job()
+                raise RuntimeError("No workers left to run the {split} job".format(split=split))
+
+            if event is not None:
+                if event[0] == "result":
+                    _, ep_id, episode_metrics, worker_info = event
+                    results.add(ep_id, episode_metrics, worker_info)
+                else:
+                    _, episode_ind, reason, worker = event
+                    ep_id = results.ids[episode_ind]
+                    logger.warning("Worker {worker} lost episode {id}: {reason}".format(worker=worker, id=ep_id, reason=reason))
+                    crashes.append({"worker": worker, "episode": ep_id, "reason": reason})
+                    results.failure(episode_ind, reason, broker.requeue)
+                if ep_id not in results.remaining_ids:
+                    broker.finish(ep_id)
+
+            if event is None or time.time() - last_check >= 1:
+                last_check = time.time()
+                broker.expire_leases()
+            if time.time() - last_report >= 60:
+                last_report = time.time()
+                logger.info("{done} of {total} {split} episodes done, {connections} workers connected".format(
+                    done=len(pending) - len(results.remaining_ids),
+                    total=len(pending),
+                    split=split,
+                    connections=broker.connections
+                ))
+
+        broker.end_job()
+        return self.split_metrics(episodes, results, crashes, len(job.shards), test, journal, split, termination, cache_stats)
+
+    def run_remote_worker(self, client, nprocesses=1):
+        """
+        Runs nprocesses inference workers on episodes leased from a remote broker, job after
+        job, until the coordinator has no more work.
+        """
+        while True:
+            job = client.next_job()
+            if job is None:
+                break
+            # Remote workers run their own agent rather than the one of the job
+            job_id, split, test, termination, _ = job
+            job_client = client.for_job(job_id, split)
+            logger.info("Starting {count} workers on {split} episodes from {host}:{port}".format(
+                count=nprocesses,
+                split=split,
+                host=client.address[0],
+                port=client.address[1]
+            ))
+
+            controller_kwargs = self.controller_kwargs
+            if self.backend == "mock":
+                controller_kwargs = self.mock_controller_kwargs(list(EpisodeDataset(client.dataset_dir, split)))
+
+            log_queue, log_listener = start_log_listener()
+            supervisor, status, server, stop_workers = self.start_workers(
+                nprocesses, job_client, job_client, test, split, controller_kwargs, log_queue, termination
+            )
+            # Workers exit by themselves once the broker has no more episodes for them; the
+            # broker hands out the episodes of crashed workers again, so there is nothing to retry here
+            try:
+                while True:
+                    finished = any(p.exitcode == 0 for p in supervisor.processes)
+                    if server is not None:
+                        server.check(self.config["supervisor"]["step_timeout"])
+                    supervisor.check(lambda episode_ind, reason: None, work_remaining=not finished)
+                    if not supervisor.alive():
+                        break
+                    time.sleep(1)
+            except BaseException:
+                stop_workers(abort=True)
+                log_listener.stop()
+                raise
+            stop_workers()
+            log_listener.stop()
+
+    def pending_episodes(self, episodes, journal, split, termination=None, result_cache=None):
+        """
+        Splits the episodes into those already done, from the journal (when resuming) or the
+        result cache, and those still to be evaluated. Cache hits are journaled like evaluated
+        episodes. Returns the completed episode metrics by id, the pending episodes and the
+        cache lookup counts (None without a result cache).
+        """
+        completed = self.journal_completed(journal, split)
+        ids = episode_column(episodes, "id")
+        pending_inds = [i for i, ep_id in enumerate(ids) if ep_id not in completed]
+        if len(pending_inds) < len(ids):
+            logger.info("Resuming {split}: {done} of {total} episodes already in journal".format(
+                split=split,
+                done=len(ids) - len(pending_inds),
+                total=len(ids)
+            ))
+
+        cache_stats = None
+        if result_cache is not None:
+            hits = 0
+            for i in pending_inds:
+                episode_metrics = result_cache.get(split, ids[i], termination)
+                if episode_metrics is not None:
+                    hits += 1
+                    completed[ids[i]] = episode_metrics
+                    if journal is not None:
+                        journal.append(split, ids[i], episode_metrics)
+            cache_stats = {"lookups": len(pending_inds), "hits": hits}
+            pending_inds = [i for i in pending_inds if ids[i] not in completed]
+        return completed, episode_subset(episodes, pending_inds), cache_stats
+
+    def journal_completed(self, journal, split):
+        if journal is None:
+            return {}
+        completed = journal.completed(split)
+        if not self.termination:
+            # Episodes ended early by a sweep (--termination) are evaluated again in full
+            completed = {ep_id: em for ep_id, em in completed.items() if "truncated" not in em}
+        return completed
+
+    def split_metrics(self, episodes, results, crashes, nscenes, test, journal=None, split=None, termination=None, cache_stats=None):
+        # The journal is the record of the run, so build the metrics from it when there is one
+        completed = results.completed
+        if journal is not None:
+            completed = self.journal_completed(journal, split)
+
+        ids = episode_column(episodes, "id")
+        metrics = {"episodes" : {ep_id: completed[ep_id] for ep_id in ids}}
+
+        metrics["scene_loads"] = results.scene_loads
+        metrics["retries"] = results.retries
+        metrics["crashes"] = crashes
+        if results.retries or crashes:
+            logger.warning("{crashes} worker failures, {retried} episodes retried, {failed} episodes failed".format(
+                # One entry per episode the worker held, so count failure events by (worker, reason)
+                crashes=len({(crash["worker"], crash["reason"]) for crash in crashes}),
+                retried=len(results.retries),
+                failed=sum(1 for em in metrics["episodes"].values() if "failed" in em)
+            ))
+        logger.info("Scene loads: {total} for {scenes} scenes (per worker: {per_worker})".format(
+            total=sum(results.scene_loads.values()),
+            scenes=nscenes,
+            per_worker=results.scene_loads
+        ))
+
+        if cache_stats is not None:
+            metrics["result_cache"] = {
+                **cache_stats,
+                "hit_rate": cache_stats["hits"] / cache_stats["lookups"] if cache_stats["lookups"] else 0.0,
+                "stored": results.cache_stored,
+                "pruned": self.result_cache.prune()
+            }
+            logger.info("Result cache: {hits} of {lookups} episodes taken from the cache ({hit_rate:.1%}), {stored} stored".format(
+                **metrics["result_cache"]
+            ))
+
+        if results.first_result_time is not None:
+            metrics["time_to_first_episode"] = results.first_result_time - results.start_time
+            logger.info("Time to first episode: {elapsed:.2f}s".format(elapsed=metrics["time_to_first_episode"]))
+
+        metrics["latency"] = latency_report(results.latency_by_worker, results.latency_by_scene)
+        if metrics["latency"]["total"]:
+            logger.info("Latency: {summary}".format(summary=format_latency_summary(metrics["latency"]["total"])))
 
         if not test:
-            metrics["success"] = sum([r["success"] for r in episode_results]) / len(episode_results)
-            metrics["spl"] = ai2thor.util.metrics.compute_spl(episode_results)
+            # SPL and the breakdowns need the shortest paths, so the episodes are decoded once here
+            episodes = list(episodes)
+        metrics.update(compute_metrics(episodes, [completed[ep_id] for ep_id in ids], test=test))
+
+        if termination is not None:
+            # Marks the metrics as those of a sweep, which are not comparable to official ones
+            truncated = [em["truncated"] for em in metrics["episodes"].values() if "truncated" in em]
+            metrics["termination"] = {
+                "policy": termination.to_dict(),
+                "truncated": len(truncated),
+                "reasons": {reason: truncated.count(reason) for reason in sorted(set(truncated))}
+            }
+            logger.warning("Early termination on: {count} of {total} episodes truncated ({reasons})".format(
+                count=len(truncated),
+                total=len(episodes),
+                reasons=metrics["termination"]["reasons"]
+            ))
 
         if not test:
             logger.info("Total Episodes: {episode_count} Success:{success} SPL:{spl} Episode Length:{ep_len}".format(episode_count=len(episodes), success=metrics["success"], spl=metrics["spl"], ep_len=metrics["ep_len"]))
@@ -266,7 +1029,24 @@ class RobothorChallenge:
         return metrics
 
 
+    def merge_profiles(self, split):
+        paths = sorted(glob.glob(os.path.join(self.profile_dir, "{split}.worker*.prof".format(split=split))))
+        if not paths:
+            return
+        merged_path = os.path.join(self.profile_dir, "{split}.prof".format(split=split))
+        pstats.Stats(*paths).dump_stats(merged_path)
+        logger.info("Wrote profiles of {count} workers to {path} (merged: {merged_path})".format(
+            count=len(paths),
+            path=self.profile_dir,
+            merged_path=merged_path
+        ))
+
     def _change_scene(self, scene):
+        if self.controller is None:
+            controller_kwargs = self.controller_kwargs
+            if self.backend == "mock":
+                controller_kwargs = self.mock_controller_kwargs(self.mock_episodes)
+            self.controller = make_controller(self.backend, controller_kwargs)
         if self.current_scene != scene:
             self.current_scene = scene
             self.controller.reset(scene)
@@ -311,21 +1091,31 @@ class RobothorChallenge:
             raise RuntimeError(
                 "Moving to random points is not posible in test scenes"
             )
-        reachable_positions = self._get_reachable_positions_in_scene(scene)
-        p = random.choice(reachable_positions)
+        reachable_positions = self.reachable_positions(scene)
+        x, y, z = reachable_positions.positions[random.randrange(len(reachable_positions))].tolist()
         return self.move_to_point({
-            "initial_position": p,
+            "initial_position": {"x": x, "y": y, "z": z},
             "initial_orientation": y_rotation,
             "initial_horizon": horizon,
             "scene" : scene
         })
 
-    def _get_reachable_positions_in_scene(self, scene):
-        self._change_scene(scene)
-        if scene not in self.reachable_positions_per_scene:
+    def reachable_positions(self, scene):
+        # Only loads the scene in the simulator if its positions are not in the scene cache yet
+        def query():
+            self._change_scene(scene)
             event_reachable = self.controller.step({
                 "action" : "GetReachablePositions",
                 "gridSize" : self.config["initialize"]["gridSize"]
             })
-            self.reachable_positions_per_scene[scene] = event_reachable.metadata["actionReturn"]
-        return self.reachable_positions_per_scene[scene]
+            return event_reachable.metadata["actionReturn"]
+        return self.scene_cache.reachable_positions(scene, compute=query)
+
+    def scene_objects(self, scene):
+        def query():
+            self._change_scene(scene)
+            return self.controller.last_event.metadata["objects"]
+        return self.scene_cache.scene_objects(scene, compute=query)
+
+    def _get_reachable_positions_in_scene(self, scene):
+        return self.reachable_positions(scene).to_dicts()
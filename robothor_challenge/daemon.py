@@ -0,0 +1,323 @@
+import sys
+import time
+import hashlib
+import fnmatch
+import logging
+import importlib
+import threading
+import multiprocessing as mp
+from multiprocessing.connection import Client
+
+from robothor_challenge.broker import BrokerClient, EpisodeBroker, generate_authkey, open_listener
+from robothor_challenge.challenge import RobothorChallenge, episode_slots
+from robothor_challenge.dataset import EpisodeDataset
+from robothor_challenge.logging_utils import configure_worker_logging, start_log_listener
+from robothor_challenge.pool import ControllerPool
+from robothor_challenge.supervisor import WorkerStatus, WorkerSupervisor, exit_on_sigterm
+
+
+logger = logging.getLogger(__name__)
+
+
+class AgentLoader:
+    """
+    Imports agent modules by name and reloads a module when its source file has changed since
+    it was last loaded. Only the agent module itself is reloaded, not the modules it imports.
+    A module that was already imported before the loader first saw it (e.g. inherited from
+    the parent process) is reloaded once, as it may predate the current source.
+    """
+
+    def __init__(self):
+        self.fingerprints = {}
+
+    @staticmethod
+    def fingerprint(module):
+        path = getattr(module, "__file__", None)
+        if path is None:
+            return None
+        with open(path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+
+    def load(self, name):
+        # Returns the module and the fingerprint of the source it was loaded from
+        importlib.invalidate_caches()
+        inherited = name in sys.modules and name not in self.fingerprints
+        module = importlib.import_module(name)
+        fingerprint = self.fingerprint(module)
+        if inherited or (name in self.fingerprints and self.fingerprints[name] != fingerprint):
+            module = importlib.reload(module)
+            if not inherited:
+                logger.info("Reloaded agent module %s", name)
+        self.fingerprints[name] = fingerprint
+        return module, fingerprint
+
+
+def warm_worker(
+    worker_ind,
+    client,
+    status,
+    log_queue,
+    agent,
+    backend,
+    controller_kwargs,
+    max_steps,
+    log_steps=0,
+    episodes_in_flight=1
+):
+    """
+    Inference worker of the evaluation daemon: starts its controllers and builds its agents
+    (those of the agent module `agent`) once, and then runs job after job from the broker
+    client, reloading the agent module when it has changed and building the agent of each job
+    only when it differs from the last one. Controllers are only restarted when the agent
+    needs depth frames that they do not render. A job whose agent cannot be loaded or built is
+    reported to the broker as failed instead of taking the worker down.
+    """
+    configure_worker_logging(log_queue)
+    exit_on_sigterm()
+    loader = AgentLoader()
+    state = {"pool": None, "pool_kwargs": None, "slots": None, "loaded": None}
+
+    def prepare(agent_name):
+        module, fingerprint = loader.load(agent_name)
+        if state["loaded"] == (agent_name, fingerprint):
+            return
+        start = time.perf_counter()
+        agent_class, agent_kwargs, render_depth = module.build()
+        observation_spec = getattr(agent_class, "observation_spec", None)
+
+        # Built before the controllers change, so that an agent that fails leaves them as they are
+        agents = [agent_class(**agent_kwargs) for _ in range(episodes_in_flight)]
+
+        kwargs = dict(controller_kwargs)
+        if render_depth or (observation_spec is not None and observation_spec.depth):
+            kwargs["renderDepthImage"] = True
+        scenes = [None] * episodes_in_flight
+        if kwargs != state["pool_kwargs"]:
+            if state["pool"] is not None:
+                state["pool"].stop()
+            state["pool"] = ControllerPool(backend, kwargs, episodes_in_flight)
+            state["pool_kwargs"] = kwargs
+            for i, controller in zip(status.slot_range(worker_ind), state["pool"].controllers):
+                status.unity_pid[i] = getattr(controller, "unity_pid", None) or 0
+        elif state["slots"] is not None:
+            # The controllers still have the scenes of the last job loaded
+            scenes = [slot.current_scene for slot in state["slots"]]
+
+        state["slots"] = episode_slots(agents, max_steps, observation_spec, kwargs["height"], kwargs["width"])
+        for slot, scene in zip(state["slots"], scenes):
+            slot.current_scene = scene
+        state["loaded"] = (agent_name, fingerprint)
+        logger.info("Worker %d prepared agent %s in %.2fs", worker_ind, agent_name, time.perf_counter() - start)
+
+    try:
+        prepare(agent)
+    except Exception:
+        # The agent is loaded again for the first job, which reports the error
+        logger.exception("Worker %d could not prepare agent %s", worker_ind, agent)
+    status.ready[worker_ind] = 1
+
+    failed_job = None
+    while True:
+        job = client.next_job()
+        if job is None:
+            break
+        job_id, split, test, termination, job_agent = job
+        if job_id == failed_job:
+            # Wait for the coordinator to end the job this worker cannot run
+            time.sleep(client.poll_interval)
+            continue
+        job_client = client.for_job(job_id, split)
+        try:
+            prepare(job_agent or agent)
+        except Exception as e:
+            logger.exception("Worker %d could not prepare agent %s", worker_ind, job_agent or agent)
+            job_client.fail_job(worker_ind, "could not prepare agent {agent}: {error!r}".format(
+                agent=job_agent or agent,
+                error=e
+            ))
+            failed_job = job_id
+            continue
+        RobothorChallenge.run_episodes(
+            worker_ind, job_client, job_client, state["pool"], state["slots"], status, max_steps, test,
+            log_steps=log_steps,
+            termination=termination
+        )
+
+    if state["pool"] is not None:
+        state["pool"].stop()
+    for i in status.slot_range(worker_ind):
+        status.unity_pid[i] = 0
+    logger.info("Worker %d Finished.", worker_ind)
+
+
+class EvaluationDaemon:
+    """
+    Keeps nprocesses inference workers warm between evaluations: their controllers are
+    started and their agents built once, and evaluation jobs (the splits to run, an optional
+    episode filter and the agent module) are then taken from clients connecting to address
+    (see submit_job). Jobs run one at a time; episodes are handed to the workers through a
+    local EpisodeBroker, so failed episodes are retried as in distributed evaluation.
+
+    With the mock backend, the simulated scenes are those of the episodes given to the daemon
+    when it starts.
+    """
+
+    def __init__(
+        self, challenge, address, dataset_dir, agent, authkey, nprocesses=1, mock_episodes=None
+    ):
+        self.challenge = challenge
+        self.dataset_dir = dataset_dir
+        self.agent = agent
+        self.nprocesses = nprocesses
+        self.listener = open_listener(address, authkey)
+        self.address = self.listener.address
+
+        # The broker of the daemon's own workers only accepts them, with a key of its own
+        broker_authkey = generate_authkey()
+        self.broker = EpisodeBroker(
+            ("127.0.0.1", 0), broker_authkey, lease_timeout=challenge.config["supervisor"]["lease_timeout"]
+        )
+        # Workers poll for jobs often, as that is part of the time to the first episode
+        client = BrokerClient(self.broker.address, broker_authkey, dataset_dir, node="daemon", poll_interval=0.05)
+
+        controller_kwargs = challenge.controller_kwargs
+        if challenge.backend == "mock":
+            controller_kwargs = challenge.mock_controller_kwargs(mock_episodes or [])
+
+        self.log_queue, self.log_listener = start_log_listener()
+        status = WorkerStatus(nprocesses, challenge.episodes_in_flight)
+
+        def spawn(worker_ind):
+            worker_controller_kwargs = controller_kwargs
+            if challenge.x_displays:
+                worker_controller_kwargs = {
+                    **controller_kwargs,
+                    "x_display": challenge.x_displays[worker_ind % len(challenge.x_displays)]
+                }
+            p = mp.Process(
+                target=warm_worker,
+                kwargs=dict(
+                    worker_ind=worker_ind,
+                    client=client,
+                    status=status,
+                    log_queue=self.log_queue,
+                    agent=agent,
+                    backend=challenge.backend,
+                    controller_kwargs=worker_controller_kwargs,
+                    max_steps=challenge.config["max_steps"],
+                    log_steps=challenge.log_steps,
+                    episodes_in_flight=challenge.episodes_in_flight
+                ),
+            )
+            p.start()
+            return p
+
+        start_time = time.time()
+        supervisor_config = challenge.config["supervisor"]
+        self.supervisor = WorkerSupervisor(
+            spawn,
+            nprocesses,
+            status,
+            step_timeout=supervisor_config["step_timeout"],
+            episode_timeout=supervisor_config["episode_timeout"],
+            max_restarts=supervisor_config["max_restarts"],
+            startup_timeout=supervisor_config["startup_timeout"],
+            terminate_timeout=supervisor_config["terminate_timeout"]
+        )
+        while not status.all_ready() and self.supervisor.alive():
+            time.sleep(0.1)
+        logger.info("{count} warm workers ready after {elapsed:.1f}s".format(
+            count=nprocesses,
+            elapsed=time.time() - start_time
+        ))
+
+        # The broker reports the episodes of workers that die; the supervisor only restarts them
+        self.watching = True
+        self.watcher = threading.Thread(target=self._watch)
+        self.watcher.daemon = True
+        self.watcher.start()
+
+    def _watch(self):
+        while self.watching:
+            self.supervisor.check(lambda episode_ind, reason: None, work_remaining=True)
+            time.sleep(1)
+
+    def select_episodes(self, split, patterns=None):
+        # Episodes of the split whose ids match any of the fnmatch patterns (all without patterns)
+        dataset = EpisodeDataset(self.dataset_dir, split)
+        if not patterns:
+            return dataset.episodes()
+        ids = [ep_id for ep_id in dataset.ids if any(fnmatch.fnmatchcase(ep_id, p) for p in patterns)]
+        return dataset.episodes(ids=ids)
+
+    def run_job(self, request):
+        """
+        Evaluates request["splits"] (only the episodes matching request["episodes"], if given)
+        with the agent module request["agent"] (the daemon's agent if None). Returns the metrics
+        of every split, the time from the request to the first finished episode and the total time.
+        """
+        start_time = time.time()
+        agent = request.get("agent") or self.agent
+        logger.info("Starting job: {splits} with {agent}".format(splits=", ".join(request["splits"]), agent=agent))
+
+        challenge_metrics = {}
+        time_to_first_episode = None
+        for split in request["splits"]:
+            episodes = self.select_episodes(split, request.get("episodes"))
+            split_start = time.time()
+            challenge_metrics[split] = self.challenge.distributed_inference(
+                episodes, self.broker, test=split == "test", split=split, agent=agent, supervisor=self.supervisor
+            )
+            if time_to_first_episode is None and "time_to_first_episode" in challenge_metrics[split]:
+                time_to_first_episode = split_start - start_time + challenge_metrics[split]["time_to_first_episode"]
+
+        job = {"time_to_first_episode": time_to_first_episode, "elapsed": time.time() - start_time}
+        logger.info("Finished job in {elapsed:.1f}s (time to first episode: {first})".format(
+            elapsed=job["elapsed"],
+            first="{:.2f}s".format(time_to_first_episode) if time_to_first_episode is not None else "-"
+        ))
+        return {"metrics": challenge_metrics, "job": job}
+
+    def serve(self):
+        # Runs jobs until a client asks the daemon to stop
+        logger.info("Evaluation daemon listening on {address}".format(address=self.address))
+        try:
+            while True:
+                conn = self.listener.accept()
+                try:
+                    request = conn.recv()
+                    if request.get("command") == "stop":
+                        conn.send({"stopped": True})
+                        break
+                    try:
+                        reply = self.run_job(request)
+                    except Exception as e:
+                        logger.exception("Job failed")
+                        reply = {"error": repr(e)}
+                    conn.send(reply)
+                except (EOFError, OSError) as e:
+                    logger.warning("Lost daemon client: {error}".format(error=e))
+                finally:
+                    conn.close()
+        finally:
+            self.stop()
+
+    def stop(self):
+        self.watching = False
+        self.watcher.join()
+        # Workers exit once the broker tells them that there are no more jobs
+        self.broker.close()
+        self.supervisor.join(timeout=10)
+        self.broker.shutdown()
+        self.listener.close()
+        self.log_listener.stop()
+
+
+def submit_job(address, request, authkey):
+    # Sends a request (a job, see EvaluationDaemon.run_job, or {"command": "stop"}) and waits for the reply
+    with Client(address, authkey=authkey) as conn:
+        conn.send(request)
+        reply = conn.recv()
+    if "error" in reply:
+        raise RuntimeError("Daemon job failed: {error}".format(error=reply["error"]))
+    return reply
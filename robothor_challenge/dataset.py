@@ -0,0 +1,220 @@
+import os
+import glob
+import gzip
+import json
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+INDEX_FIELDS = ["id", "scene", "object_type", "shortest_path_length", "offset", "length"]
+
+
+def index_episode_file(path):
+    with gzip.GzipFile(path, "r") as f:
+        data = f.read()
+
+    # latin-1 maps every byte to one character, so string positions are byte offsets
+    # into the decompressed file
+    text = data.decode("latin-1")
+    decoder = json.JSONDecoder()
+    columns = {field: [] for field in INDEX_FIELDS}
+
+    pos = text.index("[") + 1
+    while True:
+        while text[pos] in " \t\r\n,":
+            pos += 1
+        if text[pos] == "]":
+            break
+        episode, end = decoder.raw_decode(text, pos)
+        columns["id"].append(episode["id"])
+        columns["scene"].append(episode["scene"])
+        columns["object_type"].append(episode["object_type"])
+        columns["shortest_path_length"].append(episode.get("shortest_path_length"))
+        columns["offset"].append(pos)
+        columns["length"].append(end - pos)
+        pos = end
+
+    return columns
+
+
+class EpisodeSequence:
+    """
+    List-like view on a subset of a split that decodes episodes only when they are accessed.
+    """
+
+    def __init__(self, dataset, positions):
+        self.dataset = dataset
+        self.positions = positions
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return EpisodeSequence(self.dataset, self.positions[i])
+        return self.dataset.episode(self.positions[i])
+
+    def __iter__(self):
+        return self.dataset.iter_episodes(self.positions)
+
+    def column(self, field):
+        # The index field (one of id, scene, object_type and shortest_path_length) of every episode
+        values = self.dataset.columns[field]
+        return [values[p] for p in self.positions]
+
+
+def episode_column(episodes, field):
+    """
+    The field of every episode, read from the dataset index for an EpisodeSequence (without
+    decoding its episodes) and from the episodes themselves for a list.
+    """
+    if isinstance(episodes, EpisodeSequence):
+        return episodes.column(field)
+    return [e[field] for e in episodes]
+
+
+def episode_subset(episodes, inds):
+    # The episodes at inds, still lazy for an EpisodeSequence
+    if isinstance(episodes, EpisodeSequence):
+        return EpisodeSequence(episodes.dataset, [episodes.positions[i] for i in inds])
+    return [episodes[i] for i in inds]
+
+
+class EpisodeDataset:
+    """
+    Episodes of a dataset split, backed by an index of every episode's id, scene, object_type,
+    shortest_path_length and byte range in its (decompressed) file.
+
+    The index is built on first use and stored next to the episode files as
+    `episodes.index.json`, so later runs can filter and group episodes without decoding them.
+    `dataset[scene][object_type]` gives the episodes of an object type in a scene.
+    """
+
+    def __init__(self, dataset_dir, split):
+        self.split = split
+        self.paths = sorted(glob.glob(os.path.join(dataset_dir, split, "episodes", "*.json.gz")))
+        self.index_path = os.path.join(dataset_dir, split, "episodes.index.json")
+
+        self.ids = []
+        self.scenes = []
+        self.object_types = []
+        self.shortest_path_lengths = []
+        self.locations = []
+        self.file_starts = [0]
+        for file_ind, columns in enumerate(self._load_index()):
+            self.ids += columns["id"]
+            self.scenes += columns["scene"]
+            self.object_types += columns["object_type"]
+            self.shortest_path_lengths += columns["shortest_path_length"]
+            self.locations += [(file_ind, offset, length) for offset, length in zip(columns["offset"], columns["length"])]
+            self.file_starts.append(len(self.ids))
+
+        self.columns = {
+            "id": self.ids,
+            "scene": self.scenes,
+            "object_type": self.object_types,
+            "shortest_path_length": self.shortest_path_lengths
+        }
+        self.positions_by_id = {ep_id: position for position, ep_id in enumerate(self.ids)}
+        self.positions_by_scene = {}
+        for position, (scene, object_type) in enumerate(zip(self.scenes, self.object_types)):
+            self.positions_by_scene.setdefault(scene, {}).setdefault(object_type, []).append(position)
+
+        self._cached_file_ind = None
+        self._cached_data = None
+
+    def _load_index(self):
+        index = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r") as f:
+                index = json.load(f)
+            if index.get("version") != INDEX_VERSION:
+                index = {}
+
+        files = index.get("files", {})
+        updated = False
+        file_columns = []
+        for path in self.paths:
+            name = os.path.basename(path)
+            stat = os.stat(path)
+            entry = files.get(name)
+            if entry is None or entry["size"] != stat.st_size or entry["mtime"] != stat.st_mtime:
+                logger.info("Indexing: {path}".format(path=path))
+                entry = {"size": stat.st_size, "mtime": stat.st_mtime, "columns": index_episode_file(path)}
+                files[name] = entry
+                updated = True
+            file_columns.append(entry["columns"])
+
+        if updated:
+            files = {os.path.basename(path): files[os.path.basename(path)] for path in self.paths}
+            try:
+                tmp_path = "{path}.{pid}.tmp".format(path=self.index_path, pid=os.getpid())
+                with open(tmp_path, "w") as f:
+                    json.dump({"version": INDEX_VERSION, "files": files}, f, separators=(",", ":"))
+                os.replace(tmp_path, self.index_path)
+            except OSError as e:
+                logger.warning("Could not write dataset index {path}: {error}".format(path=self.index_path, error=e))
+
+        return file_columns
+
+    def _read(self, file_ind):
+        if self._cached_file_ind != file_ind:
+            with gzip.GzipFile(self.paths[file_ind], "r") as f:
+                self._cached_data = f.read()
+            self._cached_file_ind = file_ind
+        return self._cached_data
+
+    def episode(self, position):
+        file_ind, offset, length = self.locations[position]
+        return json.loads(self._read(file_ind)[offset:offset + length].decode("utf-8"))
+
+    def iter_episodes(self, positions):
+        positions = list(positions)
+        i = 0
+        while i < len(positions):
+            file_ind = self.locations[positions[i]][0]
+            j = i
+            while j < len(positions) and self.locations[positions[j]][0] == file_ind:
+                j += 1
+
+            # Decoding the whole file at once is cheaper than decoding most of its episodes one by one
+            file_start, file_end = self.file_starts[file_ind], self.file_starts[file_ind + 1]
+            if (j - i) * 2 >= file_end - file_start:
+                file_episodes = json.loads(self._read(file_ind).decode("utf-8"))
+                for position in positions[i:j]:
+                    yield file_episodes[position - file_start]
+            else:
+                for position in positions[i:j]:
+                    yield self.episode(position)
+            i = j
+
+    def episodes(self, scene=None, object_type=None, ids=None):
+        if ids is not None:
+            positions = sorted(self.positions_by_id[ep_id] for ep_id in ids if ep_id in self.positions_by_id)
+        else:
+            positions = range(len(self.ids))
+        positions = [
+            p for p in positions
+            if (scene is None or self.scenes[p] == scene) and (object_type is None or self.object_types[p] == object_type)
+        ]
+        return EpisodeSequence(self, positions)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(self.episodes())
+
+    def __contains__(self, scene):
+        return scene in self.positions_by_scene
+
+    def __getitem__(self, scene):
+        return {
+            object_type: EpisodeSequence(self, positions)
+            for object_type, positions in self.positions_by_scene[scene].items()
+        }
+
+    def keys(self):
+        return self.positions_by_scene.keys()
@@ -0,0 +1,70 @@
+import os
+import json
+import logging
+
+from robothor_challenge.trajectory import encode_episode, decode_episode
+
+
+logger = logging.getLogger(__name__)
+
+
+class EpisodeJournal:
+    """
+    Append-only JSON-lines log of finished episodes, one line per episode.
+
+    Lines are flushed and fsynced as soon as an episode completes so that a killed run loses at
+    most the episodes that were in progress. A partially written trailing line is ignored.
+    """
+
+    def __init__(self, path, resume=False):
+        self.path = path
+        if not resume and os.path.exists(path):
+            os.remove(path)
+        self._file = None
+        # Episode metrics by split and id, read once and kept up to date by append
+        self._records = self._load()
+
+    def _load(self):
+        records = {}
+        if not os.path.exists(self.path):
+            return records
+
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line_no, line in enumerate(f):
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning("Skipping unreadable journal line {line_no} in {path}".format(
+                        line_no=line_no + 1,
+                        path=self.path
+                    ))
+                    continue
+                records.setdefault(record["split"], {})[record["id"]] = decode_episode(record["metrics"])
+        return records
+
+    def completed(self, split):
+        return dict(self._records.get(split, {}))
+
+    def append(self, split, ep_id, episode_metrics):
+        if self._file is None:
+            self._file = open(self.path, "a+", encoding="utf-8")
+            # Terminate a line left half-written by a killed run so it stays a single bad line
+            if self._file.tell() > 0:
+                self._file.seek(self._file.tell() - 1)
+                if self._file.read(1) != "\n":
+                    self._file.write("\n")
+        encoded = encode_episode(episode_metrics)
+        self._file.write(json.dumps({
+            "split": split,
+            "id": ep_id,
+            "metrics": encoded
+        }) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        # Kept as it would be read back from the file
+        self._records.setdefault(split, {})[ep_id] = decode_episode(encoded)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
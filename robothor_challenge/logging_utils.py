@@ -0,0 +1,63 @@
+import sys
+import json
+import logging
+import logging.handlers
+import multiprocessing as mp
+
+
+PACKAGE_LOGGER = "robothor_challenge"
+STANDARD_RECORD_ATTRS = set(logging.LogRecord("", 0, "", 0, "", (), None).__dict__) | {"message", "asctime"}
+
+text_formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(name)s - %(message)s")
+
+
+class JsonFormatter(logging.Formatter):
+    # One JSON object per line; fields passed through `extra=` are included as keys
+
+    def format(self, record):
+        entry = {
+            "time": record.created,
+            "level": record.levelname,
+            "name": record.name,
+            "process": record.processName,
+            "message": record.getMessage()
+        }
+        entry.update({key: value for key, value in record.__dict__.items() if key not in STANDARD_RECORD_ATTRS})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+handler = logging.StreamHandler(sys.stdout)
+handler.flush = sys.stdout.flush
+handler.setLevel(logging.INFO)
+handler.setFormatter(text_formatter)
+logging.getLogger(PACKAGE_LOGGER).addHandler(handler)
+
+
+def set_log_format(log_format):
+    if log_format == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(text_formatter)
+
+
+class LogListener(logging.handlers.QueueListener):
+    # Hands records from worker processes to the parent's own logger of the same name,
+    # so they go through the same handlers, formatting and propagation as local records
+
+    def handle(self, record):
+        logging.getLogger(record.name).handle(record)
+
+
+def start_log_listener():
+    log_queue = mp.Queue()
+    listener = LogListener(log_queue)
+    listener.start()
+    return log_queue, listener
+
+
+def configure_worker_logging(log_queue):
+    package_logger = logging.getLogger(PACKAGE_LOGGER)
+    package_logger.handlers = [logging.handlers.QueueHandler(log_queue)]
+    package_logger.propagate = False
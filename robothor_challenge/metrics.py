@@ -0,0 +1,106 @@
+import numpy as np
+
+
+# Edges (in meters) of the shortest_path_length buckets used in the per-distance breakdown
+DISTANCE_BUCKETS = [1.0, 2.0, 3.0, 5.0]
+
+
+def points_from_dicts(path):
+    return np.array([[p["x"], p["y"], p["z"]] for p in path], dtype=np.float64).reshape(-1, 3)
+
+
+def concat_paths(paths):
+    offsets = np.zeros(len(paths) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(path) for path in paths])
+    if len(paths) == 0:
+        return np.zeros((0, 3)), offsets
+    points = np.concatenate([np.asarray(path, dtype=np.float64)[:, :3] for path in paths])
+    return points, offsets
+
+
+def path_lengths(points, offsets):
+    # segment k joins points k and k + 1; segments that join two different episodes are
+    # zeroed, as is the padding entry, so that reduceat over each episode's point range
+    # gives its path length (including 0 for single point paths)
+    if len(offsets) < 2:
+        return np.zeros(0)
+    deltas = np.diff(points, axis=0)
+    segments = np.zeros(len(points))
+    segments[:-1] = np.sqrt(deltas[:, 0] * deltas[:, 0] + deltas[:, 1] * deltas[:, 1] + deltas[:, 2] * deltas[:, 2])
+    segments[offsets[1:] - 1] = 0
+    return np.add.reduceat(segments, offsets[:-1])
+
+
+def spl(lengths, shortest_lengths, success):
+    longest = np.maximum(lengths, shortest_lengths)
+    ratio = np.divide(shortest_lengths, longest, out=np.ones_like(longest), where=longest > 0)
+    return np.asarray(success, dtype=np.float64) * ratio
+
+
+def distance_bucket_labels(buckets=DISTANCE_BUCKETS):
+    edges = ["{:g}".format(edge) for edge in buckets]
+    return ["<" + edges[0]] + ["{}-{}".format(lo, hi) for lo, hi in zip(edges[:-1], edges[1:])] + [">=" + edges[-1]]
+
+
+def breakdown(groups, success, spls, ep_lens):
+    # groups maps a breakdown name (e.g. "scene") to one label per episode
+    result = {}
+    for name, labels in groups.items():
+        keys, codes = np.unique(np.asarray(labels), return_inverse=True)
+        counts = np.bincount(codes, minlength=len(keys))
+        result[name] = {
+            str(key): {
+                "episodes": int(counts[i]),
+                "success": float(s),
+                "spl": float(p),
+                "ep_len": float(l)
+            }
+            for i, (key, s, p, l) in enumerate(zip(
+                keys,
+                np.bincount(codes, weights=success, minlength=len(keys)) / counts,
+                np.bincount(codes, weights=spls, minlength=len(keys)) / counts,
+                np.bincount(codes, weights=ep_lens, minlength=len(keys)) / counts
+            ))
+        }
+    return result
+
+
+def episode_success_spl(episodes, episode_metrics):
+    # Per-episode success, SPL and shortest path length arrays
+    success = np.array([em["success"] for em in episode_metrics], dtype=np.float64)
+    lengths = path_lengths(*concat_paths([em["trajectory"] for em in episode_metrics]))
+    shortest_lengths = path_lengths(*concat_paths([points_from_dicts(e["shortest_path"]) for e in episodes]))
+    return success, spl(lengths, shortest_lengths, success), shortest_lengths
+
+
+def compute_metrics(episodes, episode_metrics, test=False, buckets=DISTANCE_BUCKETS):
+    """
+    Computes the split metrics of the episodes (dataset entries) from their columnar
+    episode_metrics (in the same order), with per-scene, per-object_type and
+    per-shortest_path_length breakdowns when the split is not the test split.
+    """
+    ep_lens = np.array([len(em["trajectory"]) for em in episode_metrics], dtype=np.float64)
+    metrics = {"ep_len": float(ep_lens.mean())}
+    if test:
+        return metrics
+
+    success, spls, shortest_lengths = episode_success_spl(episodes, episode_metrics)
+
+    metrics["success"] = float(success.mean())
+    metrics["spl"] = float(spls.mean())
+
+    distance_labels = np.array(distance_bucket_labels(buckets))[np.digitize(
+        [e.get("shortest_path_length", length) for e, length in zip(episodes, shortest_lengths)],
+        buckets
+    )]
+    metrics["breakdown"] = breakdown(
+        {
+            "scene": [e["scene"] for e in episodes],
+            "object_type": [e["object_type"] for e in episodes],
+            "distance": distance_labels
+        },
+        success,
+        spls,
+        ep_lens
+    )
+    return metrics
@@ -0,0 +1,51 @@
+STEP_FIELDS = ("lastActionSuccess", "agent")
+OBJECT_FIELDS = ("objectId", "visible")
+
+
+def object_type_of(obj):
+    return obj["objectId"].partition("|")[0]
+
+
+class ObjectIndex:
+    """
+    Objects of an event grouped by type (the prefix of their objectId), built in one pass
+    over the metadata. Only the given fields of each object are kept, and only objects of
+    object_types when that is not None.
+    """
+
+    def __init__(self, objects, fields=OBJECT_FIELDS, object_types=None):
+        self.by_type = {}
+        for obj in objects:
+            object_type = object_type_of(obj)
+            if object_types is not None and object_type not in object_types:
+                continue
+            if fields is not None:
+                obj = {field: obj[field] for field in fields if field in obj}
+            self.by_type.setdefault(object_type, []).append(obj)
+
+    def __contains__(self, object_type):
+        return object_type in self.by_type
+
+    def get(self, object_type):
+        # The first object of the type, as the challenge has always judged success by it
+        objects = self.by_type.get(object_type)
+        return objects[0] if objects else None
+
+    def all(self, object_type):
+        return self.by_type.get(object_type, [])
+
+    def visible(self, object_type):
+        obj = self.get(object_type)
+        return obj is not None and obj["visible"]
+
+
+def select_metadata(metadata, fields=STEP_FIELDS, object_fields=OBJECT_FIELDS, object_types=None):
+    """
+    The parts of an event's metadata the harness uses: the given top-level fields and an
+    ObjectIndex of the objects (of object_types, or none at all if that is empty). The
+    result does not share the object list, so the event's metadata can be cleared.
+    """
+    selected = {field: metadata[field] for field in fields}
+    if object_types is None or len(object_types) > 0:
+        selected["objects"] = ObjectIndex(metadata.get("objects", []), object_fields, object_types)
+    return selected
@@ -0,0 +1,99 @@
+import numpy as np
+
+
+class ObservationSpec:
+    """
+    What an agent observes, declared as the `observation_spec` attribute of its class:
+
+    - rgb: whether the agent gets the rgb frame (None otherwise)
+    - depth: whether depth is rendered and given to the agent (as with render_depth in build())
+    - resolution: (height, width) that frames are downscaled to (nearest neighbour), or None
+      for the rendered size
+    - rgb_dtype: "uint8" (0-255) or "float32" (0-1)
+    - depth_every: depth is only rendered and given on every n-th step of an episode (None on
+      the others)
+
+    Frames the agent gets are only valid until its next act() call, as the buffers they are
+    written to are reused; agents that keep frames must copy them.
+    """
+
+    def __init__(self, rgb=True, depth=False, resolution=None, rgb_dtype="uint8", depth_every=1):
+        if rgb_dtype not in ("uint8", "float32"):
+            raise ValueError("Unsupported rgb_dtype: {dtype}".format(dtype=rgb_dtype))
+        self.rgb = rgb
+        self.depth = depth
+        self.resolution = tuple(resolution) if resolution is not None else None
+        self.rgb_dtype = rgb_dtype
+        self.depth_every = depth_every
+
+    def output_shape(self, height, width):
+        return self.resolution or (height, width)
+
+    def observation_nbytes(self, height, width):
+        # Bytes of frame data the agent gets per step (on steps with depth)
+        out_height, out_width = self.output_shape(height, width)
+        nbytes = 0
+        if self.rgb:
+            nbytes += out_height * out_width * 3 * np.dtype(self.rgb_dtype).itemsize
+        if self.depth:
+            nbytes += out_height * out_width * np.dtype(np.float32).itemsize
+        return nbytes
+
+    def __repr__(self):
+        return "ObservationSpec({fields})".format(
+            fields=", ".join("{key}={value!r}".format(key=key, value=value) for key, value in self.__dict__.items())
+        )
+
+
+class ObservationPipeline:
+    """
+    Applies an ObservationSpec to the frames of every step. Downscaling is a single gather
+    with precomputed indices and dtype conversion a single ufunc call, both writing into
+    buffers allocated once; frames that need neither are passed through without a copy.
+    """
+
+    def __init__(self, spec, height, width):
+        self.spec = spec
+        out_height, out_width = spec.output_shape(height, width)
+        self.index = None
+        if (out_height, out_width) != (height, width):
+            # Centers of the output pixels, in input pixels
+            rows = ((np.arange(out_height) + 0.5) * height / out_height).astype(np.int64)
+            cols = ((np.arange(out_width) + 0.5) * width / out_width).astype(np.int64)
+            self.index = (rows[:, None] * width + cols[None, :]).ravel()
+
+        self.rgb = None
+        self.rgb_float = None
+        self.depth = None
+        if spec.rgb and self.index is not None:
+            self.rgb = np.empty((out_height, out_width, 3), dtype=np.uint8)
+        if spec.rgb and spec.rgb_dtype == "float32":
+            self.rgb_float = np.empty((out_height, out_width, 3), dtype=np.float32)
+        if spec.depth and self.index is not None:
+            self.depth = np.empty((out_height, out_width), dtype=np.float32)
+
+    def render_args(self, step):
+        # Step arguments for the action whose frames are the step-th observation of the episode
+        if self.spec.depth and self.spec.depth_every > 1:
+            return {"renderDepthImage": step % self.spec.depth_every == 0}
+        return {}
+
+    def observe(self, frame, depth_frame, step):
+        rgb = None
+        if self.spec.rgb and frame is not None:
+            rgb = frame
+            if self.index is not None:
+                np.take(frame.reshape(-1, 3), self.index, axis=0, out=self.rgb.reshape(-1, 3))
+                rgb = self.rgb
+            if self.rgb_float is not None:
+                np.multiply(rgb, np.float32(1 / 255), out=self.rgb_float)
+                rgb = self.rgb_float
+
+        depth = None
+        if self.spec.depth and depth_frame is not None and step % self.spec.depth_every == 0:
+            depth = depth_frame
+            if self.index is not None:
+                np.take(depth_frame.reshape(-1), self.index, out=self.depth.reshape(-1))
+                depth = self.depth
+
+        return rgb, depth
@@ -0,0 +1,69 @@
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from robothor_challenge.backends import make_controller
+
+
+class ControllerPool:
+    """
+    The controllers of an inference worker, one per episode in flight, with a non-blocking
+    step API: step_async and reset_async return a Future right away and run on a thread of the
+    pool, so that the worker can run the agent for one episode while the controllers of the
+    others are stepped (ai2thor spends a step waiting on Unity, which releases the GIL).
+
+    With a single controller everything runs inline and the returned Futures are already done.
+    """
+
+    def __init__(self, backend, controller_kwargs, size=1):
+        self.size = size
+        self.executor = ThreadPoolExecutor(max_workers=size) if size > 1 else None
+        # Controllers of a pool start their simulators at the same time
+        self.controllers = [
+            future.result()
+            for future in [self.run(make_controller, backend, controller_kwargs) for _ in range(size)]
+        ]
+
+    def __len__(self):
+        return self.size
+
+    def run(self, fn, *args, **kwargs):
+        # Future of fn(*args, **kwargs), run on a thread of the pool
+        if self.executor is not None:
+            return self.executor.submit(fn, *args, **kwargs)
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        return future
+
+    def step_async(self, slot, action, **action_args):
+        # Future of (event, seconds the step took)
+        def step(controller):
+            start = time.perf_counter()
+            event = controller.step(action=action, **action_args)
+            return event, time.perf_counter() - start
+        return self.run(step, self.controllers[slot])
+
+    def reset_async(self, slot, episode_id, scene, teleport_action, **action_args):
+        # Future of (event, {"reset": seconds, "teleport": seconds}); the scene is only reset when given
+        def reset(controller):
+            # The id is sent to Unity with the next reset only: without a scene, the episode just
+            # teleports, without the id and without restoring object state
+            controller.initialization_parameters["robothorChallengeEpisodeId"] = episode_id
+            timings = {}
+            if scene is not None:
+                start = time.perf_counter()
+                controller.reset(scene)
+                timings["reset"] = time.perf_counter() - start
+            start = time.perf_counter()
+            event = controller.step(action=teleport_action, **action_args)
+            timings["teleport"] = time.perf_counter() - start
+            return event, timings
+        return self.run(reset, self.controllers[slot])
+
+    def stop(self):
+        for controller in self.controllers:
+            controller.stop()
+        if self.executor is not None:
+            self.executor.shutdown()
@@ -0,0 +1,77 @@
+import gzip
+import json
+
+import numpy as np
+
+from robothor_challenge.trajectory import episode_from_json, read_npz
+
+
+def load_metrics(path):
+    # Challenge metrics written by runner.py (.json.gz or .npz), with episodes as arrays
+    if path.endswith(".npz"):
+        return read_npz(path)
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        challenge_metrics = json.load(f)
+    return {
+        split: {
+            **split_metrics,
+            "episodes": {ep_id: episode_from_json(em) for ep_id, em in split_metrics["episodes"].items()}
+        }
+        for split, split_metrics in challenge_metrics.items()
+    }
+
+
+def replay_actions(split_metrics):
+    # Recorded action codes of every episode of the split that was evaluated (not failed)
+    return {
+        ep_id: em["actions"]
+        for ep_id, em in split_metrics["episodes"].items()
+        if "failed" not in em
+    }
+
+
+def compare_episode(recorded, replayed, atol=1e-3):
+    """
+    Fields in which a replayed episode differs from the recorded one: "actions" (the replay
+    took different or fewer actions), "action_success", "trajectory" (any pose off by more
+    than atol) and "success".
+    """
+    differences = []
+    if not np.array_equal(recorded["actions"], replayed["actions"]):
+        differences.append("actions")
+    if not np.array_equal(recorded["action_success"], replayed["action_success"]):
+        differences.append("action_success")
+    if recorded["trajectory"].shape != replayed["trajectory"].shape or not np.allclose(
+        recorded["trajectory"], replayed["trajectory"], rtol=0, atol=atol
+    ):
+        differences.append("trajectory")
+    if "success" in recorded and bool(recorded["success"]) != bool(replayed.get("success")):
+        differences.append("success")
+    return differences
+
+
+def verify_replay(recorded_metrics, replayed_metrics, atol=1e-3):
+    """
+    Compares the replayed episodes of a split with the recorded ones. Returns the number of
+    episodes compared and, per field, how many of them differ, along with the differing
+    fields of every mismatched episode and the recorded and replayed success and SPL.
+    """
+    mismatches = {}
+    for ep_id, replayed in replayed_metrics["episodes"].items():
+        differences = compare_episode(recorded_metrics["episodes"][ep_id], replayed, atol)
+        if differences:
+            mismatches[ep_id] = differences
+
+    report = {
+        "episodes": len(replayed_metrics["episodes"]),
+        "mismatched": len(mismatches),
+        "by_field": {
+            field: sum(field in differences for differences in mismatches.values())
+            for field in ("actions", "action_success", "trajectory", "success")
+        },
+        "mismatches": mismatches
+    }
+    for key in ("success", "spl"):
+        if key in recorded_metrics and key in replayed_metrics:
+            report[key] = {"recorded": recorded_metrics[key], "replayed": replayed_metrics[key]}
+    return report
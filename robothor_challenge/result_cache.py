@@ -0,0 +1,113 @@
+import os
+import sys
+import json
+import hashlib
+import logging
+
+from robothor_challenge.scene_cache import DEFAULT_CACHE_DIR
+from robothor_challenge.trajectory import decode_episode, encode_episode
+
+
+logger = logging.getLogger(__name__)
+
+
+def agent_fingerprint(agent_class, agent_kwargs):
+    """
+    Hash of the source files of the modules that define the agent class and its base classes,
+    and of the agent's kwargs (values that are not JSON are hashed by their repr).
+    """
+    digest = hashlib.sha256()
+    paths = []
+    for cls in agent_class.__mro__:
+        path = getattr(sys.modules.get(cls.__module__), "__file__", None)
+        if path is not None and path not in paths:
+            paths.append(path)
+    for path in paths:
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    digest.update(json.dumps(agent_kwargs, sort_keys=True, default=repr).encode())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    On-disk cache of the metrics of evaluated episodes, for deterministic agents. Entries are
+    keyed by a hash of the namespace (everything an episode's outcome depends on besides the
+    episode: the agent fingerprint, thor_build_id, the initialize block, ...), the split, the
+    episode id and the termination policy, and stored as JSON under
+    cache_dir/results/<key[:2]>/<key>.json, written atomically like the SceneCache.
+
+    Hits refresh the modification time of their file, and prune() removes the least recently
+    used entries until at most max_entries entries of at most max_bytes in total are left.
+    """
+
+    def __init__(self, namespace, cache_dir=None, max_bytes=1 << 30, max_entries=100000):
+        self.namespace = hashlib.sha256(json.dumps(namespace, sort_keys=True).encode()).hexdigest()
+        self.cache_dir = os.path.join(cache_dir or os.environ.get("ROBOTHOR_CACHE_DIR", DEFAULT_CACHE_DIR), "results")
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+
+    def key(self, split, ep_id, termination=None):
+        return hashlib.sha256(json.dumps([
+            self.namespace, split, ep_id, termination.to_dict() if termination is not None else None
+        ]).encode()).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".json")
+
+    def get(self, split, ep_id, termination=None):
+        path = self.path(self.key(split, ep_id, termination))
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                episode_metrics = decode_episode(json.load(f))
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning("Ignoring unreadable cache file {path}: {error}".format(path=path, error=e))
+            return None
+        return episode_metrics
+
+    def put(self, split, ep_id, episode_metrics, termination=None):
+        # Returns whether the entry was written
+        path = self.path(self.key(split, ep_id, termination))
+        tmp_path = "{path}.{pid}.tmp".format(path=path, pid=os.getpid())
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(encode_episode(episode_metrics), f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning("Could not write cache file {path}: {error}".format(path=path, error=e))
+            return False
+        return True
+
+    def prune(self):
+        # Returns the number of entries removed
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(".json"):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+
+        # Most recently used first
+        entries.sort(reverse=True)
+        total_bytes = 0
+        removed = 0
+        for count, (_, size, path) in enumerate(entries):
+            total_bytes += size
+            if count < self.max_entries and total_bytes <= self.max_bytes:
+                continue
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+        if removed:
+            logger.info("Removed {removed} of {count} entries from the result cache".format(removed=removed, count=len(entries)))
+        return removed
@@ -0,0 +1,125 @@
+import math
+import logging
+
+import numpy as np
+
+from robothor_challenge.metrics import DISTANCE_BUCKETS, distance_bucket_labels, episode_success_spl
+
+
+logger = logging.getLogger(__name__)
+
+Z_95 = 1.959963984540054
+
+
+def strata(dataset, buckets=DISTANCE_BUCKETS):
+    # (scene, object_type, shortest_path_length bucket) of every episode, from the dataset index
+    labels = np.array(distance_bucket_labels(buckets) + ["unknown"])
+    lengths = np.array([np.nan if l is None else l for l in dataset.shortest_path_lengths], dtype=np.float64)
+    codes = np.where(np.isnan(lengths), len(labels) - 1, np.digitize(np.nan_to_num(lengths), buckets))
+    return list(zip(dataset.scenes, dataset.object_types, labels[codes].tolist()))
+
+
+def _interleave(groups, rng):
+    # Merges ordered groups so that every prefix holds close to the same fraction of each:
+    # the k-th of the n positions of a group is ranked at (k + u) / n, u random per group
+    ranked = []
+    for group in groups:
+        offset = rng.uniform()
+        ranked += [((k + offset) / len(group), position) for k, position in enumerate(group)]
+    ranked.sort()
+    return [position for _, position in ranked]
+
+
+def stratified_order(dataset, seed=0):
+    """
+    Orders the positions of the dataset so that every prefix is a stratified sample: episodes
+    are shuffled within their shortest_path_length bucket, buckets are interleaved within each
+    object type of a scene, object types within each scene and finally the scenes, so a prefix
+    of m episodes holds close to m * n / len(dataset) episodes of a scene with n episodes, and
+    likewise for the object types of the scene and their buckets. The order only depends on
+    the dataset and the seed.
+    """
+    rng = np.random.RandomState(seed)
+    tree = {}
+    for position, (scene, object_type, bucket) in enumerate(strata(dataset)):
+        tree.setdefault(scene, {}).setdefault(object_type, {}).setdefault(bucket, []).append(position)
+
+    scene_orders = []
+    for scene in sorted(tree):
+        object_type_orders = []
+        for object_type in sorted(tree[scene]):
+            buckets = []
+            for bucket in sorted(tree[scene][object_type]):
+                positions = tree[scene][object_type][bucket]
+                buckets.append([positions[i] for i in rng.permutation(len(positions))])
+            object_type_orders.append(_interleave(buckets, rng))
+        scene_orders.append(_interleave(object_type_orders, rng))
+    return _interleave(scene_orders, rng)
+
+
+def confidence_interval(values, population, z=Z_95):
+    """
+    Normal approximation confidence interval of the mean of values in [0, 1] sampled without
+    replacement from population episodes. The variance is that of the values plus a 0 and a 1,
+    so that a sample in which every episode failed (or succeeded) does not give a zero width
+    interval. Stratification only makes the actual interval narrower.
+    """
+    n = len(values)
+    mean = float(np.mean(values)) if n else 0.0
+    if n == 0:
+        return mean, 0.0, 1.0
+    variance = np.concatenate([values, [0.0, 1.0]]).var(ddof=1)
+    half_width = z * math.sqrt(max(1.0 - n / population, 0.0) * variance / n)
+    return mean, max(mean - half_width, 0.0), min(mean + half_width, 1.0)
+
+
+def evaluate_sample(dataset, evaluate, size, ci_width=None, max_growth=4.0, seed=0):
+    """
+    Evaluates a stratified sample (see stratified_order) of size episodes of the dataset with
+    evaluate(episodes), which returns split metrics. With ci_width, the sample is grown until
+    the 95% confidence intervals of success and SPL are at most ci_width wide, or the whole
+    split has been evaluated. Every round evaluates a superset of the previous one, so evaluate
+    should skip episodes it has already run (as RobothorChallenge.inference does with a journal).
+
+    Returns the metrics of the last round with a "sample" entry holding the intervals.
+    """
+    order = stratified_order(dataset, seed)
+    population = len(order)
+    size = max(min(size, population), 1)
+    rounds = []
+
+    while True:
+        episodes = list(dataset.iter_episodes(sorted(order[:size])))
+        metrics = evaluate(episodes)
+        success, spls, _ = episode_success_spl(episodes, [metrics["episodes"][e["id"]] for e in episodes])
+        intervals = {
+            "success": confidence_interval(success, population),
+            "spl": confidence_interval(spls, population)
+        }
+        width = max(hi - lo for _, lo, hi in intervals.values())
+        rounds.append({"episodes": size, "width": width})
+        logger.info("Sample of {size} of {population} {split} episodes: {intervals}".format(
+            size=size,
+            population=population,
+            split=dataset.split,
+            intervals=", ".join(
+                "{name} {mean:.3f} [{lo:.3f}, {hi:.3f}]".format(name=name, mean=mean, lo=lo, hi=hi)
+                for name, (mean, lo, hi) in intervals.items()
+            )
+        ))
+        if ci_width is None or width <= ci_width or size >= population:
+            break
+        # The width shrinks with the square root of the sample size
+        needed = int(math.ceil(size * (width / ci_width) ** 2))
+        size = min(population, max(size + 1, min(needed, int(size * max_growth))))
+
+    metrics["sample"] = {
+        "seed": seed,
+        "episodes": size,
+        "population": population,
+        "confidence": 0.95,
+        "success_ci": list(intervals["success"][1:]),
+        "spl_ci": list(intervals["spl"][1:]),
+        "rounds": rounds
+    }
+    return metrics
@@ -0,0 +1,158 @@
+import os
+import logging
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "robothor_challenge")
+
+
+class ReachablePositions:
+    """
+    Reachable positions of a scene as an (N, 3) array, with a grid index over (x, z) for
+    membership and nearest-position queries that do not have to scan every position.
+    """
+
+    def __init__(self, positions, grid_size):
+        self.positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+        self.grid_size = grid_size
+
+        # Cells are counted from the smallest x and z, as positions are on a grid that need
+        # not be aligned with multiples of grid_size
+        self.origin = self.positions[:, [0, 2]].min(axis=0) if len(self.positions) else np.zeros(2)
+        cells = np.round((self.positions[:, [0, 2]] - self.origin) / grid_size).astype(np.int64)
+        shape = (cells.max(axis=0) + 1) if len(cells) else np.zeros(2, dtype=np.int64)
+        # index of the position in every grid cell, -1 for unreachable cells
+        self.grid = np.full(shape, -1, dtype=np.int64)
+        self.grid[cells[:, 0], cells[:, 1]] = np.arange(len(cells))
+
+    def __len__(self):
+        return len(self.positions)
+
+    def to_dicts(self):
+        return [{"x": x, "y": y, "z": z} for x, y, z in self.positions.tolist()]
+
+    def _cell(self, x, z):
+        return (
+            int(round((x - self.origin[0]) / self.grid_size)),
+            int(round((z - self.origin[1]) / self.grid_size))
+        )
+
+    def contains(self, x, z):
+        i, j = self._cell(x, z)
+        return 0 <= i < self.grid.shape[0] and 0 <= j < self.grid.shape[1] and self.grid[i, j] >= 0
+
+    def nearest(self, x, z):
+        """
+        Index of the reachable position closest to (x, z). Searches square rings of cells
+        around the query; once a position is found, cells further out than its distance
+        cannot be closer.
+        """
+        if len(self.positions) == 0:
+            return None
+        ci, cj = self._cell(x, z)
+        best, best_distance = None, np.inf
+        max_radius = max(self.grid.shape[0], self.grid.shape[1]) + abs(ci) + abs(cj)
+        for radius in range(max_radius + 1):
+            if (radius - 1) * self.grid_size > best_distance:
+                break
+            i0, i1 = max(ci - radius, 0), min(ci + radius, self.grid.shape[0] - 1)
+            j0, j1 = max(cj - radius, 0), min(cj + radius, self.grid.shape[1] - 1)
+            if i0 > i1 or j0 > j1:
+                continue
+            window = self.grid[i0:i1 + 1, j0:j1 + 1]
+            candidates = window[window >= 0]
+            if len(candidates) == 0:
+                continue
+            distances = np.hypot(self.positions[candidates, 0] - x, self.positions[candidates, 2] - z)
+            k = int(np.argmin(distances))
+            if distances[k] < best_distance:
+                best, best_distance = int(candidates[k]), distances[k]
+        return best
+
+
+class SceneCache:
+    """
+    On-disk cache of per-scene data that is expensive to get from the simulator: reachable
+    positions and the objects of a scene as loaded. Entries are stored as .npz files under
+    cache_dir/<backend>/<thor_build_id>/grid<gridSize>/<scene>.<kind>.npz and written atomically
+    (to a temporary file that is then renamed), so any number of processes and runs can share
+    the cache; concurrent writers of the same scene store identical data.
+    """
+
+    def __init__(self, backend, thor_build_id, grid_size, cache_dir=None):
+        self.grid_size = grid_size
+        self.cache_dir = os.path.join(
+            cache_dir or os.environ.get("ROBOTHOR_CACHE_DIR", DEFAULT_CACHE_DIR),
+            backend,
+            thor_build_id,
+            "grid{grid_size:g}".format(grid_size=grid_size)
+        )
+        self._reachable = {}
+        self._objects = {}
+
+    def path(self, scene, kind):
+        return os.path.join(self.cache_dir, "{scene}.{kind}.npz".format(scene=scene, kind=kind))
+
+    def _load(self, scene, kind):
+        path = self.path(scene, kind)
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                return {key: data[key] for key in data.files}
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable cache file {path}: {error}".format(path=path, error=e))
+            return None
+
+    def _store(self, scene, kind, arrays):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.path(scene, kind)
+        tmp_path = "{path}.{pid}.tmp.npz".format(path=path, pid=os.getpid())
+        try:
+            np.savez(tmp_path, **arrays)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning("Could not write cache file {path}: {error}".format(path=path, error=e))
+
+    def reachable_positions(self, scene, compute=None):
+        """
+        Reachable positions of the scene from memory or disk; on a miss they are computed by
+        calling compute() (which returns GetReachablePositions' list of position dicts) and stored.
+        """
+        if scene not in self._reachable:
+            data = self._load(scene, "reachable")
+            if data is not None:
+                positions = data["positions"]
+            elif compute is not None:
+                positions = np.array([[p["x"], p["y"], p["z"]] for p in compute()], dtype=np.float64).reshape(-1, 3)
+                self._store(scene, "reachable", {"positions": positions})
+            else:
+                return None
+            self._reachable[scene] = ReachablePositions(positions, self.grid_size)
+        return self._reachable[scene]
+
+    def scene_objects(self, scene, compute=None):
+        """
+        Objects of the scene as loaded, as a dict of arrays: objectId, objectType and position
+        (N x 3). On a miss, compute() must return the objects of the event metadata.
+        """
+        if scene not in self._objects:
+            data = self._load(scene, "objects")
+            if data is None:
+                if compute is None:
+                    return None
+                objects = compute()
+                data = {
+                    "objectId": np.array([obj["objectId"] for obj in objects], dtype=str),
+                    "objectType": np.array([obj["objectType"] for obj in objects], dtype=str),
+                    "position": np.array(
+                        [[obj["position"]["x"], obj["position"]["y"], obj["position"]["z"]] for obj in objects],
+                        dtype=np.float64
+                    ).reshape(-1, 3)
+                }
+                self._store(scene, "objects", data)
+            self._objects[scene] = data
+        return self._objects[scene]
@@ -0,0 +1,92 @@
+from collections import OrderedDict
+import multiprocessing as mp
+
+from robothor_challenge.dataset import episode_column
+
+
+class SceneScheduler:
+    """
+    Hands out episodes grouped by scene so that each worker loads as few scenes as possible.
+
+    Every scene shard is a range of a shared array that flags which of its episodes were
+    taken. Whole shards are assigned to workers up front (largest shards first, to the least
+    loaded worker) and once a worker has drained its own shards it steals from the shard with
+    the most remaining episodes.
+
+    Episodes are handed out as (episode_ind, episode) pairs, where episode_ind is the position
+    of the episode in the list (or EpisodeSequence) the scheduler was created with. Episodes
+    of an EpisodeSequence are only decoded when a worker takes them.
+    """
+
+    def __init__(self, episodes, nworkers):
+        self.episodes = episodes
+        shards = OrderedDict()
+        for episode_ind, scene in enumerate(episode_column(episodes, "scene")):
+            shards.setdefault(scene, []).append(episode_ind)
+
+        self.scenes = list(shards.keys())
+        self.scene_index = {scene: i for i, scene in enumerate(self.scenes)}
+        # The episodes grouped by scene: those of scene i are tasks[bounds[i]:bounds[i + 1]]
+        self.tasks = [task for shard in shards.values() for task in shard]
+        self.bounds = [0]
+        for shard in shards.values():
+            self.bounds.append(self.bounds[-1] + len(shard))
+        self.positions = {episode_ind: position for position, episode_ind in enumerate(self.tasks)}
+        self.lock = mp.Lock()
+        self.taken = mp.Array("b", len(self.tasks), lock=False)
+
+        loads = [0] * nworkers
+        self.assignments = [[] for _ in range(nworkers)]
+        for scene_ind in sorted(range(len(self.scenes)), key=lambda i: -len(shards[self.scenes[i]])):
+            worker_ind = loads.index(min(loads))
+            self.assignments[worker_ind].append(scene_ind)
+            loads[worker_ind] += len(shards[self.scenes[scene_ind]])
+
+    def __len__(self):
+        with self.lock:
+            return self.taken[:].count(0)
+
+    def requeue(self, episode_ind, episode):
+        with self.lock:
+            self.taken[self.positions[episode_ind]] = 0
+
+    def _remaining(self, scene_ind):
+        return self.taken[self.bounds[scene_ind]:self.bounds[scene_ind + 1]].count(0)
+
+    def _take(self, scene_ind, hold):
+        start = self.bounds[scene_ind]
+        try:
+            position = start + self.taken[start:self.bounds[scene_ind + 1]].index(0)
+        except ValueError:
+            return None
+        episode_ind = self.tasks[position]
+        # Held before it is taken: a worker killed in between leaves an episode that is both
+        # held (and handed back by the supervisor) and still there to take, instead of neither
+        if hold is not None:
+            hold(episode_ind)
+        self.taken[position] = 1
+        return episode_ind
+
+    def next_episode(self, worker_ind, current_scene=None, hold=None):
+        """
+        Takes the next episode for the worker, or returns None when there are none left.
+        hold(episode_ind) is called with the episode before it is taken, to record it as held
+        by the worker.
+        """
+        candidates = list(self.assignments[worker_ind])
+        if current_scene in self.scene_index:
+            candidates.insert(0, self.scene_index[current_scene])
+
+        with self.lock:
+            episode_ind = None
+            for scene_ind in candidates:
+                episode_ind = self._take(scene_ind, hold)
+                if episode_ind is not None:
+                    break
+            if episode_ind is None and self.scenes:
+                episode_ind = self._take(max(range(len(self.scenes)), key=self._remaining), hold)
+
+        if episode_ind is None:
+            return None
+        # Decoded outside the lock, so that other workers do not wait for it
+        return episode_ind, self.episodes[episode_ind]
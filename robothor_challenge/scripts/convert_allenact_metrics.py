@@ -1,10 +1,18 @@
 from robothor_challenge.challenge import ALLOWED_ACTIONS
+from robothor_challenge.metrics import concat_paths, path_lengths, points_from_dicts, spl
+import os
 import argparse
 import gzip
 import json
-import ai2thor.util.metrics
+import logging
+import shutil
+import tempfile
+import multiprocessing as mp
+import numpy as np
 
 
+logger = logging.getLogger(__name__)
+
 allenact_to_ai2thor_actions = {
     "MoveAhead" : "MoveAhead",
     "RotateRight" : "RotateRight",
@@ -15,6 +23,234 @@ allenact_to_ai2thor_actions = {
 }
 assert set(allenact_to_ai2thor_actions.values()) == set(ALLOWED_ACTIONS)
 
+CHUNK_SIZE = 1 << 20
+
+
+def convert_episode(episode, split):
+    episode_metrics = {}
+
+    episode_metrics["trajectory"] = [{
+        "x" : p["x"],
+        "y" : p["y"],
+        "z" : p["z"],
+        "rotation" : p["rotation"]["y"],
+        "horizon" : p["horizon"]
+    } for p in episode["task_info"]["followed_path"]]
+
+    episode_metrics["actions_taken"] = [{
+        "action": allenact_to_ai2thor_actions[a]
+    } for a in episode["task_info"]["taken_actions"]]
+
+    if episode_metrics["actions_taken"][-1] == {"action" : "Stop"}:
+        episode_metrics["trajectory"].append(
+            episode_metrics["trajectory"][-1]
+        )
+
+    for i in range(len(episode_metrics["actions_taken"])):
+        if episode_metrics["actions_taken"][i]["action"] == "Stop":
+            action_success = split == "test" or episode["success"]
+        else:
+            prev_traj = episode_metrics["trajectory"][i]
+            next_traj = episode_metrics["trajectory"][i+1]
+            action_success = prev_traj != next_traj
+        episode_metrics["actions_taken"][i]["success"] = action_success
+
+    if split != "test":
+        episode_metrics["success"] = episode["success"]
+
+    return episode["task_info"]["id"], episode_metrics
+
+
+class SplitAccumulator:
+    """
+    Running sums for the summary metrics of a split, so that episodes can be discarded once
+    they have been written.
+    """
+
+    def __init__(self, split):
+        self.split = split
+        self.episodes = 0
+        self.ep_len = 0
+        self.success = 0.0
+        self.spl = 0.0
+
+    def add(self, episode, episode_metrics):
+        self.episodes += 1
+        self.ep_len += len(episode_metrics["trajectory"])
+        if self.split != "test":
+            lengths = path_lengths(*concat_paths([
+                points_from_dicts(episode_metrics["trajectory"]),
+                points_from_dicts(episode["task_info"]["path_to_target"])
+            ]))
+            self.success += episode_metrics["success"]
+            self.spl += float(spl(lengths[:1], lengths[1:], [episode_metrics["success"]])[0])
+
+    def metrics(self):
+        metrics = {}
+        if self.split != "test":
+            metrics["success"] = self.success / self.episodes
+            metrics["spl"] = self.spl / self.episodes
+        metrics["ep_len"] = self.ep_len / self.episodes
+        return metrics
+
+
+class StreamReader:
+    """
+    Reads a text file in chunks and decodes JSON values from it, keeping only the unread
+    part of the current chunk (and of a value that continues into the next one) in memory.
+    """
+
+    def __init__(self, f, chunk_size=CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        chunk = self.f.read(self.chunk_size)
+        self.eof = not chunk
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+
+    def peek(self):
+        while self.pos >= len(self.buffer):
+            if self.eof:
+                raise ValueError("Unexpected end of allenact metrics file")
+            self.fill()
+        return self.buffer[self.pos]
+
+    def decode(self, scan):
+        # scan(buffer, pos) returns (value, end); it is retried with more data for as long as
+        # the value runs past the end of the buffer
+        while True:
+            try:
+                value, self.pos = scan(self.buffer, self.pos)
+                return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+                self.fill()
+
+
+def iter_tasks(f, chunk_size=CHUNK_SIZE):
+    """
+    Yields the entries of the "tasks" array of an allenact metrics file (a list holding one
+    dict with a "tasks" key) one at a time, without loading the whole file.
+    """
+    reader = StreamReader(f, chunk_size)
+
+    # Find the "tasks" key of the first dict, skipping over other keys and their values. A
+    # string is only a key where an object expects one (after "{" or a "," in an object), so
+    # string values (e.g. "tasks") are skipped like any other value
+    containers = []
+    expect_key = False
+    while True:
+        c = reader.peek()
+        reader.pos += 1
+        if c == '"':
+            string = reader.decode(json.decoder.scanstring)
+            if expect_key and containers == ["[", "{"] and string == "tasks":
+                break
+            expect_key = False
+        elif c in "[{":
+            containers.append(c)
+            expect_key = c == "{"
+        elif c in "]}":
+            containers.pop()
+            expect_key = False
+        elif c == ",":
+            expect_key = containers[-1] == "{"
+
+    while reader.peek() != "[":
+        reader.pos += 1
+    reader.pos += 1
+
+    decoder = json.JSONDecoder()
+    while True:
+        c = reader.peek()
+        if c == "]":
+            return
+        if c in " \t\r\n,":
+            reader.pos += 1
+            continue
+        yield reader.decode(decoder.raw_decode)
+
+
+def convert_split(split, metrics_path):
+    with open(metrics_path, "r") as read_file:
+        tasks = json.load(read_file)[0]["tasks"]
+
+    split_metrics = {"episodes" : {}}
+    paths = []
+    shortest_paths = []
+    for episode in tasks:
+        ep_id, episode_metrics = convert_episode(episode, split)
+        if split != "test":
+            paths.append(points_from_dicts(episode_metrics["trajectory"]))
+            shortest_paths.append(points_from_dicts(episode["task_info"]["path_to_target"]))
+        split_metrics["episodes"][ep_id] = episode_metrics
+
+    num_episodes = len(split_metrics["episodes"])
+
+    if split != "test":
+        success = np.array([e["success"] for e in split_metrics["episodes"].values()], dtype=np.float64)
+        split_metrics["success"] = float(success.mean())
+        split_metrics["spl"] = float(spl(
+            path_lengths(*concat_paths(paths)),
+            path_lengths(*concat_paths(shortest_paths)),
+            success
+        ).mean())
+
+    split_metrics["ep_len"] = sum([len(e["trajectory"]) for e in split_metrics["episodes"].values()]) / num_episodes
+    return split_metrics
+
+
+def stream_split(split, metrics_path, output_path):
+    """
+    Converts the episodes of metrics_path as they are read and writes them to output_path
+    as a gzip member holding the "<split>": {...} entry of the challenge metrics. Returns
+    the split's summary metrics.
+    """
+    accumulator = SplitAccumulator(split)
+    with open(metrics_path, "r") as read_file, gzip.open(output_path, "wt", encoding="utf-8") as out:
+        out.write(json.dumps(split) + ": {\"episodes\": {")
+        for episode in iter_tasks(read_file):
+            ep_id, episode_metrics = convert_episode(episode, split)
+            accumulator.add(episode, episode_metrics)
+            if accumulator.episodes > 1:
+                out.write(", ")
+            out.write(json.dumps(ep_id) + ": " + json.dumps(episode_metrics))
+        out.write("}")
+        metrics = accumulator.metrics()
+        for key, value in metrics.items():
+            out.write(", " + json.dumps(key) + ": " + json.dumps(value))
+        out.write("}")
+    return metrics
+
+
+def stream_convert(metrics_paths, output):
+    # Every split is converted by its own process into a gzip member of its own; gzip files
+    # can be concatenated, so the members are joined into the output without decompressing
+    tmp_dir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(output)))
+    try:
+        parts = [os.path.join(tmp_dir, "{split}.json.gz".format(split=split)) for split in metrics_paths]
+        with mp.Pool(len(metrics_paths)) as pool:
+            summaries = pool.starmap(stream_split, [
+                (split, metrics_path, part) for (split, metrics_path), part in zip(metrics_paths.items(), parts)
+            ])
+        with open(output, "wb") as out:
+            out.write(gzip.compress(b"{"))
+            for i, part in enumerate(parts):
+                if i > 0:
+                    out.write(gzip.compress(b", "))
+                with open(part, "rb") as f:
+                    shutil.copyfileobj(f, out)
+            out.write(gzip.compress(b"}"))
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return dict(zip(metrics_paths, summaries))
+
 
 def main():
     parser = argparse.ArgumentParser(description="Convert JSON metrics files from allenact val and test splits to submission file for RoboThor ObjectNav challenge.")
@@ -31,71 +267,21 @@ def main():
         "--output", "-o",
         help="Output challenge metrics to this file.",
         default="submission_metrics.json.gz")
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Convert episodes as they are read, with val and test in parallel, so that memory use does not grow with the size of the metrics files.")
 
     args = parser.parse_args()
 
-    with open(args.val_metrics, "r") as read_file:
-        allenact_val_metrics = json.load(read_file)
-    with open(args.test_metrics, "r") as read_file:
-        allenact_test_metrics = json.load(read_file)
-
-    challenge_metrics = {}
+    metrics_paths = {"val": args.val_metrics, "test": args.test_metrics}
 
-    for split in ["val", "test"]:
-        if split == "val":
-            tasks = allenact_val_metrics[0]["tasks"]
-        else:
-            tasks = allenact_test_metrics[0]["tasks"]
-
-        challenge_metrics[split] = {"episodes" : {}}
-        episode_results = []
-
-        for episode in tasks:
-            episode_metrics = {}
-
-            episode_metrics["trajectory"] = [{
-                "x" : p["x"],
-                "y" : p["y"],
-                "z" : p["z"],
-                "rotation" : p["rotation"]["y"],
-                "horizon" : p["horizon"]
-            } for p in episode["task_info"]["followed_path"]]
-
-            episode_metrics["actions_taken"] = [{
-                "action": allenact_to_ai2thor_actions[a]
-            } for a in episode["task_info"]["taken_actions"]]
-
-            if episode_metrics["actions_taken"][-1] == {"action" : "Stop"}:
-                episode_metrics["trajectory"].append(
-                    episode_metrics["trajectory"][-1]
-                )
-
-            for i in range(len(episode_metrics["actions_taken"])):
-                if episode_metrics["actions_taken"][i]["action"] == "Stop":
-                    action_success = split == "test" or episode["success"]
-                else:
-                    prev_traj = episode_metrics["trajectory"][i]
-                    next_traj = episode_metrics["trajectory"][i+1]
-                    action_success = prev_traj != next_traj
-                episode_metrics["actions_taken"][i]["success"] = action_success
-
-            if split != "test":
-                episode_metrics["success"] = episode["success"]
-                episode_results.append({
-                    "shortest_path" : episode["task_info"]["path_to_target"],
-                    "path" : episode_metrics["trajectory"],
-                    "success" : episode_metrics["success"]
-                })
-
-            challenge_metrics[split]["episodes"][episode["task_info"]["id"]] = episode_metrics
-
-        num_episodes = len(challenge_metrics[split]["episodes"])
-
-        if split != "test":
-            challenge_metrics[split]["success"] = sum([e["success"] for e in challenge_metrics[split]["episodes"].values()]) / num_episodes
-            challenge_metrics[split]["spl"] = ai2thor.util.metrics.compute_spl(episode_results)
+    if args.stream:
+        for split, metrics in stream_convert(metrics_paths, args.output).items():
+            logger.info("{split}: {metrics}".format(split=split, metrics=metrics))
+        return
 
-        challenge_metrics[split]["ep_len"] = sum([len(e["trajectory"]) for e in challenge_metrics[split]["episodes"].values()]) / num_episodes
+    challenge_metrics = {split: convert_split(split, metrics_path) for split, metrics_path in metrics_paths.items()}
 
     with gzip.open(args.output, "wt", encoding="utf-8") as zipfile:
         json.dump(challenge_metrics, zipfile)
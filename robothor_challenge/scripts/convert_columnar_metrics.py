@@ -0,0 +1,26 @@
+from robothor_challenge.trajectory import metrics_to_json, read_npz
+import argparse
+import gzip
+import json
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert columnar (.npz) metrics from runner.py to the JSON submission file for RoboThor ObjectNav challenge.")
+
+    parser.add_argument(
+        "--input", "-i",
+        help="Filepath of the .npz metrics written by runner.py.",
+        required=True)
+    parser.add_argument(
+        "--output", "-o",
+        help="Output challenge metrics to this file.",
+        default="submission_metrics.json.gz")
+
+    args = parser.parse_args()
+
+    with gzip.open(args.output, "wt", encoding="utf-8") as zipfile:
+        json.dump(metrics_to_json(read_npz(args.input)), zipfile)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+from multiprocessing import shared_memory
+import multiprocessing as mp
+
+import numpy as np
+
+
+class FrameRing:
+    """
+    Ring buffer of rgb (and optionally depth) frames in shared memory.
+
+    The producer copies each frame into a free slot once and only sends the small descriptor
+    returned by `write` to other processes, which get NumPy views on the slot through `read`
+    and hand it back with `release` once they are done with it.
+
+    The producer has at most one frame in flight. When it dies, `reset` frees its slots for the
+    next producer; releases of frames written before the reset are then ignored.
+    """
+
+    def __init__(self, width, height, depth=False, nslots=2, rgb_dtype=np.uint8):
+        self.width = width
+        self.height = height
+        self.depth = depth
+        self.nslots = nslots
+        self.rgb_dtype = np.dtype(rgb_dtype)
+
+        self.rgb_nbytes = height * width * 3 * self.rgb_dtype.itemsize
+        self.depth_nbytes = height * width * np.dtype(np.float32).itemsize if depth else 0
+        self.slot_nbytes = self.rgb_nbytes + self.depth_nbytes
+
+        self.shm = shared_memory.SharedMemory(create=True, size=self.slot_nbytes * nslots)
+        self.busy = mp.Array("b", nslots, lock=False)
+        self.generation = mp.Value("i", 0, lock=False)
+        self.next_slot = 0
+        self._attach()
+
+    def _attach(self):
+        self.rgb_views = []
+        self.depth_views = []
+        for slot in range(self.nslots):
+            offset = slot * self.slot_nbytes
+            self.rgb_views.append(np.ndarray(
+                (self.height, self.width, 3), dtype=self.rgb_dtype, buffer=self.shm.buf, offset=offset
+            ))
+            if self.depth:
+                self.depth_views.append(np.ndarray(
+                    (self.height, self.width), dtype=np.float32, buffer=self.shm.buf, offset=offset + self.rgb_nbytes
+                ))
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["shm"] = self.shm.name
+        del state["rgb_views"]
+        del state["depth_views"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.shm = shared_memory.SharedMemory(name=state["shm"])
+        self._attach()
+
+    def write(self, rgb, depth=None):
+        for _ in range(self.nslots):
+            slot = self.next_slot
+            self.next_slot = (self.next_slot + 1) % self.nslots
+            if not self.busy[slot]:
+                break
+        else:
+            raise RuntimeError("No free slot in the frame ring")
+        self.busy[slot] = 1
+
+        has_rgb = rgb is not None
+        if has_rgb:
+            self.rgb_views[slot][...] = rgb
+        has_depth = self.depth and depth is not None
+        if has_depth:
+            self.depth_views[slot][...] = depth
+        return slot, has_rgb, has_depth, self.generation.value
+
+    def read(self, descriptor):
+        slot, has_rgb, has_depth, _ = descriptor
+        return self.rgb_views[slot] if has_rgb else None, self.depth_views[slot] if has_depth else None
+
+    def release(self, descriptor):
+        slot, _, _, generation = descriptor
+        if generation == self.generation.value:
+            self.busy[slot] = 0
+
+    def reset(self):
+        self.generation.value += 1
+        for slot in range(self.nslots):
+            self.busy[slot] = 0
+
+    def close(self):
+        self.rgb_views = []
+        self.depth_views = []
+        self.shm.close()
+
+    def unlink(self):
+        self.close()
+        self.shm.unlink()
@@ -7,6 +7,9 @@ import tempfile
 import threading
 import os
 import sys
+import time
+import socket
+import shutil
 
 # Turning off automatic black formatting for this script as it breaks quotes.
 
@@ -66,16 +69,50 @@ EndSection
     output =  "\n".join(xorg_conf)
     return output
 
-def startx(display=0):
-    if platform.system() != "Linux":
-        raise Exception("Can only run startx on linux")
-
+def nvidia_devices():
     devices = []
     for r in pci_records():
         if r.get("Vendor", "") == "NVIDIA Corporation"\
                 and r["Class"] in ["VGA compatible controller", "3D controller"]:
             bus_id = "PCI:" + ":".join(map(lambda x: str(int(x, 16)), re.split(r"[:\.]", r["Slot"])))
             devices.append(bus_id)
+    return devices
+
+def display_ready(display=0):
+    # The server accepts connections on its socket once it is up; xdpyinfo (if installed)
+    # additionally confirms that it answers X requests.
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect("/tmp/.X11-unix/X%s" % display)
+    except OSError:
+        return False
+    finally:
+        sock.close()
+
+    if shutil.which("xdpyinfo") is None:
+        return True
+    return subprocess.call(
+        ["xdpyinfo", "-display", ":%s" % display],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    ) == 0
+
+def wait_for_display(display=0, timeout=30, xthread=None, interval=0.1):
+    start = time.time()
+    while not display_ready(display):
+        if xthread is not None and not xthread.is_alive():
+            raise Exception("X server on display :%s exited during startup" % display)
+        if time.time() - start > timeout:
+            raise Exception("X server on display :%s not ready after %ss" % (display, timeout))
+        time.sleep(interval)
+    return time.time() - start
+
+def startx(display=0, devices=None):
+    if platform.system() != "Linux":
+        raise Exception("Can only run startx on linux")
+
+    if devices is None:
+        devices = nvidia_devices()
 
     if not devices:
         raise Exception("no nvidia cards found")
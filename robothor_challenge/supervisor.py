@@ -0,0 +1,230 @@
+import os
+import time
+import signal
+import logging
+import multiprocessing as mp
+
+
+logger = logging.getLogger(__name__)
+
+
+def exit_on_sigterm():
+    # Turns SIGTERM into SystemExit in a worker, so that it unwinds (releasing the locks it holds
+    # on shared queues and arrays) when the supervisor stops it
+    def handler(signum, frame):
+        raise SystemExit(128 + signum)
+
+    signal.signal(signal.SIGTERM, handler)
+
+
+class WorkerStatus:
+    """
+    Shared-memory record of what every inference worker is doing: whether its controllers are
+    initialized and, for each of its slots (one per episode in flight), the episode it holds
+    (-1 when idle), when that episode started, when its last step finished and the pid of the
+    Unity process of its controller, and whether the slot waits for an action from the agent
+    server. Workers write their own slots, the supervisor reads all of them. Per worker, it
+    also counts the steps taken (for throughput telemetry) and flags workers that are to retire
+    once their current episodes are done.
+    """
+
+    def __init__(self, nworkers, slots=1):
+        self.slots = slots
+        self.ready = mp.Array("b", nworkers, lock=False)
+        self.steps = mp.Array("q", nworkers, lock=False)
+        self.retire = mp.Array("b", nworkers, lock=False)
+        self.episode = mp.Array("i", [-1] * nworkers * slots, lock=False)
+        self.episode_start = mp.Array("d", nworkers * slots, lock=False)
+        self.last_step = mp.Array("d", nworkers * slots, lock=False)
+        self.unity_pid = mp.Array("i", nworkers * slots, lock=False)
+        self.acting = mp.Array("b", nworkers * slots, lock=False)
+
+    def all_ready(self, count=None):
+        return all(self.ready[:count])
+
+    def slot_range(self, worker_ind):
+        return range(worker_ind * self.slots, (worker_ind + 1) * self.slots)
+
+    def held(self, worker_ind):
+        # Indices into the per-slot arrays of the slots of the worker that hold an episode
+        return [i for i in self.slot_range(worker_ind) if self.episode[i] >= 0]
+
+    def start_episode(self, worker_ind, episode_ind, slot=0):
+        i = worker_ind * self.slots + slot
+        now = time.time()
+        self.episode_start[i] = now
+        self.last_step[i] = now
+        self.episode[i] = episode_ind
+
+    def step(self, worker_ind, slot=0):
+        self.last_step[worker_ind * self.slots + slot] = time.time()
+        self.steps[worker_ind] += 1
+
+    def start_acting(self, worker_ind, slot=0):
+        self.acting[worker_ind * self.slots + slot] = 1
+
+    def acted(self, worker_ind, slot=0):
+        # Waiting for the agent server does not count towards the step after it
+        i = worker_ind * self.slots + slot
+        self.last_step[i] = time.time()
+        self.acting[i] = 0
+
+    def finish_episode(self, worker_ind, slot=0):
+        self.episode[worker_ind * self.slots + slot] = -1
+
+
+class WorkerSupervisor:
+    """
+    Starts inference workers through `spawn(worker_ind)` (all at once, without waiting for
+    each other) and watches them: a worker that dies, does not report ready within the startup
+    timeout, or exceeds the per-step or per-episode timeout in any episode it holds is stopped
+    (together with its Unity processes) and respawned, and every episode it held is handed to
+    `on_failure(episode_ind, reason)`. Workers are stopped with SIGTERM (see exit_on_sigterm)
+    and killed once they have not exited within terminate_timeout. Slots waiting for an action from the agent server have
+    no step timeout, as the server is watched on its own (AgentServer.check).
+
+    Workers can be added while running, up to the number of workers the status was made for,
+    and retired: a retiring worker takes no more episodes and exits once its current ones are
+    done, and is not respawned.
+    """
+
+    def __init__(
+        self, spawn, nworkers, status, step_timeout, episode_timeout, max_restarts, startup_timeout=600,
+        terminate_timeout=10
+    ):
+        self.spawn = spawn
+        self.status = status
+        self.step_timeout = step_timeout
+        self.episode_timeout = episode_timeout
+        self.startup_timeout = startup_timeout
+        self.max_restarts = max_restarts
+        self.terminate_timeout = terminate_timeout
+
+        self.restarts = [0] * nworkers
+        self.retired = set()
+        self.retiring = set()
+        self.crashes = []
+        self.spawned_at = [0.0] * nworkers
+        self.processes = [self._spawn(worker_ind) for worker_ind in range(nworkers)]
+
+    def _spawn(self, worker_ind):
+        self.status.ready[worker_ind] = 0
+        self.status.retire[worker_ind] = 0
+        self.retiring.discard(worker_ind)
+        self.spawned_at[worker_ind] = time.time()
+        return self.spawn(worker_ind)
+
+    def active(self):
+        # Indices of the workers that take episodes
+        return [
+            worker_ind for worker_ind in range(len(self.processes))
+            if worker_ind not in self.retired and worker_ind not in self.retiring
+        ]
+
+    def add_worker(self):
+        worker_ind = len(self.processes)
+        self.restarts.append(0)
+        self.spawned_at.append(0.0)
+        self.processes.append(self._spawn(worker_ind))
+        return worker_ind
+
+    def retire_worker(self, worker_ind):
+        self.status.retire[worker_ind] = 1
+        self.retiring.add(worker_ind)
+
+    def alive(self):
+        return any(p.is_alive() for p in self.processes)
+
+    def exhausted(self):
+        # Whether every worker is retired, so that none will be started again
+        return len(self.retired) == len(self.processes)
+
+    def _kill(self, worker_ind):
+        p = self.processes[worker_ind]
+        if p.is_alive():
+            p.terminate()
+            p.join(timeout=self.terminate_timeout)
+        if p.is_alive():
+            logger.warning("Worker {worker_ind} did not exit within {timeout}s, killing it".format(
+                worker_ind=worker_ind,
+                timeout=self.terminate_timeout
+            ))
+            p.kill()
+        p.join()
+
+        for i in self.status.slot_range(worker_ind):
+            unity_pid = self.status.unity_pid[i]
+            if unity_pid > 0:
+                try:
+                    os.kill(unity_pid, signal.SIGKILL)
+                except OSError:
+                    pass
+                self.status.unity_pid[i] = 0
+
+    def kill_all(self):
+        for worker_ind in range(len(self.processes)):
+            self._kill(worker_ind)
+
+    def check(self, on_failure, work_remaining):
+        now = time.time()
+        for worker_ind, p in enumerate(self.processes):
+            if worker_ind in self.retired:
+                continue
+            held = self.status.held(worker_ind)
+            if not p.is_alive():
+                if not held and p.exitcode == 0 and worker_ind in self.retiring:
+                    self.retired.add(worker_ind)
+                    continue
+                if not held and (p.exitcode == 0 or not work_remaining):
+                    continue
+                reason = "worker exited with code {code}".format(code=p.exitcode)
+            elif not self.status.ready[worker_ind]:
+                if now - self.spawned_at[worker_ind] <= self.startup_timeout:
+                    continue
+                reason = "startup timeout ({timeout}s)".format(timeout=self.startup_timeout)
+            elif not held:
+                continue
+            elif now - min([self.status.last_step[i] for i in held if not self.status.acting[i]] or [now]) \
+                    > self.step_timeout:
+                reason = "step timeout ({timeout}s)".format(timeout=self.step_timeout)
+            elif now - min(self.status.episode_start[i] for i in held) > self.episode_timeout:
+                reason = "episode timeout ({timeout}s)".format(timeout=self.episode_timeout)
+            else:
+                continue
+
+            logger.warning("Worker {worker_ind} failed: {reason}".format(worker_ind=worker_ind, reason=reason))
+            self._kill(worker_ind)
+            # Read the episodes again, as the worker may have moved on before it was killed
+            episode_inds = [self.status.episode[i] for i in self.status.held(worker_ind)]
+            for i in self.status.slot_range(worker_ind):
+                self.status.episode[i] = -1
+                self.status.acting[i] = 0
+            for episode_ind in episode_inds or [None]:
+                self.crashes.append({"worker": worker_ind, "episode": episode_ind, "reason": reason})
+            for episode_ind in episode_inds:
+                on_failure(episode_ind, reason)
+
+            if worker_ind in self.retiring:
+                self.retired.add(worker_ind)
+            elif self.restarts[worker_ind] < self.max_restarts:
+                self.restarts[worker_ind] += 1
+                logger.warning("Restarting worker {worker_ind} (restart {count} of {limit})".format(
+                    worker_ind=worker_ind,
+                    count=self.restarts[worker_ind],
+                    limit=self.max_restarts
+                ))
+                self.processes[worker_ind] = self._spawn(worker_ind)
+            else:
+                self.retired.add(worker_ind)
+
+        # Workers exit once the scheduler is empty, so if failed episodes were put back after
+        # every worker left, start one again to pick them up.
+        if work_remaining and not self.alive():
+            for worker_ind in range(len(self.processes)):
+                if worker_ind not in self.retired:
+                    self.processes[worker_ind] = self._spawn(worker_ind)
+                    break
+
+    def join(self, timeout=2):
+        for p in self.processes:
+            p.join(timeout=timeout)
@@ -0,0 +1,50 @@
+import numpy as np
+
+
+class TerminationPolicy:
+    """
+    Ends episodes early for fast sweeps (runner.py --termination), from the termination
+    section of the config:
+
+    - stuck_steps: after this many consecutive failed actions (e.g. MoveAhead into a wall)
+    - no_progress_steps / no_progress_distance: when the agent has not got further than
+      no_progress_distance meters from where it was no_progress_steps steps ago, e.g. when
+      turning or oscillating in place
+    - step_budget: at most this many steps (instead of max_steps) for the split
+
+    A value of 0 (or no budget for the split) disables the check. Episodes ended this way
+    are marked with the reason as "truncated".
+    """
+
+    def __init__(self, stuck_steps=0, no_progress_steps=0, no_progress_distance=0.5, step_budget=None):
+        self.stuck_steps = stuck_steps
+        self.no_progress_steps = no_progress_steps
+        self.no_progress_distance = no_progress_distance
+        self.step_budget = step_budget
+
+    @classmethod
+    def from_config(cls, config, split):
+        return cls(
+            stuck_steps=config["stuck_steps"],
+            no_progress_steps=config["no_progress_steps"],
+            no_progress_distance=config["no_progress_distance"],
+            step_budget=(config["step_budgets"] or {}).get(split)
+        )
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+    def check(self, recorder):
+        # Returns the reason to end the episode after the last recorded step, or None
+        steps = recorder.steps
+        if self.stuck_steps and steps >= self.stuck_steps:
+            if not recorder.action_success[steps - self.stuck_steps:steps].any():
+                return "stuck"
+        if self.no_progress_steps and steps >= self.no_progress_steps:
+            window = recorder.trajectory[steps - self.no_progress_steps:steps + 1, [0, 2]]
+            distances = np.hypot(window[:, 0] - window[0, 0], window[:, 1] - window[0, 1])
+            if distances.max() < self.no_progress_distance:
+                return "no_progress"
+        if self.step_budget and steps >= self.step_budget:
+            return "step_budget"
+        return None
@@ -0,0 +1,115 @@
+import numpy as np
+
+
+# Phases timed by the inference workers:
+#   reset: loading a scene (controller.reset)
+#   teleport: moving the agent to the episode start (TeleportFull)
+#   frames: applying the agent's observation spec and handing the observation to the agent
+#     server (only with an observation spec or --agent-server)
+#   act: agent.act (excluding frames)
+#   step: controller.step for the agent's action
+PHASES = ["reset", "teleport", "frames", "act", "step"]
+PHASE_INDEX = {phase: i for i, phase in enumerate(PHASES)}
+
+# Log-spaced latency bins from 10us to 1000s, 20 per decade (~12% wide); bin 0 holds
+# everything below the first edge and the last bin everything above the last one.
+BIN_EDGES = np.logspace(-5, 3, 8 * 20 + 1)
+PERCENTILES = [50, 95, 99]
+
+
+class LatencyHistogram:
+    """
+    Fixed-bin latency histograms for every phase in PHASES. Histograms from different
+    workers, scenes or episodes are merged by adding their counts.
+    """
+
+    def __init__(self):
+        self.counts = np.zeros((len(PHASES), len(BIN_EDGES) + 1), dtype=np.int32)
+        self.totals = np.zeros(len(PHASES), dtype=np.float64)
+        self.maxima = np.zeros(len(PHASES), dtype=np.float64)
+
+    @classmethod
+    def from_durations(cls, phase_durations):
+        histogram = cls()
+        for i, durations in enumerate(phase_durations):
+            if len(durations) == 0:
+                continue
+            histogram.counts[i] = np.bincount(np.searchsorted(BIN_EDGES, durations), minlength=len(BIN_EDGES) + 1)
+            histogram.totals[i] = durations.sum()
+            histogram.maxima[i] = durations.max()
+        return histogram
+
+    def merge(self, other):
+        self.counts += other.counts
+        self.totals += other.totals
+        np.maximum(self.maxima, other.maxima, out=self.maxima)
+        return self
+
+    def percentiles(self, phase, qs=PERCENTILES):
+        # Upper edge of the bin holding each percentile, capped by the largest latency seen
+        i = PHASE_INDEX[phase]
+        cumulative = np.cumsum(self.counts[i])
+        if cumulative[-1] == 0:
+            return [0.0] * len(qs)
+        bins = np.searchsorted(cumulative, np.ceil(np.asarray(qs) / 100.0 * cumulative[-1]))
+        edges = np.append(BIN_EDGES, np.inf)[bins]
+        return np.minimum(edges, self.maxima[i]).tolist()
+
+    def summary(self):
+        result = {}
+        for i, phase in enumerate(PHASES):
+            count = int(self.counts[i].sum())
+            if count == 0:
+                continue
+            result[phase] = {
+                "count": count,
+                "total_s": float(self.totals[i]),
+                "mean_ms": float(self.totals[i] / count * 1000),
+                **{
+                    "p{q}_ms".format(q=q): value * 1000
+                    for q, value in zip(PERCENTILES, self.percentiles(phase))
+                },
+                "max_ms": float(self.maxima[i] * 1000)
+            }
+        return result
+
+
+class PhaseTimer:
+    """
+    Collects the phase durations of one episode into arrays preallocated for max_steps.
+    """
+
+    def __init__(self, max_steps):
+        self.durations = np.zeros((len(PHASES), max_steps + 1), dtype=np.float64)
+        self.counts = np.zeros(len(PHASES), dtype=np.int64)
+
+    def reset(self):
+        self.counts[:] = 0
+
+    def add(self, phase, seconds):
+        i = PHASE_INDEX[phase]
+        self.durations[i, self.counts[i]] = seconds
+        self.counts[i] += 1
+
+    def histogram(self):
+        return LatencyHistogram.from_durations([
+            self.durations[i, :self.counts[i]] for i in range(len(PHASES))
+        ])
+
+
+def latency_report(by_worker, by_scene):
+    total = LatencyHistogram()
+    for histogram in by_worker.values():
+        total.merge(histogram)
+    return {
+        "total": total.summary(),
+        "worker": {str(worker_ind): histogram.summary() for worker_ind, histogram in by_worker.items()},
+        "scene": {scene: histogram.summary() for scene, histogram in by_scene.items()}
+    }
+
+
+def format_latency_summary(summary):
+    return ", ".join(
+        "{phase} p50:{p50_ms:.1f}ms p95:{p95_ms:.1f}ms p99:{p99_ms:.1f}ms".format(phase=phase, **stats)
+        for phase, stats in summary.items()
+    )
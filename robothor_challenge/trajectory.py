@@ -0,0 +1,172 @@
+import json
+
+import numpy as np
+
+from robothor_challenge.agent import ALLOWED_ACTIONS
+
+
+TRAJECTORY_FIELDS = ["x", "y", "z", "rotation", "horizon"]
+ACTION_CODES = {action: code for code, action in enumerate(ALLOWED_ACTIONS)}
+
+
+class TrajectoryRecorder:
+    """
+    Records the poses and actions of an episode into arrays preallocated for max_steps.
+
+    Episode metrics are kept as a dict of arrays: "trajectory" (steps + 1 x 5 float64 poses in
+    TRAJECTORY_FIELDS order), "actions" (int8 indices into ALLOWED_ACTIONS) and "action_success".
+    """
+
+    def __init__(self, max_steps):
+        self.trajectory = np.zeros((max_steps + 1, len(TRAJECTORY_FIELDS)), dtype=np.float64)
+        self.actions = np.zeros(max_steps, dtype=np.int8)
+        self.action_success = np.zeros(max_steps, dtype=bool)
+        self.steps = 0
+
+    def reset(self, position, rotation, horizon):
+        self.steps = 0
+        self.trajectory[0] = (position["x"], position["y"], position["z"], rotation, horizon)
+
+    def record(self, action, success, position, rotation, horizon):
+        self.actions[self.steps] = ACTION_CODES[action]
+        self.action_success[self.steps] = success
+        self.steps += 1
+        self.trajectory[self.steps] = (position["x"], position["y"], position["z"], rotation, horizon)
+
+    def episode_metrics(self):
+        return {
+            "trajectory": self.trajectory[:self.steps + 1].copy(),
+            "actions": self.actions[:self.steps].copy(),
+            "action_success": self.action_success[:self.steps].copy()
+        }
+
+
+def episode_to_json(episode_metrics):
+    result = {
+        "trajectory": [
+            {field: float(value) for field, value in zip(TRAJECTORY_FIELDS, pose)}
+            for pose in episode_metrics["trajectory"]
+        ],
+        "actions_taken": [
+            {"action": ALLOWED_ACTIONS[code], "success": bool(success)}
+            for code, success in zip(episode_metrics["actions"], episode_metrics["action_success"])
+        ]
+    }
+    if "success" in episode_metrics:
+        result["success"] = bool(episode_metrics["success"])
+    if "failed" in episode_metrics:
+        result["failed"] = episode_metrics["failed"]
+    if "truncated" in episode_metrics:
+        result["truncated"] = episode_metrics["truncated"]
+    return result
+
+
+def episode_from_json(episode_json):
+    # Inverse of episode_to_json
+    episode_metrics = {
+        "trajectory": np.array(
+            [[pose[field] for field in TRAJECTORY_FIELDS] for pose in episode_json["trajectory"]], dtype=np.float64
+        ).reshape(-1, len(TRAJECTORY_FIELDS)),
+        "actions": np.array([ACTION_CODES[a["action"]] for a in episode_json["actions_taken"]], dtype=np.int8),
+        "action_success": np.array([a["success"] for a in episode_json["actions_taken"]], dtype=bool)
+    }
+    for key in ("success", "failed", "truncated"):
+        if key in episode_json:
+            episode_metrics[key] = episode_json[key]
+    return episode_metrics
+
+
+def encode_episode(episode_metrics):
+    return {
+        key: value.tolist() if isinstance(value, np.ndarray) else value
+        for key, value in episode_metrics.items()
+    }
+
+
+def decode_episode(encoded):
+    episode_metrics = dict(encoded)
+    episode_metrics["trajectory"] = np.array(encoded["trajectory"], dtype=np.float64).reshape(-1, len(TRAJECTORY_FIELDS))
+    episode_metrics["actions"] = np.array(encoded["actions"], dtype=np.int8)
+    episode_metrics["action_success"] = np.array(encoded["action_success"], dtype=bool)
+    return episode_metrics
+
+
+def metrics_to_json(challenge_metrics):
+    return {
+        split: {
+            **{key: value for key, value in split_metrics.items() if key != "episodes"},
+            "episodes": {ep_id: episode_to_json(em) for ep_id, em in split_metrics["episodes"].items()}
+        }
+        for split, split_metrics in challenge_metrics.items()
+    }
+
+
+def write_npz(path, challenge_metrics):
+    # Every split is stored as flat columns plus offsets into them: episode i owns
+    # trajectory[trajectory_offsets[i]:trajectory_offsets[i + 1]] and likewise for actions.
+    arrays = {}
+    for split, split_metrics in challenge_metrics.items():
+        episodes = split_metrics["episodes"]
+        ep_ids = list(episodes.keys())
+        trajectory_lengths = [len(episodes[ep_id]["trajectory"]) for ep_id in ep_ids]
+        action_lengths = [len(episodes[ep_id]["actions"]) for ep_id in ep_ids]
+
+        arrays[split + ".episode_ids"] = np.array(ep_ids, dtype=str)
+        arrays[split + ".trajectory_offsets"] = np.concatenate([[0], np.cumsum(trajectory_lengths)]).astype(np.int64)
+        arrays[split + ".action_offsets"] = np.concatenate([[0], np.cumsum(action_lengths)]).astype(np.int64)
+        arrays[split + ".trajectory"] = np.concatenate(
+            [episodes[ep_id]["trajectory"] for ep_id in ep_ids] or [np.zeros((0, len(TRAJECTORY_FIELDS)))]
+        ).astype(np.float64)
+        arrays[split + ".actions"] = np.concatenate(
+            [episodes[ep_id]["actions"] for ep_id in ep_ids] or [np.zeros(0)]
+        ).astype(np.int8)
+        arrays[split + ".action_success"] = np.concatenate(
+            [episodes[ep_id]["action_success"] for ep_id in ep_ids] or [np.zeros(0)]
+        ).astype(bool)
+        # -1 marks episodes without a success value (test split)
+        arrays[split + ".success"] = np.array(
+            [int(episodes[ep_id].get("success", -1)) for ep_id in ep_ids], dtype=np.int8
+        )
+        # reason the episode could not be evaluated, empty if it was
+        arrays[split + ".failed"] = np.array([episodes[ep_id].get("failed", "") for ep_id in ep_ids], dtype=str)
+        # reason the episode was ended early (runner.py --termination), empty if it was not
+        arrays[split + ".truncated"] = np.array([episodes[ep_id].get("truncated", "") for ep_id in ep_ids], dtype=str)
+        arrays[split + ".summary"] = np.array(json.dumps(
+            {key: value for key, value in split_metrics.items() if key != "episodes"}
+        ))
+
+    np.savez_compressed(path, **arrays)
+
+
+def read_npz(path):
+    challenge_metrics = {}
+    with np.load(path) as arrays:
+        splits = sorted({key.rsplit(".", 1)[0] for key in arrays.files})
+        for split in splits:
+            trajectory_offsets = arrays[split + ".trajectory_offsets"]
+            action_offsets = arrays[split + ".action_offsets"]
+            trajectory = arrays[split + ".trajectory"]
+            actions = arrays[split + ".actions"]
+            action_success = arrays[split + ".action_success"]
+            success = arrays[split + ".success"]
+            failed = arrays[split + ".failed"]
+            truncated = arrays[split + ".truncated"]
+
+            episodes = {}
+            for i, ep_id in enumerate(arrays[split + ".episode_ids"]):
+                episode_metrics = {
+                    "trajectory": trajectory[trajectory_offsets[i]:trajectory_offsets[i + 1]],
+                    "actions": actions[action_offsets[i]:action_offsets[i + 1]],
+                    "action_success": action_success[action_offsets[i]:action_offsets[i + 1]]
+                }
+                if success[i] >= 0:
+                    episode_metrics["success"] = bool(success[i])
+                if failed[i]:
+                    episode_metrics["failed"] = str(failed[i])
+                if truncated[i]:
+                    episode_metrics["truncated"] = str(truncated[i])
+                episodes[str(ep_id)] = episode_metrics
+
+            challenge_metrics[split] = json.loads(str(arrays[split + ".summary"]))
+            challenge_metrics[split]["episodes"] = episodes
+    return challenge_metrics
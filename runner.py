@@ -1,5 +1,15 @@
+from robothor_challenge.backends import BACKENDS
+from robothor_challenge.broker import BrokerClient, EpisodeBroker, generate_authkey, is_loopback, parse_address
 from robothor_challenge.challenge import RobothorChallenge
+from robothor_challenge.daemon import EvaluationDaemon, submit_job
+from robothor_challenge.dataset import EpisodeDataset
+from robothor_challenge.journal import EpisodeJournal
+from robothor_challenge.logging_utils import PACKAGE_LOGGER, set_log_format
+from robothor_challenge.replay import load_metrics, replay_actions, verify_replay
+from robothor_challenge.sampling import evaluate_sample
+from robothor_challenge.trajectory import metrics_to_json, write_npz
 import os
+import socket
 import argparse
 import importlib
 import gzip
@@ -7,6 +17,10 @@ import json
 import logging
 logging.getLogger().setLevel(logging.INFO)
 
+# A child of the package logger, so that messages go through the package's handler and format;
+# logging on the root logger would make it install a second handler
+logger = logging.getLogger(PACKAGE_LOGGER + ".runner")
+
 
 def main():
     parser = argparse.ArgumentParser(description="Inference script for RoboThor ObjectNav challenge.")
@@ -30,7 +44,7 @@ def main():
     parser.add_argument(
         "--output", "-o",
         default="metrics.json.gz",
-        help="Filepath to output results to.",
+        help="Filepath to output results to (columnar arrays instead of JSON if it ends with .npz).",
     )
 
     parser.add_argument(
@@ -52,58 +66,336 @@ def main():
     parser.add_argument(
         "--nprocesses", "-n",
         default=1,
+        type=nprocesses_arg,
+        help="Number of parallel processes used to compute inference, or 'auto' to add workers while that raises the throughput (see the autoscale section of the config).",
+    )
+    parser.add_argument(
+        "--episodes-in-flight", "-k",
+        default=1,
+        type=int,
+        help="Episodes every process runs at once, each on a controller of its own, so that the agent acts for one while the simulator steps the others.",
+    )
+
+    parser.add_argument(
+        "--journal",
+        default=None,
+        help="Filepath of the journal finished episodes are appended to (default: <output>.journal).",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Skip episodes that are already in the journal of a previous run.",
+    )
+    parser.add_argument(
+        "--result-cache",
+        action="store_true",
+        help="Take the metrics of episodes evaluated before with the same agent and configuration from a cache (for deterministic agents only).",
+    )
+
+    parser.add_argument(
+        "--backend",
+        default="ai2thor",
+        choices=BACKENDS,
+        help="Simulator to evaluate in: ai2thor, or a deterministic mock built from the dataset (for testing and benchmarking the harness without a GPU).",
+    )
+
+    parser.add_argument(
+        "--agent-server",
+        action="store_true",
+        help="Run the agent in a single process that batches observations from all workers.",
+    )
+
+    parser.add_argument(
+        "--log-format",
+        default="text",
+        choices=["text", "json"],
+        help="Write log messages as text or as JSON lines.",
+    )
+    parser.add_argument(
+        "--log-steps",
+        default=0,
+        type=int,
+        help="Log every n-th agent action (0: only log a summary of the actions at the end of each episode).",
+    )
+
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Run every worker under cProfile and write the stats to <output>.profile/.",
+    )
+
+    parser.add_argument(
+        "--sample",
+        default=None,
+        type=int,
+        metavar="N",
+        help="Only evaluate a deterministic sample of N episodes of each split, stratified by scene, object type and shortest path length (not allowed with --test or --submission).",
+    )
+    parser.add_argument(
+        "--ci-width",
+        default=None,
+        type=float,
+        help="With --sample, grow the sample until the 95%% confidence intervals of success and SPL are at most this wide.",
+    )
+    parser.add_argument(
+        "--sample-seed",
+        default=0,
         type=int,
-        help="Number of parallel processes used to compute inference.",
+        help="Seed of the --sample selection.",
+    )
+
+    parser.add_argument(
+        "--replay",
+        default=None,
+        metavar="METRICS",
+        help="Replay the recorded actions of every episode in a metrics file (.json.gz or .npz) without the agent and check the trajectories and success against the recorded ones.",
+    )
+    parser.add_argument(
+        "--replay-render",
+        action="store_true",
+        help="Render frames while replaying (by default they are skipped, as nothing looks at them).",
+    )
+
+    parser.add_argument(
+        "--termination",
+        action="store_true",
+        help="End episodes early as configured in the termination section of the config (for sweeps; not allowed with --test or --submission).",
+    )
+
+    parser.add_argument(
+        "--reuse-scenes",
+        action="store_true",
+        help="Start episodes in the scene a worker has loaded with a teleport instead of a reset, which does not send the episode id to Unity nor restore object state (for sweeps; not allowed with --test or --submission).",
+    )
+
+    parser.add_argument(
+        "--broker",
+        default=None,
+        metavar="HOST:PORT",
+        help="Coordinate a distributed evaluation: hand out episodes to workers connecting to HOST:PORT instead of running them locally.",
+    )
+    parser.add_argument(
+        "--worker",
+        default=None,
+        metavar="HOST:PORT",
+        help="Run --nprocesses workers on episodes from the coordinator at HOST:PORT (splits and outputs are chosen by the coordinator).",
+    )
+    parser.add_argument(
+        "--daemon",
+        default=None,
+        metavar="ADDRESS",
+        help="Keep --nprocesses workers with started controllers and built agents warm, and run the evaluations submitted to ADDRESS (HOST:PORT or a unix socket path) with --submit.",
+    )
+    parser.add_argument(
+        "--submit",
+        default=None,
+        metavar="ADDRESS",
+        help="Run the selected splits with --agent on the daemon at ADDRESS (see --daemon) and write the metrics to --output.",
+    )
+    parser.add_argument(
+        "--episodes",
+        default=None,
+        help="With --submit, only evaluate the episodes whose ids match one of these comma-separated patterns (e.g. 'FloorPlan_Val1_*').",
+    )
+    parser.add_argument(
+        "--stop-daemon",
+        action="store_true",
+        help="With --submit, stop the daemon instead of submitting an evaluation.",
+    )
+    parser.add_argument(
+        "--authkey",
+        default=os.environ.get("ROBOTHOR_BROKER_AUTHKEY"),
+        help="Shared secret of the coordinator and its workers, or of the daemon and its clients (default: $ROBOTHOR_BROKER_AUTHKEY). Required with --worker and --submit; --broker and --daemon generate and print one if none is given.",
     )
 
     args = parser.parse_args()
+    set_log_format(args.log_format)
     if args.submission:
         args.debug = False
         args.train = False
         args.val = True
         args.test = True
+    if args.termination and args.test:
+        parser.error("--termination changes the evaluation and cannot be used for the test split")
+    if args.reuse_scenes and args.test:
+        parser.error("--reuse-scenes changes the evaluation and cannot be used for the test split")
+    if args.sample is not None and args.test:
+        parser.error("--sample cannot be used for the test split")
+    if args.ci_width is not None and args.sample is None:
+        parser.error("--ci-width requires --sample")
+    if args.nprocesses == "auto" and (args.broker is not None or args.worker is not None or args.daemon is not None):
+        parser.error("--nprocesses auto cannot be combined with --broker, --worker or --daemon")
+    if args.episodes_in_flight < 1:
+        parser.error("--episodes-in-flight must be at least 1")
+    if args.replay is not None and (args.broker is not None or args.worker is not None or args.termination):
+        parser.error("--replay runs locally and cannot be combined with --broker, --worker or --termination")
+    if (args.daemon is not None or args.submit is not None) and (
+        args.broker is not None or args.worker is not None or args.replay is not None or args.sample is not None
+        or args.result_cache or args.resume
+    ):
+        parser.error("--daemon and --submit cannot be combined with --broker, --worker, --replay, --sample, --result-cache or --resume")
+    if args.submit is None and (args.episodes is not None or args.stop_daemon):
+        parser.error("--episodes and --stop-daemon require --submit")
+    if args.authkey is None and (args.worker is not None or args.submit is not None):
+        parser.error("--worker and --submit require the --authkey (or $ROBOTHOR_BROKER_AUTHKEY) of the coordinator or daemon")
+    authkey = args.authkey.encode() if args.authkey is not None else None
+    for address in (args.broker, args.daemon):
+        # Whoever has the key can run code here, so an empty key is only fine for local addresses
+        if address is not None and authkey == b"" and not is_loopback(parse_address(address)):
+            parser.error("set a non-empty --authkey to listen on {address}".format(address=address))
+    if authkey is None and (args.broker is not None or args.daemon is not None):
+        authkey = generate_authkey()
+        logger.info("Generated authkey {key}: pass it to workers and clients with --authkey or $ROBOTHOR_BROKER_AUTHKEY".format(
+            key=authkey.decode()
+        ))
+
+    splits = [split for split in ("debug", "train", "val", "test") if getattr(args, split)]
+    if args.submit is not None:
+        # The daemon runs the agent, so it is not even imported here
+        if args.stop_daemon:
+            submit_job(parse_address(args.submit), {"command": "stop"}, authkey=authkey)
+            return
+        reply = submit_job(parse_address(args.submit), {
+            "agent": args.agent,
+            "splits": splits,
+            "episodes": args.episodes.split(",") if args.episodes is not None else None
+        }, authkey=authkey)
+        logger.info("Daemon finished in {elapsed:.1f}s (time to first episode: {first})".format(
+            elapsed=reply["job"]["elapsed"],
+            first="{:.2f}s".format(reply["job"]["time_to_first_episode"])
+            if reply["job"]["time_to_first_episode"] is not None else "-"
+        ))
+        write_metrics(args.output, reply["metrics"])
+        return
 
     agent = importlib.import_module(args.agent)
     agent_class, agent_kwargs, render_depth = agent.build()
 
-    r = RobothorChallenge(args.cfg, agent_class, agent_kwargs, render_depth=render_depth)
+    r = RobothorChallenge(
+        args.cfg,
+        agent_class,
+        agent_kwargs,
+        render_depth=render_depth,
+        agent_server=args.agent_server,
+        log_steps=args.log_steps,
+        profile_dir=args.output + ".profile" if args.profile else None,
+        backend=args.backend,
+        start_x=args.broker is None,
+        termination=args.termination,
+        replay_render=args.replay_render,
+        episodes_in_flight=args.episodes_in_flight,
+        reuse_scenes=args.reuse_scenes,
+        result_cache=args.result_cache
+    )
+
+    if args.daemon is not None:
+        mock_episodes = None
+        if args.backend == "mock":
+            # The mock scenes are built from the splits selected when starting the daemon
+            mock_episodes = [e for split in splits for e in EpisodeDataset(args.dataset_dir, split)]
+        daemon = EvaluationDaemon(
+            r,
+            parse_address(args.daemon),
+            args.dataset_dir,
+            args.agent,
+            authkey,
+            nprocesses=args.nprocesses,
+            mock_episodes=mock_episodes
+        )
+        daemon.serve()
+        return
+
+    if args.worker is not None:
+        client = BrokerClient(
+            parse_address(args.worker),
+            authkey,
+            args.dataset_dir,
+            node="{host}:{pid}".format(host=socket.gethostname(), pid=os.getpid())
+        )
+        r.run_remote_worker(client, nprocesses=args.nprocesses)
+        return
+
+    broker = None
+    if args.broker is not None:
+        broker = EpisodeBroker(
+            parse_address(args.broker),
+            authkey=authkey,
+            lease_timeout=r.config["supervisor"]["lease_timeout"]
+        )
+
+    journal = EpisodeJournal(args.journal or args.output + ".journal", resume=args.resume)
+
+    def evaluate(episodes, test, split):
+        if broker is not None:
+            return r.distributed_inference(episodes, broker, test=test, journal=journal, split=split)
+        return r.inference(episodes, nprocesses=args.nprocesses, test=test, journal=journal, split=split)
+
+    def evaluate_split(split, test):
+        if args.sample is not None:
+            return evaluate_sample(
+                EpisodeDataset(args.dataset_dir, split),
+                lambda episodes: evaluate(episodes, test=test, split=split),
+                args.sample,
+                ci_width=args.ci_width,
+                seed=args.sample_seed
+            )
+        episodes, dataset = r.load_split(args.dataset_dir, split)
+        return evaluate(episodes, test=test, split=split)
 
     challenge_metrics = {}
 
+    if args.replay is not None:
+        # The splits and episodes are those of the recorded metrics file
+        for split, recorded in load_metrics(args.replay).items():
+            actions = replay_actions(recorded)
+            episodes = EpisodeDataset(args.dataset_dir, split).episodes(ids=actions.keys())
+            split_metrics = r.inference(
+                episodes, nprocesses=args.nprocesses, test=split == "test", journal=journal, split=split, replay=actions
+            )
+            split_metrics["replay"] = verify_replay(recorded, split_metrics)
+            logger.info("Replayed {count} {split} episodes: {mismatched} differ from the recording {by_field}".format(
+                count=split_metrics["replay"]["episodes"],
+                split=split,
+                mismatched=split_metrics["replay"]["mismatched"],
+                by_field=split_metrics["replay"]["by_field"]
+            ))
+            challenge_metrics[split] = split_metrics
+        args.debug = args.train = args.val = args.test = False
+
     if args.debug:
-        debug_episodes, debug_dataset = r.load_split(args.dataset_dir, "debug")
-        challenge_metrics["debug"] = r.inference(
-            debug_episodes,
-            nprocesses=args.nprocesses,
-            test=False
-        )
+        challenge_metrics["debug"] = evaluate_split("debug", test=False)
 
     if args.train:
-        train_episodes, train_dataset = r.load_split(args.dataset_dir, "train")
-        challenge_metrics["train"] = r.inference(
-            train_episodes,
-            nprocesses=args.nprocesses,
-            test=False
-        )
+        challenge_metrics["train"] = evaluate_split("train", test=False)
 
     if args.val:
-        val_episodes, val_dataset = r.load_split(args.dataset_dir, "val")
-        challenge_metrics["val"] = r.inference(
-            val_episodes,
-            nprocesses=args.nprocesses,
-            test=False
-        )
+        challenge_metrics["val"] = evaluate_split("val", test=False)
 
     if args.test:
-        test_episodes, test_dataset = r.load_split(args.dataset_dir, "test")
-        challenge_metrics["test"] = r.inference(
-            test_episodes,
-            nprocesses=args.nprocesses,
-            test=True
-        )
+        challenge_metrics["test"] = evaluate_split("test", test=True)
+
+    journal.close()
+    if broker is not None:
+        broker.shutdown()
+
+    write_metrics(args.output, challenge_metrics)
+
+
+def nprocesses_arg(value):
+    if value == "auto":
+        return value
+    try:
+        return int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected a number of processes or 'auto', got {value!r}".format(value=value))
+
 
-    with gzip.open(args.output, "wt", encoding="utf-8") as zipfile:
-        json.dump(challenge_metrics, zipfile)
+def write_metrics(path, challenge_metrics):
+    if path.endswith(".npz"):
+        write_npz(path, challenge_metrics)
+    else:
+        with gzip.open(path, "wt", encoding="utf-8") as zipfile:
+            json.dump(metrics_to_json(challenge_metrics), zipfile)
 
 
 if __name__ == "__main__":
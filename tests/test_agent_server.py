@@ -0,0 +1,42 @@
+import os
+import random
+
+import pytest
+
+from agents.random_agent import SimpleRandomAgent
+from robothor_challenge.challenge import RobothorChallenge
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class SeededRandomAgent(SimpleRandomAgent):
+    # random is reseeded in every forked process, so the seed is set where the agent is built
+    def __init__(self, seed):
+        random.seed(seed)
+
+
+def evaluate(agent_server, seed, count=40):
+    r = RobothorChallenge(
+        os.path.join(ROOT, "challenge_config.yaml"), SeededRandomAgent, {"seed": seed}, backend="mock",
+        agent_server=agent_server
+    )
+    episodes, _ = r.load_split(os.path.join(ROOT, "dataset"), "val")
+    return r.inference(episodes[:count], nprocesses=1)
+
+
+def episode_metrics(metrics):
+    return {
+        ep_id: {key: value.tolist() if hasattr(value, "tolist") else value for key, value in em.items()}
+        for ep_id, em in metrics["episodes"].items()
+    }
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_agent_server_matches_local_agent(seed):
+    local = evaluate(False, seed)
+    served = evaluate(True, seed)
+    assert episode_metrics(served) == episode_metrics(local)
+    assert (served["success"], served["spl"]) == (local["success"], local["spl"])
+    # The seeds give different actions, so the comparison is not trivially true
+    assert len({len(em["actions"]) for em in local["episodes"].values()}) > 1
@@ -0,0 +1,83 @@
+import os
+import signal
+import multiprocessing as mp
+
+from robothor_challenge.agent import Agent, ALLOWED_ACTIONS
+from robothor_challenge.broker import BrokerClient, EpisodeBroker
+from robothor_challenge.challenge import RobothorChallenge
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATASET_DIR = os.path.join(ROOT, "dataset")
+AUTHKEY = b"broker-test"
+
+
+class CyclingAgent(Agent):
+    # Deterministic, with episodes of different lengths
+    def reset(self):
+        self.t = 0
+
+    def act(self, observations):
+        self.t += 1
+        if self.t >= 3 + len(observations["object_goal"]) % 4:
+            return "Stop"
+        return ALLOWED_ACTIONS[self.t % 5]
+
+
+def challenge():
+    return RobothorChallenge(os.path.join(ROOT, "challenge_config.yaml"), CyclingAgent, {}, backend="mock")
+
+
+def lease_and_die(address, leased, lost):
+    # Takes an episode and is killed while holding its lease
+    client = BrokerClient(address, AUTHKEY, DATASET_DIR, node="doomed", poll_interval=0.05)
+    job_id, split, _, _, _ = client.next_job()
+    lost.value, _ = client.for_job(job_id, split).next_episode(0)
+    leased.set()
+    os.kill(os.getpid(), signal.SIGKILL)
+
+
+def work(address, leased):
+    leased.wait(timeout=60)
+    client = BrokerClient(address, AUTHKEY, DATASET_DIR, node="survivor", poll_interval=0.05)
+    challenge().run_remote_worker(client, nprocesses=1)
+
+
+def episode_metrics(metrics):
+    return {
+        ep_id: {key: value.tolist() if hasattr(value, "tolist") else value for key, value in em.items()}
+        for ep_id, em in metrics["episodes"].items()
+    }
+
+
+def test_broker_retries_episode_of_killed_worker():
+    r = challenge()
+    episodes, _ = r.load_split(DATASET_DIR, "val")
+    # The mock scenes are built from the episodes given, so take whole scenes as remote workers do
+    episodes = [e for e in episodes if e["scene"] == episodes[0]["scene"]]
+    local = r.inference(episodes, nprocesses=1, split="val")
+
+    broker = EpisodeBroker(("127.0.0.1", 0), AUTHKEY, lease_timeout=60)
+    # The survivor only starts once the doomed worker holds the lease of an episode
+    leased = mp.Event()
+    lost = mp.Value("i", -1)
+    doomed = mp.Process(target=lease_and_die, args=(broker.address, leased, lost))
+    survivor = mp.Process(target=work, args=(broker.address, leased))
+    doomed.start()
+    survivor.start()
+    try:
+        distributed = r.distributed_inference(episodes, broker, split="val")
+    finally:
+        broker.shutdown()
+        for p in (survivor, doomed):
+            p.join(timeout=30)
+            if p.is_alive():
+                p.kill()
+
+    lost_id = episodes[lost.value]["id"]
+    assert doomed.exitcode == -signal.SIGKILL
+    assert survivor.exitcode == 0
+    assert distributed["retries"] == {lost_id: 1}
+    assert [(crash["episode"], crash["reason"]) for crash in distributed["crashes"]] == [(lost_id, "worker disconnected")]
+    assert episode_metrics(distributed) == episode_metrics(local)
+    assert (distributed["success"], distributed["spl"]) == (local["success"], local["spl"])
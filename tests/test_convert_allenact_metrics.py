@@ -0,0 +1,23 @@
+import io
+import json
+
+import pytest
+
+from robothor_challenge.scripts.convert_allenact_metrics import iter_tasks
+
+
+TASKS = [{"task_info": {"id": "ep_{i}".format(i=i), "mode": "tasks"}, "success": i % 2 == 0} for i in range(3)]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 1 << 20])
+@pytest.mark.parametrize("metrics", [
+    [{"tasks": TASKS}],
+    # String values equal to "tasks" are not the key, at the depth of the key or deeper
+    [{"mode": "tasks", "tasks": TASKS}],
+    [{"mode": "tasks", "scenes": [{"id": 1}], "tasks": TASKS}],
+    [{"labels": ["tasks", {"tasks": []}], "info": {"tasks": [1]}, "tasks": TASKS}],
+    [{"name": "a \"tasks\"", "tasks": TASKS, "after": "tasks"}],
+])
+def test_iter_tasks(metrics, chunk_size):
+    f = io.StringIO(json.dumps(metrics, indent=1))
+    assert list(iter_tasks(f, chunk_size)) == TASKS
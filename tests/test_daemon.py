@@ -0,0 +1,45 @@
+import os
+import sys
+import time
+import fnmatch
+import subprocess
+
+from robothor_challenge.daemon import submit_job
+from robothor_challenge.dataset import EpisodeDataset
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+AUTHKEY = b"daemon-smoke-test"
+PATTERN = "FloorPlan_Val1_1_AlarmClock_*"
+
+
+def test_daemon_runs_submitted_job(tmp_path):
+    address = str(tmp_path / "daemon.sock")
+    daemon = subprocess.Popen(
+        [sys.executable, "runner.py", "--daemon", address, "--val", "--backend", "mock", "-n", "2"],
+        cwd=ROOT,
+        env=dict(os.environ, ROBOTHOR_BROKER_AUTHKEY=AUTHKEY.decode()),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    try:
+        deadline = time.time() + 60
+        while not os.path.exists(address):
+            assert daemon.poll() is None, "daemon exited with code {}".format(daemon.returncode)
+            assert time.time() < deadline, "daemon did not start listening"
+            time.sleep(0.1)
+
+        reply = submit_job(address, {"agent": "agents.random_agent", "splits": ["val"], "episodes": [PATTERN]}, AUTHKEY)
+        submit_job(address, {"command": "stop"}, AUTHKEY)
+        assert daemon.wait(timeout=60) == 0
+    finally:
+        if daemon.poll() is None:
+            daemon.kill()
+            daemon.wait()
+
+    expected = [e["id"] for e in EpisodeDataset(os.path.join(ROOT, "dataset"), "val") if fnmatch.fnmatch(e["id"], PATTERN)]
+    metrics = reply["metrics"]["val"]
+    assert expected
+    assert sorted(metrics["episodes"]) == sorted(expected)
+    assert all("failed" not in em for em in metrics["episodes"].values())
+    assert 0 <= metrics["spl"] <= metrics["success"] <= 1
@@ -0,0 +1,45 @@
+import gzip
+import json
+import os
+
+from robothor_challenge.challenge import RobothorChallenge
+from robothor_challenge.dataset import episode_column
+
+
+def episode(scene, object_type, i):
+    return {
+        "id": "{scene}_{object_type}_{i}".format(scene=scene, object_type=object_type, i=i),
+        "scene": scene,
+        "object_type": object_type,
+        "initial_position": {"x": 0.25 * i, "y": 0.9, "z": 0.0},
+        "initial_orientation": 90,
+        "initial_horizon": 30,
+        "shortest_path": [{"x": 0.25 * i, "y": 0.9, "z": 0.0}, {"x": 0.25 * i, "y": 0.9, "z": 1.0}],
+        "shortest_path_length": 1.0
+    }
+
+
+def write_split(dataset_dir, split, files):
+    os.makedirs(os.path.join(dataset_dir, split, "episodes"))
+    for name, episodes in files.items():
+        with gzip.GzipFile(os.path.join(dataset_dir, split, "episodes", name), "w") as f:
+            f.write(json.dumps(episodes).encode("utf-8"))
+
+
+def test_load_split_returns_last_scene_group(tmp_path):
+    # Every file ends with a non-empty group, which the old loader dropped
+    files = {
+        "a.json.gz": [episode("FloorPlan_Val1_1", "Apple", i) for i in range(3)] + [episode("FloorPlan_Val1_2", "Mug", 0)],
+        "b.json.gz": [episode("FloorPlan_Val2_1", "Apple", 0)] + [episode("FloorPlan_Val2_1", "Vase", i) for i in range(2)]
+    }
+    write_split(str(tmp_path), "val", files)
+    expected = [e["id"] for episodes in files.values() for e in episodes]
+
+    episodes, dataset = RobothorChallenge.load_split(str(tmp_path), "val")
+
+    assert episode_column(episodes, "id") == expected
+    assert [e["id"] for e in episodes] == expected
+    assert [e["id"] for e in episodes[1:]] == expected[1:]
+    assert None not in dataset.keys()
+    assert [e["id"] for e in dataset["FloorPlan_Val2_1"]["Vase"]] == expected[-2:]
+    assert sorted(e["id"] for scene in dataset.keys() for group in dataset[scene].values() for e in group) == sorted(expected)